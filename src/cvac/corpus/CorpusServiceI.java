@@ -11,6 +11,10 @@ import cvac._CorpusServiceDisp;
 import java.io.File;
 import java.util.HashMap;
 import java.util.Map;
+import java.util.UUID;
+import java.util.concurrent.ConcurrentHashMap;
+import java.util.concurrent.ConcurrentMap;
+import java.util.concurrent.atomic.AtomicInteger;
 import java.util.logging.Level;
 import java.util.logging.Logger;
 
@@ -26,6 +30,10 @@ public class CorpusServiceI extends _CorpusServiceDisp implements IceBox.Service
     private String dataDir = "";
     private CorpusConfig cc = null;
     private Map<String, CorpusI> corpToImp = null;
+    // read and bumped from concurrent dispatch threads
+    private ConcurrentMap<String, AtomicInteger> dataSetVersions = null;
+    // distinguishes data set versions of this server instance from earlier ones
+    private final String instanceId = UUID.randomUUID().toString();
 
     /** Perform the initialization steps common to being started within or
      * outside an IceBox.  mAdapter must have been set prior to calling this.
@@ -42,6 +50,7 @@ public class CorpusServiceI extends _CorpusServiceDisp implements IceBox.Service
         CorpusI.rootDataDir = dataDir;
         cc = new CorpusConfig();
         corpToImp = new HashMap<String, CorpusI>();
+        dataSetVersions = new ConcurrentHashMap<String, AtomicInteger>();
         logger.log(Level.INFO, "CorpusService initialized" );
     }
     
@@ -195,6 +204,7 @@ public class CorpusServiceI extends _CorpusServiceDisp implements IceBox.Service
         CorpusCallbackPrx client = CorpusCallbackPrxHelper.uncheckedCast(base);
         //client.corpusMirrorCompleted( );
         cs.createLocalMirror( null );
+        dataSetChanged( cs );
     }
 
     /**
@@ -240,6 +250,37 @@ public class CorpusServiceI extends _CorpusServiceDisp implements IceBox.Service
             logger.log(Level.WARNING, "corpus {0} is immutabel or still loading, cannot add labels", cs.name);
         }
 //        cs.addSample( addme );
+        dataSetChanged( cs );
+    }
+
+    /**
+     * Returns a marker that changes whenever the data set of this
+     * Corpus might have changed.
+     * @param __current The Current object for the invocation.
+     **/
+    @Override
+    public String getDataSetVersion(Corpus corp, Ice.Current __current)
+    {
+        CorpusI cs = checkValidityAndLookup( corp );
+        if (null==cs)
+        {
+            return "";
+        }
+        AtomicInteger counter = dataSetVersions.get( cs.name );
+        int version = null==counter ? 0 : counter.get();
+        boolean mirrored = cs.isImmutableMirror && cs.localMirrorExists();
+        return instanceId + ":" + version + ":" + mirrored;
+    }
+
+    private void dataSetChanged( CorpusI cs )
+    {
+        AtomicInteger counter = new AtomicInteger( 0 );
+        AtomicInteger existing = dataSetVersions.putIfAbsent( cs.name, counter );
+        if (null!=existing)
+        {
+            counter = existing;
+        }
+        counter.incrementAndGet();
     }
 
     /**
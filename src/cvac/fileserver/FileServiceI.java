@@ -13,6 +13,7 @@ import java.io.File;
 import java.io.FileInputStream;
 import java.io.FileOutputStream;
 import java.io.IOException;
+import java.io.RandomAccessFile;
 import java.util.Arrays;
 import java.util.HashMap;
 import java.util.HashSet;
@@ -160,6 +161,93 @@ public class FileServiceI extends FileService implements IceBox.Service {
         addOwner( endpoint, localFile );
     }
 
+    @Override
+    public void putFileChunk(FilePath file, long offset, byte[] bytes, Current __current) throws FileServiceException
+    {
+        if (null==mAdapter)
+        {
+            mAdapter = __current.adapter;
+            initialize();
+        }
+
+        // get local path and check for permissions
+        File localFile = getLocalPath( file );
+        logger.log(Level.FINE, "FileService putFileChunk: {0} at offset {1}",
+                new Object[]{localFile.getAbsolutePath(), offset});
+
+        if (null==__current.con)
+        {
+            throw new FileServiceException("FileService doesn't make sense for local clients.");
+        }
+        Endpoint endpoint = __current.con.getEndpoint();
+
+        // a chunk at offset 0 (re)starts a file, all others continue one
+        // that this client started earlier
+        if (0==offset)
+        {
+            if (localFile.exists() && !ownsFile( endpoint, localFile ))
+            {
+                throw new FileServiceException("no put permissions to this file");
+            }
+        }
+        else
+        {
+            if (!localFile.exists() || !ownsFile( endpoint, localFile ))
+            {
+                throw new FileServiceException("no put permissions to this file");
+            }
+            if (localFile.length()!=offset)
+            {
+                throw new FileServiceException("chunk offset " + offset
+                        + " does not match received size " + localFile.length());
+            }
+        }
+
+        try {
+            if (!localFile.getParentFile().exists())
+            {
+                localFile.getParentFile().mkdirs();
+                logger.log(Level.FINE, "made superdirectories for {0}",
+                           localFile.getAbsolutePath());
+            }
+            FileOutputStream fos = new FileOutputStream( localFile, 0!=offset );
+            BufferedOutputStream bos = new BufferedOutputStream( fos );
+            bos.write( bytes );
+            bos.close();
+        } catch (IOException ex) {
+            throw new FileServiceException("error putting file chunk: "
+                                           + ex.getMessage());
+        }
+
+        addOwner( endpoint, localFile );
+    }
+
+    @Override
+    public long getPutOffset(FilePath file, Current __current) throws FileServiceException
+    {
+        if (null==mAdapter)
+        {
+            mAdapter = __current.adapter;
+            initialize();
+        }
+
+        File localFile = getLocalPath( file );
+        if (!localFile.exists())
+        {
+            return 0;
+        }
+        if (null==__current.con)
+        {
+            throw new FileServiceException("FileService doesn't make sense for local clients.");
+        }
+        Endpoint endpoint = __current.con.getEndpoint();
+        if (!ownsFile( endpoint, localFile ))
+        {
+            throw new FileServiceException("no put permissions to this file");
+        }
+        return localFile.length();
+    }
+
     @Override
     public byte[] getFile(FilePath file, Current __current) throws FileServiceException 
     {
@@ -207,6 +295,48 @@ public class FileServiceI extends FileService implements IceBox.Service {
         }
     }
 
+    @Override
+    public byte[] getFileChunk(FilePath file, long offset, int length, Current __current) throws FileServiceException
+    {
+        if (null==mAdapter)
+        {
+            mAdapter = __current.adapter;
+            initialize();
+        }
+
+        // get local path and check for permissions
+        File localFile = getLocalPath( file );
+        logger.log(Level.FINE, "FileService getFileChunk: {0} at offset {1}",
+                new Object[]{localFile.getAbsolutePath(), offset});
+
+        if (!localFile.canRead())
+        {
+            throw new FileServiceException("no read permissions to this file");
+        }
+        if (offset<0 || length<0)
+        {
+            throw new FileServiceException("invalid chunk offset or length");
+        }
+        // fewer bytes at the end of the file, none past it
+        long available = Math.max( 0, localFile.length()-offset );
+        int count = (int)Math.min( (long)length, available );
+
+        try {
+            RandomAccessFile raf = new RandomAccessFile( localFile, "r" );
+            byte[] bytes = new byte[count];
+            try {
+                raf.seek( offset );
+                raf.readFully( bytes );
+            } finally {
+                raf.close();
+            }
+            return bytes;
+        } catch (IOException ex) {
+            throw new FileServiceException("error getting file chunk: "
+                                           + ex.getMessage());
+        }
+    }
+
     /**
      * Note that we don't report specifically if this file doesn't exist
      * so that clients can't query for the existence of files.
@@ -0,0 +1,458 @@
+#
+# Easy Computer Vision
+#
+# corpusmirror.py creates the local mirror of a corpus on the client
+# side: it probes the mirrors that the corpus properties list, downloads
+# the archive from the fastest one in parallel byte ranges, and extracts
+# it while the download is still running.  An interrupted download is
+# resumed from the chunks that were complete.  The mirror ends up where
+# the CorpusService expects it, in dataDir/<corpus name>, with the
+# status file in .meta that marks it as complete.
+#
+from __future__ import print_function
+import os
+import re
+import json
+import time
+import tarfile
+import threading
+try:
+    import urllib2 as urlrequest
+    from urlparse import urlparse
+except ImportError:
+    import urllib.request as urlrequest
+    from urllib.parse import urlparse
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+def readProperties( fsPath ):
+    '''Read a Java properties file into a dictionary; only the
+    "key = value" and "key: value" forms and comment lines are supported'''
+    props = {}
+    fin = open( fsPath )
+    try:
+        for line in fin:
+            line = line.strip()
+            if not line or line[0] in "#!":
+                continue
+            match = re.match( r"([^=:\s]+)\s*[=:\s]\s*(.*)$", line )
+            if match:
+                props[match.group(1)] = match.group(2).strip()
+    finally:
+        fin.close()
+    return props
+
+def getMirrors( props ):
+    '''A list of dictionaries with the name, location, compressType and
+    archiveType of each mirror that the corpus properties list'''
+    names = [name.strip() for name in props.get( 'mirrors', "" ).split( "," )]
+    mirrors = []
+    for name in names:
+        location = props.get( name+"_location" )
+        if not name or not location:
+            continue
+        mirrors.append( {'name':name, 'location':location,
+                         'compressType':props.get( name+"_compressType", "" ).lower(),
+                         'archiveType':props.get( name+"_archiveType", "tar" ).lower()} )
+    if not mirrors:
+        raise RuntimeError("no mirrors listed in corpus properties")
+    return mirrors
+
+def getLocalFile( location ):
+    '''The local file of a file:// URL or plain path, or None for
+    other URLs'''
+    parsed = urlparse( location )
+    if parsed.scheme=="file":
+        return urlrequest.url2pathname( parsed.path )
+    if not parsed.scheme or len( parsed.scheme )==1:
+        # no scheme, or a Windows drive letter
+        return location
+    return None
+
+class LimitedReader(object):
+    '''Reads at most length bytes from a file object'''
+
+    def __init__( self, fobj, length ):
+        self.fobj = fobj
+        self.left = length
+
+    def read( self, size=-1 ):
+        if size<0 or size>self.left:
+            size = self.left
+        data = self.fobj.read( size )
+        self.left -= len( data )
+        return data
+
+    def close( self ):
+        self.fobj.close()
+
+def openRange( location, start=0, end=None, timeout=30 ):
+    '''Open the bytes start..end (inclusive) of a location for reading;
+    end=None reads to the end.  Returns (file object, total size or
+    None, whether the range was honored)'''
+    localFile = getLocalFile( location )
+    if localFile:
+        fin = open( localFile, 'rb' )
+        size = os.path.getsize( localFile )
+        fin.seek( start )
+        if end is None:
+            end = size-1
+        return (LimitedReader( fin, max( 0, end-start+1 ) ), size, True)
+    request = urlrequest.Request( location )
+    if start>0 or end is not None:
+        request.add_header( "Range", "bytes={0}-{1}".format( start, end is not None and end or "" ) )
+    response = urlrequest.urlopen( request, timeout=timeout )
+    contentRange = response.info().get( "Content-Range" )
+    if response.getcode()==206 and contentRange:
+        size = int( contentRange.split( "/" )[-1] )
+        return (response, size, True)
+    length = response.info().get( "Content-Length" )
+    size = length and int( length ) or None
+    if start>0:
+        response.close()
+        raise RuntimeError("server does not support byte ranges:", location)
+    return (response, size, False)
+
+def probeMirror( mirror, probeBytes=64*1024, timeout=10 ):
+    '''Time the download of the first probeBytes of a mirror's archive.
+    Returns a dictionary with the 'mirror', the 'seconds' it took, the
+    archive 'size' and whether the mirror supports byte 'ranges'.'''
+    start = time.time()
+    fin, size, ranges = openRange( mirror['location'], 0, probeBytes-1, timeout )
+    try:
+        fin.read( probeBytes )
+    finally:
+        fin.close()
+    return {'mirror':mirror, 'seconds':time.time()-start, 'size':size, 'ranges':ranges}
+
+def selectMirror( mirrors, probeBytes=64*1024, timeout=10 ):
+    '''Probe all mirrors concurrently and return the probe of the
+    fastest one that answered'''
+    probes = []
+    errors = []
+    lock = threading.Lock()
+    def probe( mirror ):
+        try:
+            result = probeMirror( mirror, probeBytes, timeout )
+            lock.acquire()
+            probes.append( result )
+            lock.release()
+        except Exception as ex:
+            lock.acquire()
+            errors.append( (mirror['name'], ex) )
+            lock.release()
+    threads = [threading.Thread( target=probe, args=(mirror,) ) for mirror in mirrors]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if not probes:
+        raise RuntimeError("no mirror could be reached:", errors)
+    return min( probes, key=lambda result: result['seconds'] )
+
+class ArchiveDownload(object):
+    '''Downloads an archive of known size in chunks of chunkSize bytes
+    into archiveFile+".part", with up to window chunks in flight, and
+    renames it to archiveFile when done.  The chunks that are complete
+    are recorded in archiveFile+".state", so that a later download of
+    the same archive continues where an interrupted one stopped.
+    Chunks are requested in order, and read() returns the bytes from
+    the start of the archive as soon as they are complete, so that the
+    archive can be extracted while it downloads.'''
+
+    def __init__( self, location, size, archiveFile, chunkSize=4*1024**2,
+                  ranges=True, timeout=30, tracker=None ):
+        self.location = location
+        self.size = size
+        self.archiveFile = archiveFile
+        self.partFile = archiveFile+".part"
+        self.stateFile = archiveFile+".state"
+        self.chunkSize = chunkSize
+        self.ranges = ranges and size is not None
+        self.timeout = timeout
+        self.tracker = tracker
+        self.condition = threading.Condition()
+        self.done = set()
+        # bytes from the start of the archive that are complete
+        self.available = 0
+        self.error = None
+        self.finished = False
+        self.readPos = 0
+        self.reader = None
+        self.loadState()
+
+    def getNumChunks( self ):
+        return max( 1, (self.size+self.chunkSize-1)//self.chunkSize )
+
+    def loadState( self ):
+        if not self.ranges or not os.path.exists( self.partFile ) \
+                or not os.path.exists( self.stateFile ):
+            return
+        fin = open( self.stateFile )
+        try:
+            state = json.load( fin )
+        except ValueError:
+            return
+        finally:
+            fin.close()
+        if state.get('size')==self.size and state.get('chunkSize')==self.chunkSize \
+                and os.path.getsize( self.partFile )==self.size:
+            self.done = set( state['done'] )
+            self.advance()
+
+    def saveState( self ):
+        tmpname = self.stateFile+".tmp"
+        fout = open( tmpname, 'w' )
+        try:
+            json.dump( {'location':self.location, 'size':self.size,
+                        'chunkSize':self.chunkSize, 'done':sorted( self.done )}, fout )
+        finally:
+            fout.close()
+        if os.path.exists( self.stateFile ):
+            os.remove( self.stateFile )
+        os.rename( tmpname, self.stateFile )
+
+    def getChunkRange( self, idx ):
+        start = idx*self.chunkSize
+        return (start, min( start+self.chunkSize, self.size )-1)
+
+    def advance( self ):
+        '''Move the available bytes past all contiguous complete chunks'''
+        idx = self.available//self.chunkSize
+        while idx in self.done:
+            idx += 1
+        self.available = min( idx*self.chunkSize, self.size )
+
+    def fetchChunk( self, idx ):
+        start, end = self.getChunkRange( idx )
+        fin, size, ranges = openRange( self.location, start, end, self.timeout )
+        fout = open( self.partFile, 'r+b' )
+        try:
+            fout.seek( start )
+            remaining = end-start+1
+            while remaining>0:
+                data = fin.read( min( remaining, 256*1024 ) )
+                if not data:
+                    raise RuntimeError("download ended early:", self.location)
+                fout.write( data )
+                remaining -= len( data )
+                if self.tracker:
+                    self.tracker.addBytes( len( data ) )
+        finally:
+            fout.close()
+            fin.close()
+        self.condition.acquire()
+        try:
+            self.done.add( idx )
+            self.saveState()
+            self.advance()
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def fetchStream( self ):
+        '''Download the whole archive in one request, for servers that
+        do not support byte ranges'''
+        fin, size, ranges = openRange( self.location, 0, None, self.timeout )
+        fout = open( self.partFile, 'wb' )
+        try:
+            while True:
+                data = fin.read( 256*1024 )
+                if not data:
+                    break
+                fout.write( data )
+                fout.flush()
+                if self.tracker:
+                    self.tracker.addBytes( len( data ) )
+                self.condition.acquire()
+                self.available += len( data )
+                self.condition.notify_all()
+                self.condition.release()
+        finally:
+            fout.close()
+            fin.close()
+        self.size = self.available
+
+    def fail( self, ex ):
+        self.condition.acquire()
+        if not self.error:
+            self.error = ex
+        self.condition.notify_all()
+        self.condition.release()
+
+    def download( self, window=4 ):
+        '''Download all missing chunks; raises the first error'''
+        try:
+            self.fetchAll( window )
+        except Exception as ex:
+            # wake up the reader
+            self.fail( ex )
+            raise
+        self.condition.acquire()
+        self.finished = True
+        self.condition.notify_all()
+        self.condition.release()
+
+    def fetchAll( self, window ):
+        if not self.ranges:
+            self.fetchStream()
+        else:
+            if not self.done:
+                # nothing to resume from
+                fout = open( self.partFile, 'wb' )
+                try:
+                    fout.truncate( self.size )
+                finally:
+                    fout.close()
+            pending = Queue.Queue()
+            for idx in range( self.getNumChunks() ):
+                if not idx in self.done:
+                    pending.put( idx )
+            def worker():
+                while self.error is None:
+                    try:
+                        idx = pending.get_nowait()
+                    except Queue.Empty:
+                        return
+                    try:
+                        self.fetchChunk( idx )
+                    except Exception as ex:
+                        self.fail( ex )
+            threads = [threading.Thread( target=worker ) for cnt in range( max( 1, window ) )]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if self.error:
+            raise self.error
+
+    def read( self, size=-1 ):
+        '''Read the archive from the start, waiting for the bytes to
+        arrive; returns b"" at the end of the archive'''
+        self.condition.acquire()
+        try:
+            while self.readPos>=self.available and self.error is None \
+                    and not self.finished:
+                self.condition.wait( 1.0 )
+            if self.error:
+                raise RuntimeError("download failed:", self.error)
+            available = self.available
+        finally:
+            self.condition.release()
+        if self.readPos>=available:
+            return b""
+        if size<0 or size>available-self.readPos:
+            size = available-self.readPos
+        if self.reader is None:
+            self.reader = open( self.partFile, 'rb' )
+        self.reader.seek( self.readPos )
+        data = self.reader.read( size )
+        self.readPos += len( data )
+        return data
+
+    def complete( self ):
+        '''Move the downloaded archive into place'''
+        if self.reader:
+            self.reader.close()
+            self.reader = None
+        if os.path.exists( self.archiveFile ):
+            os.remove( self.archiveFile )
+        os.rename( self.partFile, self.archiveFile )
+        if os.path.exists( self.stateFile ):
+            os.remove( self.stateFile )
+
+def isSafeMember( member ):
+    '''Only plain files and directories below the target are extracted'''
+    name = member.name.replace( "\\", "/" )
+    if name.startswith( "/" ) or ".." in name.split( "/" ):
+        return False
+    return member.isfile() or member.isdir()
+
+def extractArchive( fileobj, target, compressType="", archiveType="tar" ):
+    '''Extract a tar archive, gzip-compressed if compressType is "gzip",
+    that is read sequentially from fileobj into the target directory.
+    Returns the number of extracted members.'''
+    if archiveType!="tar":
+        raise RuntimeError("unsupported archive type:", archiveType)
+    if compressType in ("gzip", "gz"):
+        mode = "r|gz"
+    elif compressType in ("", "none"):
+        mode = "r|"
+    else:
+        raise RuntimeError("unsupported compression type:", compressType)
+    count = 0
+    tar = tarfile.open( fileobj=fileobj, mode=mode )
+    try:
+        for member in tar:
+            if not isSafeMember( member ):
+                continue
+            if hasattr( tarfile, 'data_filter' ):
+                tar.extract( member, target, filter='data' )
+            else:
+                tar.extract( member, target )
+            count += 1
+    finally:
+        tar.close()
+    return count
+
+def getStatusFile( target ):
+    return os.path.join( target, ".meta", "status.txt" )
+
+def mirrorCorpus( propertiesFile, dataDir="data", window=4, chunkSize=4*1024**2,
+                  keepArchive=True, probeBytes=64*1024, timeout=30, tracker=None ):
+    '''Create the local mirror of the corpus that the propertiesFile
+    describes, unless it exists already, and return its directory.
+    The archive is kept in the .meta directory of the mirror unless
+    keepArchive is False.'''
+    props = readProperties( propertiesFile )
+    name = props.get( 'name' )
+    if not name:
+        raise RuntimeError("no corpus name in", propertiesFile)
+    target = os.path.join( dataDir, name )
+    if os.path.exists( getStatusFile( target ) ):
+        return target
+    best = selectMirror( getMirrors( props ), probeBytes, timeout )
+    mirror = best['mirror']
+    metaDir = os.path.join( target, ".meta" )
+    if not os.path.exists( metaDir ):
+        os.makedirs( metaDir )
+    archiveName = os.path.basename( urlparse( mirror['location'] ).path ) or "archive"
+    download = ArchiveDownload( mirror['location'], best['size'],
+                                os.path.join( metaDir, archiveName ), chunkSize,
+                                best['ranges'], timeout, tracker )
+    if tracker:
+        tracker.setTask( 2, 1, "download", mirror['location'], 0.0 )
+
+    # extract in the background while the chunks arrive
+    extraction = {}
+    def extract():
+        try:
+            extraction['count'] = extractArchive( download, target, mirror['compressType'],
+                                                  mirror['archiveType'] )
+        except Exception as ex:
+            extraction['error'] = ex
+            download.fail( ex )
+    extractor = threading.Thread( target=extract )
+    extractor.daemon = True
+    extractor.start()
+    try:
+        download.download( window )
+    finally:
+        extractor.join()
+    if 'error' in extraction:
+        raise extraction['error']
+    download.complete()
+    if not keepArchive:
+        os.remove( download.archiveFile )
+    if tracker:
+        tracker.setTask( 2, 2, "extract", target, 1.0 )
+    fout = open( getStatusFile( target ), 'w' )
+    try:
+        fout.write( "mirrored from {0}\n".format( mirror['location'] ) )
+    finally:
+        fout.close()
+    return target
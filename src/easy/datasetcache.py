@@ -0,0 +1,180 @@
+#
+# Easy Computer Vision
+#
+# datasetcache.py keeps local copies of CorpusService data sets so that
+# large corpora need not be transferred and unmarshaled on every
+# easy.getDataSet call.
+#
+from __future__ import print_function
+import os
+import re
+import json
+import numbers
+import hashlib
+import paths
+import cvac
+
+try:
+    stringTypes = basestring
+except NameError:
+    stringTypes = str
+
+# increment if the file layout changes
+formatVersion = 3
+
+class TypeTable(object):
+    '''The classes of the instances in one cache file.  An entry is a
+    class name and its member names, in the order in which encodeValue
+    writes the members; like the Ice encoding, the file names each type
+    once instead of repeating member names in every instance.'''
+
+    def __init__( self ):
+        self.indices = {}
+        self.entries = []
+
+    def getIndex( self, cls, names ):
+        key = (cls, names)
+        index = self.indices.get( key )
+        if index is None:
+            index = self.indices[key] = len( self.entries )
+            self.entries.append( [cls.__name__, list( names )] )
+        return index
+
+def encodeValue( value, types ):
+    '''Turn an Ice struct or class instance into plain values that JSON
+    can store: an instance becomes [type index, member values...] with
+    the type and its members listed in types, a TypeTable; a sequence
+    becomes {"s": [...]} and a dictionary {"d": [[key, value], ...]},
+    so that its keys need not be strings.'''
+    if value is None or isinstance( value, (bool, int, float, stringTypes) ):
+        return value
+    if isinstance( value, (list, tuple) ):
+        return {'s':[encodeValue( item, types ) for item in value]}
+    if isinstance( value, dict ):
+        return {'d':[[encodeValue( key, types ), encodeValue( value[key], types )]
+                     for key in value]}
+    if isinstance( value, numbers.Number ):
+        return value
+    names = tuple( sorted( [name for name in vars( value ) if not name.startswith( '_' )] ) )
+    encoded = [types.getIndex( type( value ), names )]
+    for name in names:
+        encoded.append( encodeValue( getattr( value, name ), types ) )
+    return encoded
+
+def decodeTypes( entries ):
+    '''Resolve the entries of a TypeTable to (class, member names).
+    Only cvac classes are accepted; anything else raises a ValueError.'''
+    types = []
+    for name, members in entries:
+        cls = getattr( cvac, str( name ), None )
+        if not isinstance( cls, type ):
+            raise ValueError("not a cvac class:", name)
+        types.append( (cls, [str( member ) for member in members]) )
+    return types
+
+def decodeString( value, strings ):
+    # JSON gives unicode strings on Python 2, where Ice expects str
+    if not isinstance( value, str ):
+        value = value.encode('utf-8')
+    # equal strings, such as directory names, are shared
+    return strings.setdefault( value, value )
+
+def decodeValue( encoded, types, strings=None ):
+    '''Inverse of encodeValue, with types from decodeTypes'''
+    if strings is None:
+        strings = {}
+    # plain values stand for themselves, except for strings
+    plainTypes = (type( None ), bool, int, float)
+
+    def decode( value ):
+        valueType = type( value )
+        if valueType in plainTypes:
+            return value
+        if valueType is list:
+            cls, names = types[value[0]]
+            if len( value )!=len( names )+1:
+                raise ValueError("wrong number of members for", cls.__name__)
+            obj = cls.__new__( cls )
+            obj.__dict__.update( zip( names, [type( member ) in plainTypes and member
+                                              or decode( member )
+                                              for member in value[1:]] ) )
+            return obj
+        if isinstance( value, stringTypes ):
+            return decodeString( value, strings )
+        if valueType is dict:
+            if 's' in value:
+                return [decode( item ) for item in value['s']]
+            decoded = {}
+            for key, item in value['d']:
+                decoded[decode( key )] = decode( item )
+            return decoded
+        return value
+    return decode( encoded )
+
+class DataSetCache(object):
+    '''A directory of cached data sets.  Each entry is stored together
+    with the CorpusService's data set version at the time; an entry is
+    only used while the CorpusService still reports that version.'''
+
+    def __init__( self, cacheDir=None ):
+        if not cacheDir:
+            cacheDir = os.path.join( os.path.expanduser("~"), ".cvac", "datasets" )
+        self.cacheDir = cacheDir
+
+    def getPrefix( self, corpusName ):
+        return re.sub( "[^A-Za-z0-9_.-]+", "_", corpusName )+"_"
+
+    def getFilename( self, serverName, corpusName, propertiesFile ):
+        '''The cache file for a corpus as served by one CorpusService'''
+        key = "\n".join( [serverName, corpusName, propertiesFile or ""] )
+        digest = hashlib.sha1( key.encode('utf-8') ).hexdigest()
+        return os.path.join( self.cacheDir,
+                             self.getPrefix( corpusName )+digest[:16]+".dataset" )
+
+    def load( self, filename, version ):
+        '''Return the cached LabelableList, or None if there is no entry
+        or the entry is for a different version'''
+        if not os.path.exists( filename ):
+            return None
+        fin = open( filename, 'r' )
+        try:
+            # the small header line is read first so stale entries are cheap
+            header = json.loads( fin.readline() )
+            if header.get('format')!=formatVersion or header.get('version')!=version:
+                return None
+            types = decodeTypes( json.loads( fin.readline() ) )
+            return decodeValue( json.load( fin ), types )
+        except (ValueError, KeyError, TypeError, AttributeError, IndexError):
+            return None
+        finally:
+            fin.close()
+
+    def store( self, filename, version, corpusName, labelList ):
+        if not os.path.exists( self.cacheDir ):
+            os.makedirs( self.cacheDir )
+        header = {'format':formatVersion, 'version':version, 'corpus':corpusName}
+        types = TypeTable()
+        body = encodeValue( list( labelList ), types )
+        tmpname = filename+".tmp"
+        fout = open( tmpname, 'w' )
+        try:
+            fout.write( json.dumps( header )+"\n" )
+            fout.write( json.dumps( types.entries )+"\n" )
+            # dumps, unlike dump, uses the C encoder
+            fout.write( json.dumps( body, separators=(',', ':') ) )
+        finally:
+            fout.close()
+        if os.path.exists( filename ):
+            os.remove( filename )
+        os.rename( tmpname, filename )
+
+    def invalidate( self, corpusName ):
+        '''Remove all entries for the named corpus'''
+        if not os.path.exists( self.cacheDir ):
+            return
+        prefix = self.getPrefix( corpusName )
+        for fname in os.listdir( self.cacheDir ):
+            # prefix, 16 digits of the digest, and ".dataset"
+            if fname.startswith( prefix ) and len( fname )==len( prefix )+24 \
+                    and fname.endswith( ".dataset" ):
+                os.remove( os.path.join( self.cacheDir, fname ) )
@@ -7,24 +7,247 @@
 from __future__ import print_function
 import os
 import sys, traceback
+import threading
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
 # paths should setup the PYTHONPATH.  If you special requirements
 # then use the following to set it up prior to running.
 # export PYTHONPATH="/opt/Ice-3.4.2/python:./src/easy"
 import paths
 sys.path.append('''.''')
-import Ice
-import Ice
-import IcePy
-import cvac
-import unittest
-import stat
-import threading
+
+class LazyModule(object):
+    '''Stands in for a module and imports it when one of its
+    attributes is first used'''
+    def __init__( self, name ):
+        self.__dict__['moduleName'] = name
+        self.__dict__['module'] = None
+    def __getattr__( self, attr ):
+        if self.module is None:
+            __import__( self.moduleName )
+            self.__dict__['module'] = sys.modules[self.moduleName]
+        return getattr( self.module, attr )
+
+# Ice and cvac take long to load, so importing easy only prepares them;
+# other modules that only some functions use are imported in those
+# functions
+Ice = LazyModule( "Ice" )
+IcePy = LazyModule( "IcePy" )
+cvac = LazyModule( "cvac" )
 
 #
-# one-time initialization code, upon loading the module
+# the communicator is created upon first use, or explicitly by init()
 #
-ic = Ice.initialize(sys.argv)
+ic = None
+communicatorLock = threading.Lock()
 defaultCS = None
+callbackAdapter = None
+callbackAdapterLock = threading.Lock()
+# an instrumentation.Instrumentation while enabled
+instrumentation = None
+# progress.ProgressListeners that follow every operation
+progressListeners = []
+# Ice properties that easy sets unless the caller does.  Callbacks
+# arrive over the outgoing (bidirectional) connections, so the client
+# thread pool dispatches them along with the replies to every call easy
+# makes.  A callback that blocks, as DetectorResultStream.foundNewResults
+# does while its consumer falls behind, must leave threads for those
+# replies; serializing keeps the callbacks of one connection in order.
+defaultProperties = {'Ice.ThreadPool.Client.Size':'2',
+                     'Ice.ThreadPool.Client.SizeMax':'16',
+                     'Ice.ThreadPool.Client.Serialize':'1'}
+
+def createCommunicator( args, properties=None ):
+    '''Initialize a communicator from the command-line arguments and the
+    properties dictionary, with the defaultProperties for whatever
+    neither of them (nor an Ice.Config file) sets'''
+    initData = Ice.InitializationData()
+    initData.properties = Ice.createProperties( args )
+    for key in defaultProperties:
+        if not initData.properties.getProperty( key ):
+            initData.properties.setProperty( key, defaultProperties[key] )
+    if properties:
+        for key in properties:
+            initData.properties.setProperty( key, str( properties[key] ) )
+    return Ice.initialize( args, initData )
+
+def init( args=None, properties=None ):
+    '''Create the Ice communicator that all easy functions use, from
+    command-line style arguments (sys.argv by default) and a dictionary
+    of Ice properties such as {'Ice.MessageSizeMax':'65536'}.
+    This is optional, but has to happen before any other easy call
+    that talks to a service.  Returns the communicator.'''
+    global ic
+    if args is None:
+        args = sys.argv
+    communicatorLock.acquire()
+    try:
+        if ic:
+            raise RuntimeError("easy is already initialized; call init before "
+                               "connecting to any service")
+        ic = createCommunicator( args, properties )
+    finally:
+        communicatorLock.release()
+    return ic
+
+def getCommunicator():
+    '''Return the Ice communicator, creating it with default settings
+    upon first use'''
+    global ic
+    if not ic:
+        communicatorLock.acquire()
+        try:
+            if not ic:
+                ic = createCommunicator( sys.argv )
+        finally:
+            communicatorLock.release()
+    return ic
+
+def destroy():
+    '''Destroy the communicator and everything that was created with it.
+    A later easy call starts over with a new communicator.'''
+    global ic, defaultCS, callbackAdapter
+    communicatorLock.acquire()
+    try:
+        if ic:
+            ic.destroy()
+        ic = None
+        defaultCS = None
+        callbackAdapter = None
+    finally:
+        communicatorLock.release()
+
+def enableInstrumentation( instr=None ):
+    '''Start recording counts, estimated bytes and latencies of the
+    remote calls that easy makes, and the arrival times of callbacks.
+    Returns the instrumentation.Instrumentation object that collects
+    them; call its dump() method for JSON.'''
+    global instrumentation
+    if instr is None:
+        import instrumentation as instrumentationModule
+        instr = instrumentationModule.Instrumentation()
+    instrumentation = instr
+    return instr
+
+def disableInstrumentation():
+    '''Stop recording; returns the Instrumentation that was in use'''
+    global instrumentation
+    instr = instrumentation
+    instrumentation = None
+    return instr
+
+def instrumented( proxy ):
+    '''Return the proxy, wrapped so that its calls are recorded if
+    instrumentation is enabled'''
+    if instrumentation is None or proxy is None:
+        return proxy
+    return instrumentation.wrap( proxy )
+
+def checkedCast( proxyClass, base ):
+    '''proxyClass.checkedCast, recorded if instrumentation is enabled'''
+    instr = instrumentation
+    if instr is None:
+        return proxyClass.checkedCast( base )
+    prx = instr.timeCall( base.ice_toString(), "checkedCast",
+                          proxyClass.checkedCast, base )
+    return instrumented( prx )
+
+def noteCallback( operation ):
+    '''Record the arrival of a callback if instrumentation is enabled'''
+    if instrumentation is not None:
+        instrumentation.recordCallback( operation )
+
+def addProgressListener( listener ):
+    '''Have the progress.ProgressListener follow all train, detect,
+    mirror and file transfer operations from now on'''
+    progressListeners.append( listener )
+
+def removeProgressListener( listener ):
+    progressListeners.remove( listener )
+
+def newProgressTracker( operation, name="", total=None ):
+    '''A progress.ProgressTracker that reports to the progress listeners'''
+    import progress
+    return progress.ProgressTracker( operation, name, total, progressListeners )
+
+def finishProgress( callbackRecv, error=None ):
+    '''Mark the operation of a callback receiver as finished, if it
+    tracks progress'''
+    tracker = getattr( callbackRecv, 'progress', None )
+    if tracker:
+        tracker.finish( error )
+
+class LazyServant(object):
+    '''Placeholder base of the callback receivers below, so that
+    defining them does not import cvac.  When the first receiver of a
+    class is created, the cvac interface named in its iceBase is put in
+    the bases of the class that declared it, just before LazyServant.
+    From then on the receivers are plain instances of their declared
+    class, and issubclass( DetectorCallbackReceiverI,
+    cvac.DetectorCallbackHandler ) holds; before that, it does not.
+    LazyServant stays last in the bases because the class keeps using
+    its __new__, which accepts the constructor arguments.'''
+    iceBase = None
+    def __new__( cls, *args, **kwargs ):
+        for klass in cls.__mro__:
+            if LazyServant in klass.__bases__:
+                iceBase = getattr( cvac, klass.iceBase )
+                if not iceBase in klass.__bases__:
+                    klass.__bases__ = tuple( [base is LazyServant and iceBase or base
+                                              for base in klass.__bases__]
+                                             +[LazyServant] )
+        return object.__new__( cls )
+
+class CallbackProgressI(object):
+    '''The CallbackHandler methods that all services may call, reported
+    to the receiver's progress tracker'''
+    progress = None
+    def estimatedTotalRuntime(self, seconds, current=None):
+        noteCallback( "estimatedTotalRuntime" )
+        self.progress.setEstimatedTotal( seconds )
+    def estimatedRuntimeLeft(self, seconds, current=None):
+        noteCallback( "estimatedRuntimeLeft" )
+        self.progress.setEstimatedLeft( seconds )
+    def message(self, level, messageString, current=None):
+        noteCallback( "message" )
+        self.progress.addMessage( level, messageString )
+
+def getCallbackAdapter():
+    '''Return the one object adapter that receives the callbacks of all
+    services, creating and activating it upon first use.'''
+    global callbackAdapter
+    callbackAdapterLock.acquire()
+    try:
+        if not callbackAdapter:
+            callbackAdapter = getCommunicator().createObjectAdapter("")
+            callbackAdapter.activate()
+    finally:
+        callbackAdapterLock.release()
+    return callbackAdapter
+
+def addCallback( service, callbackRecv ):
+    '''Register the callback receiver with the shared callback adapter
+    under a new identity and let the service call back over its
+    existing connection (bidirectional connection).
+    Returns the identity; pass it to removeCallback when done.'''
+    adapter = getCallbackAdapter()
+    cbID = Ice.Identity()
+    cbID.name = Ice.generateUUID()
+    cbID.category = ""
+    adapter.add( callbackRecv, cbID )
+    conn = service.ice_getConnection()
+    if conn.getAdapter()!=adapter:
+        conn.setAdapter( adapter )
+    return cbID
+
+def removeCallback( cbID ):
+    '''Unregister a callback receiver that addCallback registered'''
+    try:
+        getCallbackAdapter().remove( cbID )
+    except Ice.NotRegisteredException:
+        pass
 
 
 def getFSPath( cvacPath ):
@@ -45,7 +268,7 @@ def getCvacPath( fsPath ):
 def isLikelyVideo( cvacPath ):
     videoExtensions = ['avi', 'mpg', 'wmv']
     for ext in videoExtensions:
-        if cvacPath.filename.endswith(ext):
+        if cvacPath.filename.lower().endswith(ext):
             return True
     return False
 
@@ -63,10 +286,10 @@ def getLabelable( cvacPath, labelText=None ):
 
 def getCorpusServer( configstr ):
     '''Connect to a Corpus server based on the given configuration string'''
-    cs_base = ic.stringToProxy( configstr )
+    cs_base = getCommunicator().stringToProxy( configstr )
     if not cs_base:
         raise RuntimeError("CorpusServer not found in config:", configstr)
-    cs = cvac.CorpusServicePrx.checkedCast(cs_base)
+    cs = checkedCast( cvac.CorpusServicePrx, cs_base )
     if not cs:
         raise RuntimeError("Invalid CorpusServer proxy")
     return cs
@@ -85,6 +308,7 @@ def openCorpus( corpusServer, corpusPath ):
     # note that the corpus could be on a remote server, therefore
     # we can't check for existence and type of corpusPath (dir, file)
     # but instead have to guess from the file extension, if any
+    corpusServer = instrumented( corpusServer )
     likelyDir = False
     dotidx = corpusPath.rfind(".")  # find last .
     if dotidx is -1:
@@ -110,33 +334,89 @@ def openCorpus( corpusServer, corpusPath ):
                                + getFSPath( cvacPath ))
     return corpus
 
-class CorpusCallbackI(cvac.CorpusCallback):
+class CorpusCallbackI(LazyServant):
+    iceBase = "CorpusCallback"
     corpus = None
-    def corpusMirrorProgress( corp, numtasks, currtask, taskname, details,
-            percentCompleted ):
-        print("Downloading corpus {0}, task {1}/{2}: {3} ({4}%)".\
-              format( corp.name, currtask, numtasks, taskname ))
-    def corpusMirrorCompleted(self, corp):
+    def __init__(self, name=""):
+        self.progress = newProgressTracker( "mirror", name )
+    def corpusMirrorProgress(self, corp, numtasks, currtask, taskname, details,
+            percentCompleted, current=None):
+        noteCallback( "corpusMirrorProgress" )
+        print("Downloading corpus {0}, task {1}/{2}: {3} ({4:.0f}%)".\
+              format( corp.name, currtask, numtasks, taskname, 100*percentCompleted ))
+        self.progress.setTask( numtasks, currtask, taskname, details, percentCompleted )
+    def corpusMirrorCompleted(self, corp, current=None):
+        noteCallback( "corpusMirrorCompleted" )
         self.corpus = corp
 
-def createLocalMirror( corpusServer, corpus ):
+def createLocalMirror( corpusServer, corpus, cache=None ):
     '''Call the corpusServer to create the local mirror for the
-    specified corpus.  Provide a simple callback for tracking.'''
+    specified corpus.  Provide a simple callback for tracking.
+    Cached copies of the corpus' data set are discarded, if a
+    DataSetCache is given.'''
+    corpusServer = instrumented( corpusServer )
     # ICE functionality to enable bidirectional connection for callback
-    adapter = ic.createObjectAdapter("")
-    cbID = Ice.Identity()
-    cbID.name = Ice.generateUUID()
-    cbID.category = ""
-    callbackRecv = CorpusCallbackI()
-    adapter.add( callbackRecv, cbID)
-    adapter.activate()
-    corpusServer.ice_getConnection().setAdapter(adapter)
-    # this call should block
-    corpusServer.createLocalMirror( corpus, cbID )
+    callbackRecv = CorpusCallbackI( corpus.name )
+    cbID = addCallback( corpusServer, callbackRecv )
+    error = None
+    try:
+        # this call should block
+        corpusServer.createLocalMirror( corpus, cbID )
+    except Exception as ex:
+        error = ex
+        raise
+    finally:
+        removeCallback( cbID )
+        finishProgress( callbackRecv, error )
+        if cache:
+            cache.invalidate( corpus.name )
     if not callbackRecv.corpus:
         raise RuntimeError("could not create local mirror")
 
-def getDataSet( corpus, corpusServer=None, createMirror=False ):
+def mirrorCorpus( propertiesFile, dataDir="data", window=4, cache=None, **options ):
+    '''Create the local mirror of a corpus on the client side instead of
+    through the CorpusService: the archive is downloaded from the
+    fastest of the mirrors listed in the propertiesFile, in parallel
+    byte ranges, and extracted while it downloads.  An interrupted
+    mirror is resumed.  See corpusmirror.mirrorCorpus for the options.
+    Cached copies of the corpus' data set are discarded, if a
+    DataSetCache is given.  Returns the directory of the mirror.'''
+    import corpusmirror
+    tracker = newProgressTracker( "mirror", propertiesFile )
+    error = None
+    try:
+        target = corpusmirror.mirrorCorpus( propertiesFile, dataDir, window,
+                                            tracker=tracker, **options )
+    except Exception as ex:
+        error = ex
+        raise
+    finally:
+        tracker.finish( error )
+    if cache:
+        cache.invalidate( os.path.basename( target ) )
+    return target
+
+def addLabelable( corpusServer, corpus, labelables, cache=None ):
+    '''Add Labelable artifacts to a corpus.  Cached copies of the
+    corpus' data set are discarded, if a DataSetCache is given.'''
+    corpusServer = instrumented( corpusServer )
+    try:
+        corpusServer.addLabelable( corpus, labelables )
+    finally:
+        if cache:
+            cache.invalidate( corpus.name )
+
+def getDataSetVersion( corpusServer, corpus ):
+    '''Return the CorpusService's marker for the current version of the
+    corpus' data set, or an empty string if the data set must not be
+    cached, or the CorpusService cannot tell.'''
+    corpusServer = instrumented( corpusServer )
+    try:
+        return corpusServer.getDataSetVersion( corpus )
+    except Ice.OperationNotExistException:
+        return ""
+
+def getDataSet( corpus, corpusServer=None, createMirror=False, cache=None ):
     '''Obtain the set of labels from the given corpus and return it as
     a dictionary of label categories.  Also return a flat list of all labels.
     The default local corpusServer is used if not explicitly specified.
@@ -144,13 +424,18 @@ def getDataSet( corpus, corpusServer=None, createMirror=False ):
     but the argument is a string instead, an attempt is made to
     open (but not create) a Corpus object from the corpusServer.
     Note that this will fail if the corpus needs a local mirror but has not
-    been downloaded yet, unless createMirror=True.'''
+    been downloaded yet, unless createMirror=True.
+    If a datasetcache.DataSetCache is given, the labels are read from it
+    as long as the CorpusService reports an unchanged data set.'''
 
     # get the default CorpusServer if not explicitly specified
     if not corpusServer:
         corpusServer = getDefaultCorpusServer()
+    corpusServer = instrumented( corpusServer )
 
+    propertiesFile = None
     if type(corpus) is str:
+        propertiesFile = corpus
         corpus = openCorpus( corpusServer, corpus )
     elif not type(corpus) is cvac.Corpus:
         raise RuntimeError( "unexpected type for corpus:", type(corpus) )
@@ -160,12 +445,23 @@ def getDataSet( corpus, corpusServer=None, createMirror=False ):
     if corpusServer.getDataSetRequiresLocalMirror( corpus ) \
         and not corpusServer.localMirrorExists( corpus ):
         if createMirror:
-            createLocalMirror( corpusServer, corpus )
+            createLocalMirror( corpusServer, corpus, cache )
         else:
             raise RuntimeError("local mirror required, won't create automatically",
                                "(specify createMirror=True to do so)")
 
-    labelList = corpusServer.getDataSet( corpus )
+    labelList = None
+    version = None
+    if cache:
+        version = getDataSetVersion( corpusServer, corpus )
+        if version:
+            cacheFile = cache.getFilename( corpusServer.ice_toString(),
+                                           corpus.name, propertiesFile )
+            labelList = cache.load( cacheFile, version )
+    if labelList is None:
+        labelList = corpusServer.getDataSet( corpus )
+        if version and labelList:
+            cache.store( cacheFile, version, corpus.name, labelList )
     categories = {}
     for lb in labelList:
         if lb.lab.name in categories:
@@ -190,9 +486,13 @@ def createRunSet( categories ):
     Input argument can also be a string to a single file.
     Note that the positive and negative classes might not be
     determined correctly automatically.
+    The categories can also be given as a labelindex.LabelIndex.
     Return the mapping from Purpose (class ID) to label name.'''
 
     runset = None
+    if hasattr( categories, 'getCategories' ):
+        # a LabelIndex: the Labelable objects are only created now
+        categories = categories.getCategories()
     if type(categories) is dict:
         # multiple categories
         classmap = {}
@@ -257,10 +557,10 @@ def createRunSet( categories ):
 def getFileServer( configString ):
     '''Obtain a reference to a remote FileServer.
     Generally, every host of CVAC services also has one FileServer.'''
-    fileserver_base = ic.stringToProxy( configString )
+    fileserver_base = getCommunicator().stringToProxy( configString )
     if not fileserver_base:
         raise RuntimeError("no such FileService: "+configString)
-    fileserver = cvac.FileServicePrx.checkedCast( fileserver_base )
+    fileserver = checkedCast( cvac.FileServicePrx, fileserver_base )
     if not fileserver:
         raise RuntimeError("Invalid FileServer proxy")
     return fileserver
@@ -299,59 +599,377 @@ def getDefaultFileServer( detector ):
                             host, "on port 10110" )
     return fs
 
-def putFile( fileserver, filepath ):
-    origFS = getFSPath( filepath )
+# files larger than this are streamed to the FileServer in chunks
+defaultChunkSize = 4*1024*1024
+
+def _byteView( buf ):
+    '''Return a zero-copy view onto buf that can be sliced into chunks'''
+    try:
+        return memoryview( buf )
+    except TypeError:
+        # Python 2's mmap only supports the old buffer interface
+        return buffer( buf )
+
+def putFileChunks( fileserver, filepath, fobj, size, chunkSize=None,
+                   retries=3, resume=False ):
+    '''Stream the open file fobj of the given size to the FileServer in
+    chunks of at most chunkSize bytes.  The chunks are slices of a
+    memory-mapped view of the file, so memory use stays flat no matter
+    how large the file is.  If a chunk fails to arrive, the transfer
+    continues from the last offset the FileServer confirmed, giving up
+    after the specified number of retries.  With resume=True, a transfer
+    that was interrupted earlier is continued rather than restarted.'''
+    import mmap
+    if not chunkSize:
+        chunkSize = defaultChunkSize
+    fileserver = instrumented( fileserver )
+    offset = 0
+    if resume:
+        offset = fileserver.getPutOffset( filepath )
+    mm = mmap.mmap( fobj.fileno(), 0, access=mmap.ACCESS_READ )
+    view = _byteView( mm )
+    failures = 0
+    try:
+        while offset<size:
+            end = min( offset+chunkSize, size )
+            try:
+                fileserver.putFileChunk( filepath, offset, view[offset:end] )
+            except Ice.LocalException:
+                failures += 1
+                if failures>retries:
+                    raise
+                offset = fileserver.getPutOffset( filepath )
+                continue
+            offset = end
+    finally:
+        del view
+        mm.close()
+
+def putFile( fileserver, filepath, chunkSize=None, retries=3, resume=False,
+             fsPath=None ):
+    '''Copy the local file at filepath to the same location on the
+    FileServer, or the local file fsPath, if given, to filepath.
+    Files up to chunkSize bytes (default: defaultChunkSize)
+    are sent with a single call, larger ones are streamed in chunks;
+    see putFileChunks.'''
+    origFS = fsPath or getFSPath( filepath )
     if not os.path.exists( origFS ):
         raise RuntimeError("Cannot obtain FS path to local file:",origFS)
+    if not chunkSize:
+        chunkSize = defaultChunkSize
+    size = os.path.getsize( origFS )
+    fileserver = instrumented( fileserver )
     forig = open( origFS, 'rb' )
-    bytes = bytearray( forig.read() )
-    
-    # "put" the file's bytes to the FileServer
-    fileserver.putFile( filepath, bytes );
-    forig.close()
+    try:
+        if size==0 or (size<=chunkSize and not resume):
+            # "put" the file's bytes to the FileServer
+            fileserver.putFile( filepath, forig.read() )
+        else:
+            putFileChunks( fileserver, filepath, forig, size, chunkSize,
+                           retries, resume )
+    finally:
+        forig.close()
 
-def collectSubstrates( runset ):
-    '''obtain a set (a list without duplicates) of all
-    substrates that occur in this runset'''
-    substrates = set()
+try:
+    _intern = intern
+except NameError:
+    _intern = sys.intern
+
+def getSubstrateKey( sub ):
+    '''A hashable key that identifies the file of a Substrate.
+    The directory is interned, since many files share it.'''
+    relativePath = sub.path.directory.relativePath
+    try:
+        relativePath = _intern( relativePath )
+    except TypeError:
+        # Python 2 cannot intern unicode strings
+        pass
+    return (relativePath, sub.path.filename)
+
+def iterDirectory( plist, dataDir="data" ):
+    '''Generate a Substrate for each file in the directory of a
+    PurposedDirectory, below the local dataDir.  Only files ending in
+    one of the fileSuffixes are included, if there are any, and
+    subdirectories are only searched if the entry is recursive.
+    Files are generated as the directory tree is walked, one
+    directory at a time.'''
+    suffixes = tuple( [suffix.lower() for suffix in plist.fileSuffixes or []] )
+    root = plist.directory.relativePath.rstrip("/")
+    fsRoot = os.path.join( dataDir, root )
+    for dirpath, dirnames, filenames in os.walk( fsRoot ):
+        if plist.recursive:
+            # walk in a stable order
+            dirnames.sort()
+        else:
+            del dirnames[:]
+        relativePath = root+dirpath[len(fsRoot):].replace( os.sep, "/" )
+        dirPath = cvac.DirectoryPath( relativePath )
+        for filename in sorted( filenames ):
+            if suffixes and not filename.lower().endswith( suffixes ):
+                continue
+            cvacPath = cvac.FilePath( dirPath, filename )
+            isVideo = isLikelyVideo( cvacPath )
+            yield cvac.Substrate( not isVideo, isVideo, cvacPath, 0, 0 )
+
+def iterSubstrates( runset, dataDir="data" ):
+    '''Generate every substrate that occurs in this runset once, in the
+    order of first occurrence.  PurposedDirectory entries are expanded
+    from the local dataDir while the generator is consumed.'''
+    seen = set()
     for plist in runset.purposedLists:
         if type(plist) is cvac.PurposedDirectory:
-            raise RuntimeException("cannot deal with PurposedDirectory yet")
+            substrates = iterDirectory( plist, dataDir )
         elif type(plist) is cvac.PurposedLabelableSeq:
-            for lab in plist.labeledArtifacts:
-                if not lab.sub in substrates:
-                    substrates.add( lab.sub )
+            substrates = (lab.sub for lab in plist.labeledArtifacts)
         else:
-            raise RuntimeException("unexpected subclass of PurposedList")
-    return substrates
+            raise RuntimeError("unexpected subclass of PurposedList")
+        for sub in substrates:
+            key = getSubstrateKey( sub )
+            if not key in seen:
+                seen.add( key )
+                yield sub
+
+def collectSubstrates( runset ):
+    '''obtain a list without duplicates of all
+    substrates that occur in this runset; see iterSubstrates'''
+    return list( iterSubstrates( runset ) )
+
+def mapConcurrently( func, items, window=8 ):
+    '''Call func on every item, with at most window calls in flight at
+    any time.  The items can come from a generator; they are consumed
+    only as fast as the calls proceed.  Returns a list of
+    (item, result, exception) tuples in the order of the items, where
+    exception is None if the call succeeded.  An exception in one call
+    does not stop the others, but an exception raised by the items
+    generator is raised again once the calls in flight are done.'''
+    itemIter = enumerate( items )
+    outcomes = {}
+    itemErrors = []
+    lock = threading.Lock()
+    def worker():
+        while True:
+            lock.acquire()
+            try:
+                try:
+                    idx, item = next( itemIter )
+                except StopIteration:
+                    return
+                except Exception as ex:
+                    itemErrors.append( ex )
+                    return
+            finally:
+                lock.release()
+            try:
+                outcome = (item, func( item ), None)
+            except Exception as ex:
+                outcome = (item, None, ex)
+            lock.acquire()
+            outcomes[idx] = outcome
+            lock.release()
+    threads = []
+    for cnt in range( max( 1, window ) ):
+        thread = threading.Thread( target=worker )
+        thread.daemon = True
+        thread.start()
+        threads.append( thread )
+    for thread in threads:
+        thread.join()
+    if itemErrors:
+        raise itemErrors[0]
+    return [outcomes[idx] for idx in range( len( outcomes ) )]
+
+class UploadManifest(object):
+    '''A persistent, client-side record of the files that have been put
+    to one FileService, keyed by FilePath.  For each file, it remembers
+    size, modification time and a content hash, so that unchanged files
+    need not be checked with the FileService again.  Note that the
+    manifest cannot know if files were removed on the remote side by
+    other means; delete it in that case.'''
+
+    def __init__( self, fileserver, manifestDir=None, suffix=".json" ):
+        import re
+        if not manifestDir:
+            manifestDir = os.path.join( os.path.expanduser("~"), ".cvac", "manifests" )
+        endpoint = fileserver.ice_toString()
+        safeName = re.sub( "[^A-Za-z0-9_.-]+", "_", endpoint )
+        self.filename = os.path.join( manifestDir, safeName+suffix )
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists( self.filename ):
+            import json
+            fin = open( self.filename, 'r' )
+            try:
+                self.entries = json.load( fin )
+            finally:
+                fin.close()
+
+    def getKey( self, filepath ):
+        return filepath.directory.relativePath+"/"+filepath.filename
+
+    def getLocalFile( self, filepath ):
+        return getFSPath( filepath )
 
-def putAllFiles( fileserver, runset ):
+    def hasEntry( self, filepath ):
+        return self.getKey( filepath ) in self.entries
+
+    def isCurrent( self, filepath ):
+        '''True if the local file is unchanged since it was recorded'''
+        key = self.getKey( filepath )
+        entry = self.entries.get( key )
+        if not entry:
+            return False
+        localFS = self.getLocalFile( filepath )
+        if not os.path.exists( localFS ):
+            return False
+        st = os.stat( localFS )
+        if st.st_size!=entry['size']:
+            return False
+        if st.st_mtime==entry['mtime']:
+            return True
+        # touched but possibly not modified: compare contents
+        if getContentHash( localFS )!=entry['hash']:
+            return False
+        self.lock.acquire()
+        entry['mtime'] = st.st_mtime
+        self.lock.release()
+        return True
+
+    def record( self, filepath ):
+        '''Remember that the local file has been put to the FileService'''
+        localFS = self.getLocalFile( filepath )
+        st = os.stat( localFS )
+        entry = {'size':st.st_size, 'mtime':st.st_mtime,
+                 'hash':getContentHash( localFS )}
+        self.lock.acquire()
+        self.entries[self.getKey( filepath )] = entry
+        self.lock.release()
+
+    def remove( self, filepath ):
+        self.lock.acquire()
+        self.entries.pop( self.getKey( filepath ), None )
+        self.lock.release()
+
+    def save( self ):
+        import json
+        manifestDir = os.path.dirname( self.filename )
+        if not os.path.exists( manifestDir ):
+            os.makedirs( manifestDir )
+        # write to a temporary file first so a crash can't corrupt it
+        tmpname = self.filename+".tmp"
+        fout = open( tmpname, 'w' )
+        try:
+            self.lock.acquire()
+            try:
+                json.dump( self.entries, fout )
+            finally:
+                self.lock.release()
+        finally:
+            fout.close()
+        if os.path.exists( self.filename ):
+            os.remove( self.filename )
+        os.rename( tmpname, self.filename )
+
+class DownloadManifest(UploadManifest):
+    '''A persistent, client-side record of the files that getAllFiles
+    fetched from one FileService into the directory dest, with the size,
+    modification time and content hash of each local copy, so that a
+    copy that is unchanged since it was fetched need not be checked with
+    the FileService again.  It cannot know about changes on the remote
+    side; use getAllFiles( ..., overwrite=True ) or delete it then.'''
+
+    def __init__( self, fileserver, dest="data", manifestDir=None ):
+        UploadManifest.__init__( self, fileserver, manifestDir, ".download.json" )
+        self.dest = dest
+
+    def getKey( self, filepath ):
+        return os.path.abspath( self.getLocalFile( filepath ) )
+
+    def getLocalFile( self, filepath ):
+        return os.path.join( self.dest, filepath.directory.relativePath, filepath.filename )
+
+def getContentHash( fsPath ):
+    '''Return the SHA-1 hex digest of a local file'''
+    import hashlib
+    sha = hashlib.sha1()
+    fin = open( fsPath, 'rb' )
+    try:
+        while True:
+            block = fin.read( 1024*1024 )
+            if not block:
+                break
+            sha.update( block )
+    finally:
+        fin.close()
+    return sha.hexdigest()
+
+def putAllFiles( fileserver, runset, window=8, manifest=None ):
     '''Make sure all files in the RunSet are available on the remote site;
     it is the client\'s responsibility to upload them if not.
-    For reporting purposes, return what has and has not been uploaded.'''
+    Up to window files are checked and uploaded concurrently.
+    If an UploadManifest is given, files it lists as unchanged are
+    skipped without asking the FileService, and files that changed
+    since they were put are uploaded again.  Files that the FileService
+    has already are added to the manifest as they are.
+    For reporting purposes, return what has and has not been uploaded,
+    and a list of (FilePath, exception) for files that failed.'''
     assert( fileserver and runset )
+    fileserver = instrumented( fileserver )
+
+    # all "substrates", consumed while uploading
+    substrates = iterSubstrates( runset )
 
-    # collect all "substrates"
-    substrates = collectSubstrates( runset )
-    
     # upload if not present
-    uploadedFiles = []
-    existingFiles = []
-    for sub in substrates:
+    def putIfMissing( sub ):
         if not type(sub) is cvac.Substrate:
             raise RuntimeError("Unexpected type found instead of cvac.Substrate:", type(sub))
-        if not fileserver.exists( sub.path ):
-            putFile( fileserver, sub.path )
+        if manifest and manifest.hasEntry( sub.path ):
+            if manifest.isCurrent( sub.path ):
+                return False
+            # we put an older version earlier, replace it
+            try:
+                fileserver.deleteFile( sub.path )
+            except cvac.FileServiceException:
+                # fine if it is gone already, e.g. removed by other means
+                if fileserver.exists( sub.path ):
+                    raise
+        elif fileserver.exists( sub.path ):
+            # remember it, so that the next run need not ask again
+            if manifest:
+                manifest.record( sub.path )
+            return False
+        putFile( fileserver, sub.path )
+        tracker.addResults( 1, os.path.getsize( getFSPath( sub.path ) ) )
+        if manifest:
+            manifest.record( sub.path )
+        return True
+
+    uploadedFiles = []
+    existingFiles = []
+    failedFiles = []
+    tracker = newProgressTracker( "putAllFiles", fileserver.ice_toString() )
+    try:
+        outcomes = mapConcurrently( putIfMissing, substrates, window )
+    finally:
+        tracker.finish()
+        if manifest:
+            manifest.save()
+    for sub, uploaded, ex in outcomes:
+        if ex:
+            failedFiles.append( (sub.path, ex) )
+        elif uploaded:
             uploadedFiles.append( sub.path )
         else:
             existingFiles.append( sub.path )
 
-    return {'uploaded':uploadedFiles, 'existing':existingFiles}
+    return {'uploaded':uploadedFiles, 'existing':existingFiles,
+            'failed':failedFiles}
 
-def deleteAllFiles( fileserver, uploadedFiles ):
+def deleteAllFiles( fileserver, uploadedFiles, manifest=None ):
     '''Delete all files that were previously uploaded to the fileserver.
+    Deleted files are also removed from the UploadManifest, if given.
     For reporting purposes, return what has and has not been uploaded.'''
     assert( fileserver )
+    fileserver = instrumented( fileserver )
 
     # are there any files to delete?
     if not uploadedFiles:
@@ -366,15 +984,282 @@ def deleteAllFiles( fileserver, uploadedFiles ):
         try:
             fileserver.deleteFile( path )
             deletedFiles.append( path )
+            if manifest:
+                manifest.remove( path )
         except cvac.FileServiceException:
             notDeletedFiles.append( path )
+    if manifest:
+        manifest.save()
 
     return {'deleted':deletedFiles, 'notDeleted':notDeletedFiles}
 
+def getFileChunks( fileserver, filepath, fout, chunkSize=None ):
+    '''Stream a file from the FileServer into the open file fout in
+    chunks of at most chunkSize bytes, so that memory use stays flat no
+    matter how large the file is.  A FileService that cannot send chunks
+    sends the whole file instead.  Returns the number of bytes written.'''
+    if not chunkSize:
+        chunkSize = defaultChunkSize
+    fileserver = instrumented( fileserver )
+    offset = 0
+    while True:
+        try:
+            data = fileserver.getFileChunk( filepath, offset, chunkSize )
+        except Ice.OperationNotExistException:
+            if offset>0:
+                raise
+            data = fileserver.getFile( filepath )
+            fout.write( data )
+            return len( data )
+        fout.write( data )
+        offset += len( data )
+        if len( data )<chunkSize:
+            return offset
+
+def getAllFiles( fileserver, paths, dest="data", window=8, overwrite=False,
+                 manifest=None, chunkSize=None ):
+    '''Download the files at the given cvac.FilePaths from the FileServer
+    into the local directory dest, keeping their relative paths.
+    Up to window files are downloaded concurrently, and each one is
+    streamed to disk in chunks; see getFileChunks.  Unless overwrite=True,
+    a local copy is kept if the DownloadManifest, if given, lists it as
+    unchanged since it was fetched, which takes no RPC, or else if it
+    has the size the FileServer reports.  For reporting purposes, return what has
+    been downloaded, what was present already, and a list of
+    (FilePath, exception) for files that failed.'''
+    assert( fileserver )
+    fileserver = instrumented( fileserver )
+
+    def getIfChanged( path ):
+        if not type(path) is cvac.FilePath:
+            raise RuntimeError("Unexpected type found instead of cvac.FilePath:", type(path))
+        localFS = os.path.join( dest, path.directory.relativePath, path.filename )
+        if not overwrite and os.path.exists( localFS ):
+            if manifest and manifest.hasEntry( path ):
+                # a copy fetched earlier is kept unless it changed since
+                if manifest.isCurrent( path ):
+                    return False
+            elif fileserver.getProperties( path ).bytesize==os.path.getsize( localFS ):
+                if manifest:
+                    manifest.record( path )
+                return False
+        parent = os.path.dirname( localFS )
+        if parent and not os.path.exists( parent ):
+            try:
+                os.makedirs( parent )
+            except OSError:
+                # another download created it in the meantime
+                if not os.path.isdir( parent ):
+                    raise
+        # write next to the target so that an interrupted download
+        # never leaves a truncated file that would look current
+        tmpname = localFS+".part"
+        fout = open( tmpname, 'wb' )
+        try:
+            numBytes = getFileChunks( fileserver, path, fout, chunkSize )
+        finally:
+            fout.close()
+        if os.path.exists( localFS ):
+            os.remove( localFS )
+        os.rename( tmpname, localFS )
+        if manifest:
+            manifest.record( path )
+        tracker.addResults( 1, numBytes )
+        return True
+
+    downloadedFiles = []
+    existingFiles = []
+    failedFiles = []
+    paths = list( paths )
+    tracker = newProgressTracker( "getAllFiles", fileserver.ice_toString(), len( paths ) )
+    try:
+        outcomes = mapConcurrently( getIfChanged, paths, window )
+    finally:
+        tracker.finish()
+        if manifest:
+            manifest.save()
+    for path, downloaded, ex in outcomes:
+        if ex:
+            failedFiles.append( (path, ex) )
+        elif downloaded:
+            downloadedFiles.append( path )
+        else:
+            existingFiles.append( path )
+
+    return {'downloaded':downloadedFiles, 'existing':existingFiles,
+            'failed':failedFiles}
+
+def getSnapshots( fileserver, paths, cache=None, window=8, dataDir="data" ):
+    '''Obtain snapshots (thumbnails) of the files at the given
+    cvac.FilePaths: the FileServer creates each of them, and they are
+    downloaded into the cache, a snapshotcache.SnapshotCache.  Up to
+    window snapshots are requested concurrently.  A snapshot that is in
+    the cache already costs no remote call; the cache is keyed by the
+    path and, if the original exists below the local dataDir, by its
+    modification time.  The FileService does not report modification
+    times, so for files without a local copy a cached snapshot is used
+    even if the remote original changed; pass a fresh cache then.
+    The snapshot files that the FileServer creates are deleted once
+    they are downloaded, where it permits that.
+    Returns a list of local snapshot files in the order of the paths,
+    with None for files that failed, and lists of what has been
+    downloaded, what was cached, and (FilePath, exception) for failures.'''
+    import snapshotcache
+    if cache is None:
+        cache = snapshotcache.SnapshotCache()
+    if fileserver:
+        fileserver = instrumented( fileserver )
+
+    def getSnapshot( path ):
+        if not type(path) is cvac.FilePath:
+            raise RuntimeError("Unexpected type found instead of cvac.FilePath:", type(path))
+        localFS = os.path.join( dataDir, path.directory.relativePath, path.filename )
+        mtime = None
+        if os.path.exists( localFS ):
+            mtime = os.path.getmtime( localFS )
+        key = cache.getKey( path, mtime )
+        snapFile = cache.lookup( key )
+        if snapFile:
+            return (snapFile, False)
+        if not fileserver:
+            raise RuntimeError("snapshot not cached and no FileServer given:", path.filename)
+        snapPath = fileserver.createSnapshot( path )
+        data = fileserver.getFile( snapPath )
+        try:
+            fileserver.deleteFile( snapPath )
+        except cvac.FileServiceException:
+            # the FileServer keeps snapshots that this client may not delete
+            pass
+        tracker.addResults( 1, len( data ) )
+        return (cache.store( key, data ), True)
+
+    snapshots = []
+    downloadedFiles = []
+    cachedFiles = []
+    failedFiles = []
+    paths = list( paths )
+    tracker = newProgressTracker( "getSnapshots",
+                                  fileserver and fileserver.ice_toString() or "", len( paths ) )
+    try:
+        outcomes = mapConcurrently( getSnapshot, paths, window )
+    finally:
+        tracker.finish()
+    for path, res, ex in outcomes:
+        if ex:
+            snapshots.append( None )
+            failedFiles.append( (path, ex) )
+            continue
+        snapFile, downloaded = res
+        snapshots.append( snapFile )
+        if downloaded:
+            downloadedFiles.append( path )
+        else:
+            cachedFiles.append( path )
+
+    return {'snapshots':snapshots, 'downloaded':downloadedFiles,
+            'cached':cachedFiles, 'failed':failedFiles}
+
+def getLocalProperties( fsPath ):
+    '''FileProperties of a local file, with the dimensions of images
+    read from their headers (see imageinfo); width and height are -1
+    if they are not known.  A file is an image if imageinfo can read
+    its header or it has one of imageinfo.imageExtensions, and a video
+    if isLikelyVideo says so; it may be neither.
+    Returns None if the file does not exist.'''
+    import imageinfo
+    if not os.path.isfile( fsPath ):
+        return None
+    props = cvac.FileProperties()
+    props.bytesize = os.path.getsize( fsPath )
+    props.isVideo = isLikelyVideo( getCvacPath( fsPath ) )
+    props.isImage = False
+    props.width = -1
+    props.height = -1
+    props.videoLength = cvac.VideoSeekTime( -1, -1 )
+    props.readPermitted = os.access( fsPath, os.R_OK )
+    props.writePermitted = os.access( fsPath, os.W_OK )
+    if not props.isVideo:
+        size = imageinfo.getImageSize( fsPath )
+        if size:
+            props.width, props.height = size
+        props.isImage = bool( size ) or \
+            os.path.splitext( fsPath )[1].lower() in imageinfo.imageExtensions
+    return props
+
+def prefetchProperties( runset, fileserver=None, dataDir="data", window=8, cache=None ):
+    '''Fill in width, height, isImage and isVideo of every Substrate in
+    the runset (a RunSet or a list of Labelables), so that services
+    need not decode the files to learn them.  Images that exist below
+    the local dataDir are measured from their headers; for all other
+    files, up to window getProperties calls go to the fileserver
+    concurrently.  To reuse FileProperties across calls, pass the same
+    dictionary as cache each time; local entries are measured again
+    when the file's size or mtime changed, while those from the
+    fileserver are kept for as long as the caller keeps the cache.
+    Returns the FileProperties by getSubstrateKey, which also have the
+    videoLength that detectVideo can use, and a list of
+    (Substrate, exception) for files whose properties are unknown.'''
+    if cache is None:
+        cache = {}
+    endpoint = None
+    if fileserver:
+        fileserver = instrumented( fileserver )
+        endpoint = fileserver.ice_toString()
+    if type(runset) is cvac.RunSet:
+        labelables = []
+        for plist in runset.purposedLists:
+            # the files of a PurposedDirectory are not known yet
+            if type(plist) is cvac.PurposedLabelableSeq:
+                labelables.extend( plist.labeledArtifacts )
+    else:
+        labelables = runset
+    substrates = {}
+    for lab in labelables:
+        substrates.setdefault( getSubstrateKey( lab.sub ), [] ).append( lab.sub )
+
+    def getProperties( key ):
+        sub = substrates[key][0]
+        fsPath = os.path.join( dataDir, sub.path.directory.relativePath, sub.path.filename )
+        if os.path.isfile( fsPath ):
+            stamp = (os.path.getsize( fsPath ), os.path.getmtime( fsPath ))
+            cached = cache.get( (None, key) )
+            if cached and cached[0]==stamp:
+                return cached[1]
+            props = getLocalProperties( fsPath )
+            # images in other formats, and videos, need the fileserver
+            # to learn their dimensions or length
+            if props.width>0 or not fileserver:
+                cache[(None, key)] = (stamp, props)
+                return props
+        cached = cache.get( (endpoint, key) )
+        if cached:
+            return cached[1]
+        if not fileserver:
+            raise RuntimeError("file not found locally and no FileServer given:",
+                               sub.path.filename)
+        props = fileserver.getProperties( sub.path )
+        cache[(endpoint, key)] = (None, props)
+        return props
+
+    properties = {}
+    failed = []
+    for key, props, ex in mapConcurrently( getProperties, list( substrates.keys() ), window ):
+        if ex:
+            failed.append( (substrates[key][0], ex) )
+            continue
+        properties[key] = props
+        for sub in substrates[key]:
+            sub.isImage = props.isImage
+            sub.isVideo = props.isVideo
+            if props.width>0 and props.height>0:
+                sub.width = props.width
+                sub.height = props.height
+    return {'properties':properties, 'failed':failed}
+
 def getTrainer( configString ):
     '''Connect to a trainer service'''
-    trainer_base = ic.stringToProxy( configString )
-    trainer = cvac.DetectorTrainerPrx.checkedCast( trainer_base )
+    trainer_base = getCommunicator().stringToProxy( configString )
+    trainer = checkedCast( cvac.DetectorTrainerPrx, trainer_base )
     if not trainer:
         raise RuntimeError("Invalid DetectorTrainer proxy")
     return trainer
@@ -382,35 +1267,90 @@ def getTrainer( configString ):
 # a default implementation for a TrainerCallbackHandler, in case
 # the easy user doesn't specify one;
 # this will get called once the training is done
-class TrainerCallbackReceiverI(cvac.TrainerCallbackHandler):
+class TrainerCallbackReceiverI(CallbackProgressI, LazyServant):
+    iceBase = "TrainerCallbackHandler"
     detectorData = None
     trainingFinished = False
+    def __init__(self):
+        self.progress = newProgressTracker( "train" )
     def createdDetector(self, detData, current=None):
+        noteCallback( "createdDetector" )
+        self.progress.addResults( 1 )
         if not detData:
             raise RuntimeError("Finished training, but obtained no DetectorData")
         print("Finished training, obtained DetectorData of type", detData.type)
         self.detectorData = detData
         self.trainingFinished = True
 
-def train( trainer, runset, callbackRecv=None ):
-    '''A callback receiver can optionally be specified'''
+def getTrainerKey( trainer ):
+    '''Describe the trainer by its name, description and the
+    properties it reports, as far as it supports them'''
+    trainer = instrumented( trainer )
+    key = {'name':trainer.getName(), 'description':trainer.getDescription()}
+    props = trainer.getTrainerProperties()
+    if props:
+        try:
+            if props.canSetWindowSize():
+                size = props.getWindowSize()
+                key['windowSize'] = (size.width, size.height)
+            if props.canSetSensitivity():
+                key['sensitivity'] = props.getSensitivity()
+        except Ice.OperationNotExistException:
+            pass
+    return key
+
+def restoreModel( detData, modelFile, fileserver=None ):
+    '''Make the model file of a cached DetectorData of type FILE
+    available again where the DetectorData refers to it: on the
+    FileServer if one is given, otherwise in the local data directory'''
+    if not modelFile or not detData.type==cvac.DetectorDataType.FILE:
+        return
+    if fileserver:
+        fileserver = instrumented( fileserver )
+        if not fileserver.exists( detData.file ):
+            putFile( fileserver, detData.file, fsPath=modelFile )
+    elif not os.path.exists( getFSPath( detData.file ) ):
+        localFS = getFSPath( detData.file )
+        if not os.path.exists( os.path.dirname( localFS ) ):
+            os.makedirs( os.path.dirname( localFS ) )
+        import shutil
+        shutil.copyfile( modelFile, localFS )
+
+def train( trainer, runset, callbackRecv=None, cache=None, fileserver=None ):
+    '''A callback receiver can optionally be specified.
+    If a trainingcache.TrainingCache is given, a trainer that has been
+    trained on the same RunSet before is not run again; instead the
+    cached DetectorData is returned, and its model file is put back on
+    the fileserver (or in the local data directory) if it is gone.
+    New model files are fetched from the fileserver for the cache.'''
     
+    trainer = instrumented( trainer )
+    if type(runset) is dict:
+        runset = runset['runset']
+    if cache:
+        cacheKey = cache.getKey( runset, getTrainerKey( trainer ) )
+        cached = cache.lookup( cacheKey )
+        if cached:
+            detData, modelFile = cached
+            restoreModel( detData, modelFile, fileserver )
+            return detData
+
     # ICE functionality to enable bidirectional connection for callback
-    adapter = ic.createObjectAdapter("")
-    cbID = Ice.Identity()
-    cbID.name = Ice.generateUUID()
-    cbID.category = ""
     if not callbackRecv:
         callbackRecv = TrainerCallbackReceiverI()
-    adapter.add( callbackRecv, cbID)
-    adapter.activate()
-    trainer.ice_getConnection().setAdapter(adapter)
+    cbID = addCallback( trainer, callbackRecv )
 
     # connect to trainer, initialize with a verbosity value, and train
-    trainer.initialize( 3 )
-    if type(runset) is dict:
-        runset = runset['runset']
-    trainer.process( cbID, runset )
+    error = None
+    try:
+        trainer.initialize( 3 )
+        trainer.process( cbID, runset )
+    except Exception as ex:
+        error = ex
+        raise
+    finally:
+        removeCallback( cbID )
+        finishProgress( callbackRecv, error )
 
     # check results
     if not callbackRecv.detectorData:
@@ -420,12 +1360,23 @@ def train( trainer, runset, callbackRecv=None ):
     elif callbackRecv.detectorData.type == cvac.DetectorDataType.PROVIDER:
         raise RuntimeError('detectorData as PROVIDER has not been tested yet')
 
+    if cache:
+        detData = callbackRecv.detectorData
+        modelFile = None
+        if detData.type==cvac.DetectorDataType.FILE:
+            modelFile = getFSPath( detData.file )
+            if fileserver and not os.path.exists( modelFile ):
+                getAllFiles( fileserver, [detData.file] )
+            if not os.path.exists( modelFile ):
+                modelFile = None
+        cache.store( cacheKey, detData, modelFile )
+
     return callbackRecv.detectorData
 
 def getDetector( configString ):
     '''Connect to a detector service'''
-    detector_base = ic.stringToProxy( configString )
-    detector = cvac.DetectorPrx.checkedCast(detector_base)
+    detector_base = getCommunicator().stringToProxy( configString )
+    detector = checkedCast( cvac.DetectorPrx, detector_base )
     if not detector:
         raise RuntimeError("Invalid Detector service proxy")
     return detector
@@ -434,60 +1385,611 @@ def getDetector( configString ):
 # the easy user doesn't specify one;
 # this will get called when results have been found;
 # replace the multiclass-ID label with the string label
-class DetectorCallbackReceiverI(cvac.DetectorCallbackHandler):
-    allResults = []
+class DetectorCallbackReceiverI(CallbackProgressI, LazyServant):
+    iceBase = "DetectorCallbackHandler"
     detectionFinished = False
+    def __init__(self):
+        # each receiver collects only the results of its own call
+        self.allResults = []
+        self.progress = newProgressTracker( "detect" )
     def foundNewResults(self, r2, current=None):
+        noteCallback( "foundNewResults" )
+        self.progress.addResults( len( r2.results ) )
         # collect all results
         self.allResults.extend( r2.results )
 
-def detect( detector, detectorData, runset, callbackRecv=None ):
-    '''Synchronously run detection with the specified detector,
-    trained model, and optional callback receiver.
-    The detectorData can be either a cvac.DetectorData object or simply
-     a filename of a pre-trained model.  Naturally, the model has to be
-     compatible with the detector.
-    The runset can be either a cvac.RunSet object, filename to a single
-     file that is to be tested, or a directory path.
-    If a callback receiver is specified, this function returns nothing,
-    otherwise, the obtained results are returned.'''
+class ResultStoreCallbackI(DetectorCallbackReceiverI):
+    '''A DetectorCallbackHandler that appends the results to a
+    resultstore.ResultStoreWriter as they arrive instead of keeping
+    them in memory'''
+    def __init__(self, writer):
+        DetectorCallbackReceiverI.__init__(self)
+        self.writer = writer
+    def foundNewResults(self, r2, current=None):
+        noteCallback( "foundNewResults" )
+        self.progress.addResults( len( r2.results ) )
+        self.writer.addResults( r2.results )
+
+def detectToStore( detector, detectorData, runset, directory ):
+    '''Run detection like detect, but write the results to the result
+    store in directory (see resultstore), appending if it exists, and
+    return the store opened for reading'''
+    import resultstore
+    writer = resultstore.ResultStoreWriter( directory )
+    try:
+        detect( detector, detectorData, runset, ResultStoreCallbackI( writer ) )
+    finally:
+        writer.close()
+    return resultstore.ResultStore( directory )
 
+def getDetectorData( detectorData ):
+    '''Return detectorData as a cvac.DetectorData object; it can be given
+    as such an object already or as the filename of a pre-trained model.'''
     # create a cvac.DetectorData object out of a filename
     if type(detectorData) is str:
         ddpath = getCvacPath( detectorData );
         detectorData = cvac.DetectorData( cvac.DetectorDataType.FILE, None, ddpath, None )
     elif not type(detectorData) is cvac.DetectorData:
-        raise RuntimeException("detectorData must be either filename or cvac.DetectorData")
+        raise RuntimeError("detectorData must be either filename or cvac.DetectorData")
+    return detectorData
 
+def getRunSet( runset ):
+    '''Return runset as a cvac.RunSet object; it can be given as such an
+    object already, as the result of createRunSet, or as the filename
+    of a single file.'''
     # create a RunSet out of a filename or directory path
     if type(runset) is str:
         res = createRunSet( runset )
         runset = res['runset']
-        classmap = res['classmap']
+    elif type(runset) is dict:
+        runset = runset['runset']
     elif not type(runset) is cvac.RunSet:
-        raise RuntimeException("runset must either be a filename, directory, or cvac.RunSet")
+        raise RuntimeError("runset must either be a filename, directory, or cvac.RunSet")
+    return runset
+
+def detect( detector, detectorData, runset, callbackRecv=None ):
+    '''Synchronously run detection with the specified detector,
+    trained model, and optional callback receiver.
+    The detectorData can be either a cvac.DetectorData object or simply
+     a filename of a pre-trained model.  Naturally, the model has to be
+     compatible with the detector.
+    The runset can be either a cvac.RunSet object, filename to a single
+     file that is to be tested, or a directory path.
+    If a callback receiver is specified, this function returns nothing,
+    otherwise, the obtained results are returned.'''
+    detectorData = getDetectorData( detectorData )
+    runset = getRunSet( runset )
+    detector = instrumented( detector )
+
+    # connect to detector, initialize with a verbosity value
+    # and the trained model, and run the detection on the runset
+    detector.initialize( 3, detectorData )
+    return processRunSet( detector, runset, callbackRecv )
 
+def countLabelables( runset ):
+    '''The number of Labelables listed in the runset, not counting
+    those in PurposedDirectory entries'''
+    count = 0
+    for plist in runset.purposedLists:
+        if type(plist) is cvac.PurposedLabelableSeq:
+            count += len( plist.labeledArtifacts )
+    return count or None
+
+def processRunSet( detector, runset, callbackRecv=None ):
+    '''Run an initialized detector on the runset.  If a callback
+    receiver is specified, this function returns nothing, otherwise,
+    the obtained results are returned.'''
     # ICE functionality to enable bidirectional connection for callback
-    adapter = ic.createObjectAdapter("")
-    cbID = Ice.Identity()
-    cbID.name = Ice.generateUUID()
-    cbID.category = ""
     ourRecv = False  # will we use our own simple callback receiver?
     if not callbackRecv:
         ourRecv = True
         callbackRecv = DetectorCallbackReceiverI();
-    adapter.add( callbackRecv, cbID )
-    adapter.activate()
-    detector.ice_getConnection().setAdapter(adapter)
-
-    # connect to detector, initialize with a verbosity value
-    # and the trained model, and run the detection on the runset
-    detector.initialize( 3, detectorData )
-    detector.process( cbID, runset )
+    tracker = getattr( callbackRecv, 'progress', None )
+    if tracker and tracker.total is None:
+        tracker.total = countLabelables( runset )
+    cbID = addCallback( detector, callbackRecv )
+    error = None
+    try:
+        detector.process( cbID, runset )
+    except Exception as ex:
+        error = ex
+        raise
+    finally:
+        removeCallback( cbID )
+        finishProgress( callbackRecv, error )
 
     if ourRecv:
         return callbackRecv.allResults
 
+class DetectorSession(object):
+    '''A detector with a model loaded once for any number of detect
+    calls.  The detector can be given as a proxy or configuration
+    string, the detectorData as for detect.  The model is loaded by
+    the first detect call, or by initialize(), and again only if the
+    detector reports that it is no longer initialized.  A session
+    assumes that nobody else initializes the same detector with a
+    different model; its detect calls run one at a time.
+    Call destroy() when done, or use the session in a with statement.'''
+
+    def __init__( self, detector, detectorData, verbosity=3 ):
+        if type(detector) is str:
+            detector = getDetector( detector )
+        self.detector = instrumented( detector )
+        self.detectorData = getDetectorData( detectorData )
+        self.verbosity = verbosity
+        self.initialized = False
+        self.lock = threading.Lock()
+
+    def initialize( self ):
+        '''Load the model unless the detector has it loaded already'''
+        self.lock.acquire()
+        try:
+            if self.initialized and self.detector.isInitialized():
+                return
+            self.detector.initialize( self.verbosity, self.detectorData )
+            self.initialized = True
+        finally:
+            self.lock.release()
+
+    def detect( self, runset, callbackRecv=None ):
+        '''Run detection on the runset with the loaded model; arguments
+        and return value are as for easy.detect'''
+        runset = getRunSet( runset )
+        self.initialize()
+        self.lock.acquire()
+        try:
+            return processRunSet( self.detector, runset, callbackRecv )
+        finally:
+            self.lock.release()
+
+    def destroy( self ):
+        '''Release the model on the detector'''
+        self.lock.acquire()
+        try:
+            if self.initialized:
+                self.initialized = False
+                self.detector.destroy()
+        finally:
+            self.lock.release()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, excType, excValue, tb ):
+        self.destroy()
+        return False
+
+def startSessions( detectors, detectorData, verbosity=3 ):
+    '''Create a DetectorSession on each detector and load the model on
+    all of them in parallel.  Returns the sessions that are ready, and a
+    list of (detector, exception) for the detectors that failed.'''
+    def start( detector ):
+        session = DetectorSession( detector, detectorData, verbosity )
+        session.initialize()
+        return session
+    sessions = []
+    failed = []
+    for detector, session, ex in mapConcurrently( start, detectors, len( detectors ) ):
+        if ex:
+            failed.append( (detector, ex) )
+        else:
+            sessions.append( session )
+    return {'sessions':sessions, 'failed':failed}
+
+# marks the end of the batches in a DetectorResultStream
+_endOfResults = object()
+
+class DetectorResultStream(CallbackProgressI, LazyServant):
+    '''The callback receiver of detect_async.  Iterating over it yields
+    each cvac.ResultSetV2 batch as soon as the detector reports it.
+    At most maxBuffered batches are held; if the consumer falls behind,
+    the callback blocks, which in turn holds up the detector.
+    The blocked callback occupies a thread of the Ice client thread pool
+    (see defaultProperties), and the detector's connection delivers
+    nothing else until the consumer catches up, so do not call the same
+    detector while iterating, and do not keep more full streams than
+    the pool has spare threads.  Call close() to stop consuming early;
+    finished is set once the detector is done.'''
+    iceBase = "DetectorCallbackHandler"
+
+    def __init__( self, maxBuffered=16 ):
+        self.queue = Queue.Queue( maxBuffered )
+        self.error = None
+        self.closed = False
+        self.finished = threading.Event()
+        self.progress = newProgressTracker( "detect" )
+
+    def foundNewResults( self, r2, current=None ):
+        noteCallback( "foundNewResults" )
+        self.progress.addResults( len( r2.results ) )
+        if not self.closed:
+            self.queue.put( r2 )
+
+    def finish( self, error=None ):
+        '''Called once detection has completed or failed'''
+        self.error = error
+        self.progress.finish( error )
+        self.finished.set()
+        if not self.closed:
+            self.queue.put( _endOfResults )
+
+    def __iter__( self ):
+        while not self.closed:
+            batch = self.queue.get()
+            if batch is _endOfResults:
+                break
+            yield batch
+        if self.error:
+            raise self.error
+
+    def wait( self ):
+        '''Block until detection is done; return all remaining results'''
+        allResults = []
+        for batch in self:
+            allResults.extend( batch.results )
+        return allResults
+
+    def close( self ):
+        '''Discard pending and future batches'''
+        self.closed = True
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Queue.Empty:
+            pass
+
+def detect_async( detector, detectorData, runset, maxBuffered=16 ):
+    '''Start detection in the background and return a
+    DetectorResultStream right away.  Iterate over the stream to process
+    each batch of results while detection continues, or call its wait()
+    method to obtain all results.  Arguments are as for detect.'''
+    detectorData = getDetectorData( detectorData )
+    runset = getRunSet( runset )
+    detector = instrumented( detector )
+    stream = DetectorResultStream( maxBuffered )
+    stream.progress.total = countLabelables( runset )
+    cbID = addCallback( detector, stream )
+
+    def run():
+        error = None
+        try:
+            detector.initialize( 3, detectorData )
+            detector.process( cbID, runset )
+        except Exception as ex:
+            error = ex
+        removeCallback( cbID )
+        stream.finish( error )
+
+    thread = threading.Thread( target=run )
+    thread.daemon = True
+    thread.start()
+    return stream
+
+def detect_iter( detector, detectorData, runset, maxBuffered=16 ):
+    '''Run detection, yielding each cvac.ResultSetV2 batch as it arrives'''
+    stream = detect_async( detector, detectorData, runset, maxBuffered )
+    try:
+        for batch in stream:
+            yield batch
+    finally:
+        stream.close()
+
+def splitRunSet( runset, shardSize ):
+    '''Split the PurposedLabelableSeq entries of a RunSet into a list of
+    RunSets with at most shardSize Labelables each, keeping purposes
+    and order.'''
+    shards = []
+    for plist in runset.purposedLists:
+        if not type(plist) is cvac.PurposedLabelableSeq:
+            raise RuntimeError("can only split PurposedLabelableSeq, not", type(plist))
+        artifacts = plist.labeledArtifacts
+        for start in range( 0, len(artifacts), shardSize ):
+            part = cvac.PurposedLabelableSeq( plist.pur,
+                                              artifacts[start:start+shardSize] )
+            shards.append( cvac.RunSet( [part] ) )
+    return shards
+
+def orderResults( results, runset ):
+    '''Sort results into the order in which their originals
+    occur in the runset'''
+    order = {}
+    for plist in runset.purposedLists:
+        for lab in plist.labeledArtifacts:
+            key = getSubstrateKey( lab.sub )
+            if not key in order:
+                order[key] = len( order )
+    unknown = len( order )
+    def position( res ):
+        return order.get( getSubstrateKey( res.original.sub ), unknown )
+    return sorted( results, key=position )
+
+def detectSharded( detectors, detectorData, runset, shardSize=50, retries=2 ):
+    '''Run detection on a pool of detector services.  The detectors can be
+    given as proxies or configuration strings.  The runset is split into
+    shards of shardSize Labelables; every detector takes the next shard
+    as soon as it is done with its previous one, so faster or less loaded
+    services process more shards.  A shard that fails is put back for
+    any detector to retry, up to retries times, and a detector that
+    fails twice in a row is not used any further.
+    Returns a dictionary with the results, in the order of the runset,
+    and a list of (RunSet, exception) for the shards that failed.'''
+    detectorData = getDetectorData( detectorData )
+    runset = getRunSet( runset )
+    shards = splitRunSet( runset, shardSize )
+    pending = Queue.Queue()
+    for idx in range( len(shards) ):
+        pending.put( (idx, 0) )
+    shardResults = {}
+    failed = {}
+    lock = threading.Lock()
+
+    def isDone():
+        lock.acquire()
+        done = len( shardResults )+len( failed )==len( shards )
+        lock.release()
+        return done
+
+    def worker( detector ):
+        if type(detector) is str:
+            detector = getDetector( detector )
+        detector = instrumented( detector )
+        detector.initialize( 3, detectorData )
+        consecutiveFailures = 0
+        while consecutiveFailures<2 and not isDone():
+            try:
+                idx, attempts = pending.get( timeout=0.1 )
+            except Queue.Empty:
+                continue
+            try:
+                results = processRunSet( detector, shards[idx] )
+                consecutiveFailures = 0
+                lock.acquire()
+                shardResults[idx] = results
+                lock.release()
+            except Exception as ex:
+                consecutiveFailures += 1
+                if attempts<retries:
+                    pending.put( (idx, attempts+1) )
+                else:
+                    lock.acquire()
+                    failed[idx] = ex
+                    lock.release()
+
+    outcomes = mapConcurrently( worker, detectors, len(detectors) )
+
+    # shards that are left over when all detectors have given up
+    lastError = RuntimeError("no detector available")
+    for detector, res, ex in outcomes:
+        if ex:
+            lastError = ex
+    while True:
+        try:
+            idx, attempts = pending.get_nowait()
+        except Queue.Empty:
+            break
+        failed[idx] = lastError
+
+    allResults = []
+    for idx in sorted( shardResults.keys() ):
+        allResults.extend( orderResults( shardResults[idx], shards[idx] ) )
+    failedShards = []
+    for idx in sorted( failed.keys() ):
+        failedShards.append( (shards[idx], failed[idx]) )
+    return {'results':allResults, 'failed':failedShards}
+
+def createFolds( categories, numFolds, seed=None ):
+    '''Split a dictionary of label categories (see getDataSet) into
+    numFolds stratified folds: the Labelables of each category are
+    shuffled and dealt out to the folds in turn, so every fold has about
+    the same share of each category.  Returns a list of numFolds
+    category dictionaries; each of them has all the category keys.'''
+    if numFolds<2:
+        raise RuntimeError("need at least two folds, not", numFolds)
+    import random
+    rng = random.Random( seed )
+    folds = [{} for idx in range( numFolds )]
+    # continue dealing where the previous category stopped, so that
+    # small categories do not all end up in the first folds
+    nextFold = 0
+    for key in sorted( categories.keys() ):
+        labelables = list( categories[key] )
+        rng.shuffle( labelables )
+        for fold in folds:
+            fold[key] = []
+        for lb in labelables:
+            folds[nextFold][key].append( lb )
+            nextFold = (nextFold+1) % numFolds
+    return folds
+
+def mergeFolds( folds ):
+    '''Combine category dictionaries into one'''
+    merged = {}
+    for fold in folds:
+        for key in fold:
+            merged.setdefault( key, [] ).extend( fold[key] )
+    return merged
+
+def crossValidate( trainers, detectors, categories, numFolds=5,
+                   fileserver=None, seed=None ):
+    '''Run stratified k-fold cross-validation: for each of the numFolds
+    folds of the categories (see createFolds), train on the other folds
+    and detect on this one.  The trainers and detectors can be given as
+    proxies or configuration strings, and folds run concurrently as far
+    as there are trainers and detectors to run them on; each service
+    handles one fold at a time.  If a fileserver is given, all files are
+    put there once beforehand.
+    Returns a dictionary with the summed evaluation.ConfusionMatrix of
+    the folds that succeeded, per-fold dictionaries of 'confmat',
+    'results' and 'detectorData' (None for failed folds), and a list of
+    (fold index, exception) for the folds that failed.'''
+    import evaluation
+    if not trainers or not detectors:
+        raise RuntimeError("crossValidate needs at least one trainer and one detector")
+    folds = createFolds( categories, numFolds, seed )
+    if fileserver:
+        uploads = putAllFiles( fileserver, createRunSet( categories ) )
+        if uploads['failed']:
+            path, ex = uploads['failed'][0]
+            raise RuntimeError("could not put "+getFSPath( path )+" on the FileServer", ex)
+
+    # services are handed out to one fold at a time
+    trainerPool = Queue.Queue()
+    for trainer in trainers:
+        if type(trainer) is str:
+            trainer = getTrainer( trainer )
+        trainerPool.put( trainer )
+    detectorPool = Queue.Queue()
+    for detector in detectors:
+        if type(detector) is str:
+            detector = getDetector( detector )
+        detectorPool.put( detector )
+
+    def runFold( idx ):
+        trainRunSet = createRunSet( mergeFolds( folds[:idx]+folds[idx+1:] ) )
+        testRunSet = createRunSet( folds[idx] )
+        classmap = trainRunSet['classmap']
+        trainer = trainerPool.get()
+        try:
+            detectorData = train( trainer, trainRunSet['runset'] )
+        finally:
+            trainerPool.put( trainer )
+        detector = detectorPool.get()
+        try:
+            results = detect( detector, detectorData, testRunSet['runset'] )
+        finally:
+            detectorPool.put( detector )
+        confmat = getConfusionMatrix( results, classmap, classmap )
+        return {'confmat':confmat, 'results':results, 'detectorData':detectorData}
+
+    outcomes = mapConcurrently( runFold, range( numFolds ), numFolds )
+    total = evaluation.ConfusionMatrix( sorted( categories.keys() ) )
+    foldResults = []
+    failed = []
+    for idx, res, ex in outcomes:
+        if ex:
+            failed.append( (idx, ex) )
+        else:
+            total.matrix += res['confmat'].matrix
+        foldResults.append( res )
+    return {'confmat':total, 'folds':foldResults, 'failed':failed}
+
+def getSeekPosition( seekTime ):
+    '''The frame count of a VideoSeekTime if it is known, else its time'''
+    if seekTime.framecnt>=0:
+        return seekTime.framecnt
+    return seekTime.time
+
+def splitVideo( labelable, videoLength, numSegments=None, segmentLength=None,
+                overlap=0 ):
+    '''Split a video Labelable into LabeledVideoSegments that cover it,
+    either numSegments of them or segments of segmentLength frames
+    (or time units, if the videoLength has no frame count).
+    Consecutive segments share overlap frames, so that detections at
+    the boundaries are not lost.  Both the frame count and the time of
+    the segment boundaries are filled in when the videoLength has both.'''
+    useFrames = videoLength.framecnt>0
+    length = useFrames and videoLength.framecnt or videoLength.time
+    if length<=0:
+        raise RuntimeError("unknown length of video", labelable.sub.path.filename)
+    if not segmentLength:
+        import math
+        segmentLength = int( math.ceil( length/float( numSegments or 1 ) ) )
+    segmentLength = max( segmentLength, overlap+1 )
+
+    def seekTime( position ):
+        if not useFrames:
+            return cvac.VideoSeekTime( position, -1 )
+        time = -1
+        if videoLength.time>0:
+            time = videoLength.time*position//videoLength.framecnt
+        return cvac.VideoSeekTime( time, position )
+
+    segments = []
+    start = 0
+    while start<length:
+        last = min( start+segmentLength, length )-1
+        segments.append( cvac.LabeledVideoSegment(
+            labelable.confidence, labelable.lab, labelable.sub,
+            seekTime( start ), seekTime( last ), None, None, None ) )
+        if last==length-1:
+            break
+        start = last+1-overlap
+    return segments
+
+def stitchVideoSegments( found ):
+    '''Merge found LabeledVideoSegments with the same label and location
+    that overlap or adjoin, such as the pieces of one detection that
+    crossed a segment boundary.  Returns them in timeline order,
+    followed by any found labels that are not LabeledVideoSegments.'''
+    segments = [lab for lab in found if isinstance( lab, cvac.LabeledVideoSegment )]
+    others = [lab for lab in found if not isinstance( lab, cvac.LabeledVideoSegment )]
+    segments.sort( key=lambda seg: getSeekPosition( seg.start ) )
+    stitched = []
+    # the last stitched segment for each label and location
+    openSegments = {}
+    for seg in segments:
+        key = (seg.lab.name, repr( seg.loc ))
+        prev = openSegments.get( key )
+        last = seg.last or seg.start
+        if prev and getSeekPosition( seg.start )<=getSeekPosition( prev.last or prev.start )+1:
+            if getSeekPosition( last )>getSeekPosition( prev.last or prev.start ):
+                prev.last = last
+                prev.lastBeforeTx = seg.lastBeforeTx
+            prev.confidence = max( prev.confidence, seg.confidence )
+            continue
+        merged = cvac.LabeledVideoSegment( seg.confidence, seg.lab, seg.sub,
+                                           seg.start, last, seg.startAfterTx,
+                                           seg.lastBeforeTx, seg.loc )
+        openSegments[key] = merged
+        stitched.append( merged )
+    return stitched+others
+
+def detectVideo( detectors, detectorData, videos, fileserver=None, videoLengths=None,
+                 numSegments=None, segmentLength=None, overlap=0, retries=2 ):
+    '''Run detection on videos by splitting each of them into
+    LabeledVideoSegments (see splitVideo) that a pool of detectors
+    processes concurrently (see detectSharded), one segment at a time.
+    The videos are Labelables or FilePaths.  Their lengths are taken
+    from videoLengths, a dictionary from getSubstrateKey to
+    cvac.VideoSeekTime, or else from the fileserver's FileProperties.
+    Without numSegments or segmentLength, every video is split into one
+    segment per detector.
+    Returns a dictionary with one cvac.Result per video, whose found
+    labels are the stitched segments (see stitchVideoSegments), and a
+    list of (RunSet, exception) for segments that failed.'''
+    if not numSegments and not segmentLength:
+        numSegments = len( detectors )
+    if fileserver:
+        fileserver = instrumented( fileserver )
+    videoLabelables = []
+    segments = []
+    for video in videos:
+        if type(video) is cvac.FilePath:
+            video = getLabelable( video )
+        key = getSubstrateKey( video.sub )
+        if videoLengths and key in videoLengths:
+            length = videoLengths[key]
+        elif fileserver:
+            length = fileserver.getProperties( video.sub.path ).videoLength
+        else:
+            raise RuntimeError("length of video unknown:", video.sub.path.filename)
+        videoLabelables.append( video )
+        segments.extend( splitVideo( video, length, numSegments, segmentLength, overlap ) )
+
+    purpose = cvac.Purpose( cvac.PurposeType.UNLABELED, 0 )
+    runset = cvac.RunSet( [cvac.PurposedLabelableSeq( purpose, segments )] )
+    res = detectSharded( detectors, detectorData, runset, shardSize=1, retries=retries )
+
+    found = {}
+    for segResult in res['results']:
+        found.setdefault( getSubstrateKey( segResult.original.sub ), [] ).extend(
+            segResult.foundLabels )
+    results = []
+    for video in videoLabelables:
+        foundLabels = found.get( getSubstrateKey( video.sub ), [] )
+        results.append( cvac.Result( video, stitchVideoSegments( foundLabels ) ) )
+    return {'results':results, 'failed':res['failed']}
+
 def getPurposeName( purpose ):
     '''Returns a string to identify the purpose or an
     int to identify a multiclass class ID.'''
@@ -524,6 +2026,24 @@ def getLabelText( label, classmap=None ):
                                 type(mapped) )
     return text
 
+def getFoundLabelMap( foundMap ):
+    '''If the foundMap maps labels to Purposes, return the inverse map
+    from the Purpose name that a detector reports (such as the class ID
+    '12') to the label (such as 'face'); otherwise return foundMap.'''
+    labelPurposeLabelMap = {}
+    if foundMap:
+        for key in foundMap.keys():
+            pur = foundMap[key]
+            if not type(pur) is cvac.Purpose:
+                break
+            id = getPurposeName( pur )
+            if type(id) is int:
+                id = str(id)
+            labelPurposeLabelMap[id] = key
+    if labelPurposeLabelMap:
+        return labelPurposeLabelMap
+    return foundMap
+
 def printResults( results, foundMap=None, origMap=None ):
     '''Print detection results as specified in a ResultSet.
     If classmaps are specified, the labels are mapped
@@ -538,19 +2058,7 @@ def printResults( results, foundMap=None, origMap=None ):
     classmap might map 'face' to a Purpose(MULTICLASS, 12).
     Hence, we would replace '12' with 'face'.'''
     
-    # create inverse map for found labels
-    labelPurposeLabelMap = {}
-    if foundMap:
-        for key in foundMap.keys():
-            pur = foundMap[key]
-            if not type(pur) is cvac.Purpose:
-                break
-            id = getPurposeName( pur )
-            if type(id) is int:
-                id = str(id)
-            labelPurposeLabelMap[id] = key
-    if labelPurposeLabelMap:
-        foundMap = labelPurposeLabelMap
+    foundMap = getFoundLabelMap( foundMap )
     
     print('received a total of {0} results:'.format( len( results ) ))
     identical = 0
@@ -568,11 +2076,21 @@ def printResults( results, foundMap=None, origMap=None ):
             identical += 1
     print('{0} out of {1} results had identical labels'.format( identical, len( results ) ))
 
-def getConfusionMatrix( results, origMap, foundMap ):
-    '''produce a confusion matrix'''
-    import numpy
-    catsize = len( origMap )
-    if catsize>50:
-        pass
-    confmat = numpy.empty( (catsize+1, catsize+1) )
+def getConfusionMatrix( results, origMap, foundMap, confmat=None ):
+    '''Produce an evaluation.ConfusionMatrix over the labels in origMap,
+    comparing each result's original label to its found label as
+    mapped through foundMap (see printResults).  Pass the returned
+    matrix back in as confmat to add further batches of results.
+    The matrix itself is in the .matrix member, with one extra row and
+    column for anything that is not one of the labels.
+    The results can also be a resultstore.ResultStore, which is counted
+    from its columns and much faster than a list of cvac.Results.'''
+    import evaluation
+    import resultstore
+    if confmat is None:
+        confmat = evaluation.ConfusionMatrix( sorted( origMap.keys() ) )
+    if isinstance( results, resultstore.ResultStore ):
+        confmat.addResultStore( results, getFoundLabelMap( foundMap ) )
+    else:
+        confmat.addResults( results, getFoundLabelMap( foundMap ) )
     return confmat
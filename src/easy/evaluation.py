@@ -0,0 +1,400 @@
+#
+# Easy Computer Vision
+#
+# evaluation.py scores detection results against their ground truth
+# with NumPy, so that large result sets can be evaluated quickly.
+#
+from __future__ import print_function
+import numpy
+import paths
+import cvac
+
+def safeDivide( numerator, denominator ):
+    '''Element-wise division that yields 0 where the denominator is 0'''
+    numerator = numpy.asarray( numerator, numpy.float64 )
+    denominator = numpy.asarray( denominator, numpy.float64 )
+    with numpy.errstate( divide='ignore', invalid='ignore' ):
+        quotient = numerator/denominator
+    return numpy.where( denominator!=0, quotient, 0.0 )
+
+class ConfusionMatrix(object):
+    '''A confusion matrix over the given class names that can be updated
+    incrementally, for example with each batch of results as it arrives.
+    Rows are the original (ground truth) labels, columns the found
+    labels.  The last row and column count everything that is not one
+    of the classes: unlabeled originals, or results where nothing or
+    an unknown label was found.'''
+
+    def __init__( self, classNames ):
+        self.classNames = list( classNames )
+        self.classIds = {}
+        for idx in range( len(self.classNames) ):
+            self.classIds[self.classNames[idx]] = idx
+        size = len(self.classNames)+1
+        self.matrix = numpy.zeros( (size, size), numpy.int64 )
+
+    def addIndices( self, origIds, foundIds ):
+        '''Count pairs of original and found class indices, given as
+        integer arrays; use len(classNames) for "other".'''
+        size = len(self.classNames)+1
+        pairs = numpy.asarray( origIds, numpy.int64 )*size \
+            + numpy.asarray( foundIds, numpy.int64 )
+        counts = numpy.bincount( pairs, minlength=size*size )
+        self.matrix += counts.reshape( size, size )
+
+    def addNames( self, origNames, foundNames ):
+        '''Count pairs of original and found label names'''
+        other = len(self.classNames)
+        lookup = self.classIds.get
+        origIds = numpy.array( [lookup( name, other ) for name in origNames],
+                               numpy.int64 )
+        foundIds = numpy.array( [lookup( name, other ) for name in foundNames],
+                                numpy.int64 )
+        self.addIndices( origIds, foundIds )
+
+    def addResults( self, results, foundLabelMap=None ):
+        '''Count a list of cvac.Result.  If a result has several found
+        labels, the most confident one counts.  Found label names are
+        translated through foundLabelMap, if given, so that detector
+        output such as a class ID maps to a class name.'''
+        origNames = []
+        foundNames = []
+        for res in results:
+            orig = res.original.lab
+            origNames.append( orig.hasLabel and orig.name or None )
+            found = res.foundLabels
+            if not found:
+                foundNames.append( None )
+                continue
+            best = found[0]
+            if len(found)>1:
+                best = max( found, key=lambda lb: lb.confidence )
+            name = best.lab.hasLabel and best.lab.name or None
+            if foundLabelMap and name in foundLabelMap:
+                name = foundLabelMap[name]
+            foundNames.append( name )
+        self.addNames( origNames, foundNames )
+
+    def getLookup( self, labelNames, labelMap=None ):
+        '''Class indices by label id for the names in labelNames, as
+        translated through labelMap if given, with "other" for names
+        that are not classes and for the id -1'''
+        other = len(self.classNames)
+        ids = []
+        for name in labelNames:
+            if labelMap and name in labelMap:
+                name = labelMap[name]
+            ids.append( self.classIds.get( name, other ) )
+        return numpy.array( ids+[other], numpy.int64 )
+
+    def addColumns( self, resultIds, origLabelIds, labelIds, confidences, labelNames,
+                    foundLabelMap=None ):
+        '''Count results that are given as columns with one row per found
+        label, as a resultstore.ResultStore keeps them: the rows of a
+        result are adjacent and share its resultId, label ids index
+        labelNames or are -1 for no label, and a result without found
+        labels has a single row with labelId -1.  As in addResults, the
+        most confident found label of a result counts, and found label
+        names are translated through foundLabelMap.'''
+        resultIds = numpy.asarray( resultIds )
+        if not len( resultIds ):
+            return
+        confidences = numpy.asarray( confidences, numpy.float64 )
+        confidences = numpy.where( numpy.isnan( confidences ), -numpy.inf, confidences )
+        # the rows of each result, and their highest confidence
+        starts = numpy.flatnonzero( numpy.concatenate(
+            ([True], resultIds[1:]!=resultIds[:-1]) ) )
+        counts = numpy.diff( numpy.append( starts, len( resultIds ) ) )
+        bestConfidences = numpy.maximum.reduceat( confidences, starts )
+        # among the rows with that confidence, the first one counts
+        bestRows = numpy.flatnonzero( confidences==numpy.repeat( bestConfidences, counts ) )
+        groups = numpy.repeat( numpy.arange( len( starts ) ), counts )[bestRows]
+        rows = bestRows[numpy.concatenate( ([True], groups[1:]!=groups[:-1]) )]
+        origLookup = self.getLookup( labelNames )
+        foundLookup = self.getLookup( labelNames, foundLabelMap )
+        self.addIndices( origLookup[numpy.asarray( origLabelIds )[rows]],
+                         foundLookup[numpy.asarray( labelIds )[rows]] )
+
+    def addResultStore( self, store, foundLabelMap=None, chunkRows=1<<22 ):
+        '''Count the results in a resultstore.ResultStore from its
+        columns, chunkRows rows at a time, without creating cvac.Result
+        objects'''
+        start = 0
+        while start<store.rows:
+            end = min( start+chunkRows, store.rows )
+            if end<store.rows:
+                # keep the rows of a result in one chunk
+                cut = int( numpy.searchsorted( store.resultIds[start:end+1],
+                                               store.resultIds[end] ) )+start
+                if cut>start:
+                    end = cut
+                else:
+                    end = int( numpy.searchsorted( store.resultIds[start:],
+                                                   store.resultIds[start], 'right' ) )+start
+            self.addColumns( store.resultIds[start:end], store.origLabelIds[start:end],
+                             store.labelIds[start:end], store.confidences[start:end],
+                             store.labels, foundLabelMap )
+            start = end
+
+    def getTruePositives( self ):
+        size = len(self.classNames)
+        return numpy.diagonal( self.matrix )[:size]
+
+    def getPrecision( self ):
+        '''Per-class precision: how many of the results found as a class
+        really were of that class'''
+        size = len(self.classNames)
+        return safeDivide( self.getTruePositives(), self.matrix[:,:size].sum( axis=0 ) )
+
+    def getRecall( self ):
+        '''Per-class recall: how many of the originals of a class were
+        found as that class'''
+        size = len(self.classNames)
+        return safeDivide( self.getTruePositives(), self.matrix[:size,:].sum( axis=1 ) )
+
+    def getF1( self ):
+        precision = self.getPrecision()
+        recall = self.getRecall()
+        return safeDivide( 2*precision*recall, precision+recall )
+
+    def getAccuracy( self ):
+        '''Fraction of labeled originals that were found as their class'''
+        size = len(self.classNames)
+        labeled = self.matrix[:size,:].sum()
+        return float( safeDivide( self.getTruePositives().sum(), labeled ) )
+
+    def printSummary( self ):
+        precision = self.getPrecision()
+        recall = self.getRecall()
+        f1 = self.getF1()
+        for idx in range( len(self.classNames) ):
+            print("{0}: precision {1:.3f}, recall {2:.3f}, F1 {3:.3f}".format(
+                self.classNames[idx], precision[idx], recall[idx], f1[idx] ))
+        print("accuracy: {0:.3f}".format( self.getAccuracy() ))
+
+def getBox( location ):
+    '''Return a BBox or PreciseBBox as corners (x1, y1, x2, y2),
+    or None for other kinds of locations'''
+    if type(location) is cvac.BBox:
+        return (location.x, location.y,
+                location.x+location.width, location.y+location.height)
+    if type(location) is cvac.PreciseBBox:
+        halfw = location.width/2.0
+        halfh = location.height/2.0
+        return (location.centerX-halfw, location.centerY-halfh,
+                location.centerX+halfw, location.centerY+halfh)
+    return None
+
+def computeIoU( boxesA, boxesB ):
+    '''Intersection over union of all pairs of boxes, given as arrays of
+    corners (x1, y1, x2, y2) of shape (N, 4) and (M, 4); returns (N, M).
+    Leading dimensions broadcast, so (N, 1, 4) and (N, K, 4) give the
+    IoU of each box in A with its own K boxes in B.'''
+    boxesA = numpy.asarray( boxesA, numpy.float64 )
+    boxesB = numpy.asarray( boxesB, numpy.float64 )
+    if boxesA.ndim==2 and boxesB.ndim==2:
+        boxesA = boxesA[:,numpy.newaxis,:]
+        boxesB = boxesB[numpy.newaxis,:,:]
+    width = numpy.minimum( boxesA[...,2], boxesB[...,2] ) \
+        - numpy.maximum( boxesA[...,0], boxesB[...,0] )
+    height = numpy.minimum( boxesA[...,3], boxesB[...,3] ) \
+        - numpy.maximum( boxesA[...,1], boxesB[...,1] )
+    intersection = numpy.maximum( width, 0 )*numpy.maximum( height, 0 )
+    areaA = (boxesA[...,2]-boxesA[...,0])*(boxesA[...,3]-boxesA[...,1])
+    areaB = (boxesB[...,2]-boxesB[...,0])*(boxesB[...,3]-boxesB[...,1])
+    return safeDivide( intersection, areaA+areaB-intersection )
+
+def matchDetections( gtGroups, gtBoxes, detGroups, detScores, detBoxes,
+                     iouThreshold=0.5 ):
+    '''Greedily match detections to ground truth boxes within groups,
+    such as (image, class) pairs.  Within each group, detections are
+    taken in order of decreasing score, and each one claims the
+    unclaimed ground truth box it overlaps most, if the IoU reaches the
+    threshold.  All groups are processed at once, one rank of detections
+    after the other; each rank compares its detections only with the
+    ground truth boxes of their own groups, so memory stays in the
+    order of the number of boxes however sparse the group ids are.
+    Returns a boolean array marking the detections that are true
+    positives.'''
+    gtGroups = numpy.asarray( gtGroups, numpy.int64 )
+    detGroups = numpy.asarray( detGroups, numpy.int64 )
+    isTP = numpy.zeros( len(detGroups), bool )
+    if len(gtGroups)==0 or len(detGroups)==0:
+        return isTP
+
+    # number the groups that have ground truth 0..numGroups-1; detections
+    # in other groups cannot match anything
+    groupIds, gtGroups = numpy.unique( gtGroups, return_inverse=True )
+    numGroups = len( groupIds )
+    detIds = numpy.searchsorted( groupIds, detGroups )
+    inPlay = numpy.nonzero( groupIds[numpy.minimum( detIds, numGroups-1 )]==detGroups )[0]
+    if len(inPlay)==0:
+        return isTP
+    detGroups = detIds[inPlay]
+    detScores = numpy.asarray( detScores, numpy.float64 )[inPlay]
+    detBoxes = numpy.asarray( detBoxes, numpy.float64 )[inPlay]
+
+    # ground truth boxes sorted by group
+    order = numpy.argsort( gtGroups, kind='mergesort' )
+    gtBoxes = numpy.asarray( gtBoxes, numpy.float64 )[order]
+    counts = numpy.bincount( gtGroups, minlength=numGroups )
+    starts = numpy.concatenate( ([0], numpy.cumsum( counts )[:-1]) )
+    claimed = numpy.zeros( len(gtBoxes), bool )
+
+    # rank of each detection within its group
+    order = numpy.lexsort( (-detScores, detGroups) )
+    detCounts = numpy.bincount( detGroups, minlength=numGroups )
+    detStarts = numpy.concatenate( ([0], numpy.cumsum( detCounts )[:-1]) )
+    ranks = numpy.empty( len(detGroups), numpy.int64 )
+    ranks[order] = numpy.arange( len(detGroups) )-detStarts[detGroups[order]]
+    byRank = numpy.argsort( ranks, kind='mergesort' )
+    bounds = numpy.searchsorted( ranks[byRank], numpy.arange( ranks.max()+2 ) )
+
+    for rank in range( len(bounds)-1 ):
+        dets = byRank[bounds[rank]:bounds[rank+1]]
+        groups = detGroups[dets]
+        # one pair per detection and ground truth box of its group
+        pairCounts = counts[groups]
+        pairDets = numpy.repeat( numpy.arange( len(dets) ), pairCounts )
+        pairStarts = numpy.concatenate( ([0], numpy.cumsum( pairCounts )[:-1]) )
+        pairGT = starts[groups][pairDets] \
+            + numpy.arange( len(pairDets) )-pairStarts[pairDets]
+        ious = computeIoU( detBoxes[dets][pairDets][:,numpy.newaxis,:],
+                           gtBoxes[pairGT][:,numpy.newaxis,:] )[:,0]
+        ious[claimed[pairGT]] = -1
+        # the best pair of each detection sorts last; on ties, the first box
+        order = numpy.lexsort( (-numpy.arange( len(pairDets) ), ious, pairDets) )
+        best = order[numpy.cumsum( pairCounts )-1]
+        hit = ious[best]>=iouThreshold
+        isTP[inPlay[dets[hit]]] = True
+        # every group has at most one detection per rank, so no conflicts
+        claimed[pairGT[best[hit]]] = True
+    return isTP
+
+def getPrecisionRecall( scores, isTP, numGroundTruth ):
+    '''Return precision, recall and average precision for detections with
+    the given scores and true-positive flags.  Average precision is the
+    area under the interpolated (monotonic) precision/recall curve.'''
+    order = numpy.argsort( -numpy.asarray( scores ), kind='mergesort' )
+    hits = numpy.asarray( isTP, bool )[order]
+    truePos = numpy.cumsum( hits )
+    falsePos = numpy.cumsum( ~hits )
+    recall = safeDivide( truePos, numGroundTruth*numpy.ones( len(hits) ) )
+    precision = safeDivide( truePos, truePos+falsePos )
+    if len(hits)==0:
+        return precision, recall, 0.0
+    envelope = numpy.maximum.accumulate( precision[::-1] )[::-1]
+    steps = numpy.diff( numpy.concatenate( ([0.0], recall) ) )
+    return precision, recall, float( (steps*envelope).sum() )
+
+def concatenate( arrays, dtype, emptyShape=(0,) ):
+    '''Concatenate batches of a column, or return an empty column if
+    there were none'''
+    if not arrays:
+        return numpy.zeros( emptyShape, dtype )
+    return numpy.concatenate( arrays )
+
+class BoxEvaluation(object):
+    '''Collects ground truth and detected boxes, from cvac.Results or as
+    arrays, and computes precision/recall curves, AP per class and mAP.
+    Images and class names are interned into integer ids.'''
+
+    def __init__( self, iouThreshold=0.5 ):
+        self.iouThreshold = iouThreshold
+        self.imageIds = {}
+        self.classIds = {}
+        self.classNames = []
+        self.gt = ([], [], [])
+        self.det = ([], [], [], [])
+        self.imagesWithDetections = set()
+
+    def getImageId( self, sub ):
+        key = (sub.path.directory.relativePath, sub.path.filename)
+        return self.imageIds.setdefault( key, len(self.imageIds) )
+
+    def getClassId( self, name ):
+        classId = self.classIds.get( name )
+        if classId is None:
+            classId = len( self.classNames )
+            self.classIds[name] = classId
+            self.classNames.append( name )
+        return classId
+
+    def addGroundTruth( self, imageIds, classIds, boxes ):
+        '''Add ground truth boxes as arrays; boxes are (x1, y1, x2, y2)'''
+        self.gt[0].append( numpy.asarray( imageIds, numpy.int64 ) )
+        self.gt[1].append( numpy.asarray( classIds, numpy.int64 ) )
+        self.gt[2].append( numpy.asarray( boxes, numpy.float64 ).reshape( -1, 4 ) )
+
+    def addDetections( self, imageIds, classIds, scores, boxes ):
+        '''Add detected boxes as arrays; boxes are (x1, y1, x2, y2)'''
+        self.det[0].append( numpy.asarray( imageIds, numpy.int64 ) )
+        self.det[1].append( numpy.asarray( classIds, numpy.int64 ) )
+        self.det[2].append( numpy.asarray( scores, numpy.float64 ) )
+        self.det[3].append( numpy.asarray( boxes, numpy.float64 ).reshape( -1, 4 ) )
+
+    def addResults( self, results, foundLabelMap=None ):
+        '''Add the boxes of a batch of cvac.Results.  The original of
+        each result is a ground truth box if it is a LabeledLocation; an
+        image with several ground truth boxes comes as several results,
+        and only the found labels of the first of them are used.'''
+        gt = ([], [], [])
+        det = ([], [], [], [])
+        for res in results:
+            imageId = self.getImageId( res.original.sub )
+            orig = res.original
+            if isinstance( orig, cvac.LabeledLocation ) and orig.lab.hasLabel:
+                box = getBox( orig.loc )
+                if box:
+                    gt[0].append( imageId )
+                    gt[1].append( self.getClassId( orig.lab.name ) )
+                    gt[2].append( box )
+            if imageId in self.imagesWithDetections:
+                continue
+            self.imagesWithDetections.add( imageId )
+            for found in res.foundLabels:
+                if not isinstance( found, cvac.LabeledLocation ):
+                    continue
+                box = getBox( found.loc )
+                if not box:
+                    continue
+                name = found.lab.name
+                if foundLabelMap and name in foundLabelMap:
+                    name = foundLabelMap[name]
+                det[0].append( imageId )
+                det[1].append( self.getClassId( name ) )
+                det[2].append( found.confidence )
+                det[3].append( box )
+        self.addGroundTruth( *gt )
+        self.addDetections( *det )
+
+    def evaluate( self ):
+        '''Return a dictionary from class name to a dictionary with
+        'precision', 'recall' (arrays in order of decreasing score),
+        'ap' and 'numGroundTruth'; the key 'mAP' holds the mean AP
+        over all classes that have ground truth.'''
+        gtImages = concatenate( self.gt[0], numpy.int64 )
+        gtClasses = concatenate( self.gt[1], numpy.int64 )
+        gtBoxes = concatenate( self.gt[2], numpy.float64, (0, 4) )
+        detImages = concatenate( self.det[0], numpy.int64 )
+        detClasses = concatenate( self.det[1], numpy.int64 )
+        detScores = concatenate( self.det[2], numpy.float64 )
+        detBoxes = concatenate( self.det[3], numpy.float64, (0, 4) )
+        numClasses = max( len(self.classNames), 1 )
+        isTP = matchDetections( gtImages*numClasses+gtClasses, gtBoxes,
+                                detImages*numClasses+detClasses, detScores, detBoxes,
+                                self.iouThreshold )
+        numGT = numpy.bincount( gtClasses, minlength=numClasses )
+        evaluation = {}
+        aps = []
+        for classId in range( len(self.classNames) ):
+            mine = detClasses==classId
+            precision, recall, ap = getPrecisionRecall( detScores[mine], isTP[mine],
+                                                        numGT[classId] )
+            evaluation[self.classNames[classId]] = {
+                'precision':precision, 'recall':recall, 'ap':ap,
+                'numGroundTruth':int( numGT[classId] )}
+            if numGT[classId]>0:
+                aps.append( ap )
+        evaluation['mAP'] = aps and float( numpy.mean( aps ) ) or 0.0
+        return evaluation
@@ -0,0 +1,81 @@
+#
+# Easy Computer Vision
+#
+# imageinfo.py reads the dimensions of JPEG, PNG, GIF and BMP images
+# from their file headers, without decoding any pixels.
+#
+import struct
+
+def getPNGSize( head, fin ):
+    if head[12:16]!=b"IHDR":
+        return None
+    return struct.unpack( ">II", head[16:24] )
+
+def getGIFSize( head, fin ):
+    return struct.unpack( "<HH", head[6:10] )
+
+def getBMPSize( head, fin ):
+    headerSize = struct.unpack( "<I", head[14:18] )[0]
+    if headerSize==12:
+        return struct.unpack( "<HH", head[18:22] )
+    width, height = struct.unpack( "<ii", head[18:26] )
+    # bottom-up bitmaps have a negative height
+    return (width, abs( height ))
+
+def getJPEGSize( head, fin ):
+    '''Skip from marker to marker up to the start of frame'''
+    fin.seek( 2 )
+    while True:
+        byte = fin.read( 1 )
+        while byte and byte!=b"\xff":
+            byte = fin.read( 1 )
+        while byte==b"\xff":
+            byte = fin.read( 1 )
+        if not byte:
+            return None
+        marker = ord( byte )
+        if marker in (0xd8, 0x01) or 0xd0<=marker<=0xd7:
+            # markers without a segment
+            continue
+        if marker==0xd9 or marker==0xda:
+            # end of image or start of scan before any frame
+            return None
+        segment = fin.read( 2 )
+        if len( segment )<2:
+            return None
+        length = struct.unpack( ">H", segment )[0]
+        if 0xc0<=marker<=0xcf and not marker in (0xc4, 0xc8, 0xcc):
+            frame = fin.read( 5 )
+            if len( frame )<5:
+                return None
+            height, width = struct.unpack( ">HH", frame[1:5] )
+            return (width, height)
+        fin.seek( length-2, 1 )
+
+# extensions of image files, including formats that getImageSize
+# does not read
+imageExtensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp',
+                   '.tif', '.tiff', '.pgm', '.ppm', '.pbm')
+
+# (magic bytes, reader) for each format
+formats = [(b"\x89PNG\r\n\x1a\n", getPNGSize),
+           (b"GIF87a", getGIFSize),
+           (b"GIF89a", getGIFSize),
+           (b"BM", getBMPSize),
+           (b"\xff\xd8", getJPEGSize)]
+
+def getImageSize( fsPath ):
+    '''(width, height) of the image file, or None if it is not in a
+    known format or its header is damaged'''
+    fin = open( fsPath, 'rb' )
+    try:
+        head = fin.read( 32 )
+        for magic, reader in formats:
+            if head.startswith( magic ):
+                try:
+                    return reader( head, fin )
+                except struct.error:
+                    return None
+        return None
+    finally:
+        fin.close()
@@ -0,0 +1,237 @@
+#
+# Easy Computer Vision
+#
+# instrumentation.py times the remote calls that easy makes and
+# records when callbacks arrive, per operation and service endpoint.
+# It is only active after easy.enableInstrumentation().
+#
+from __future__ import print_function
+import time
+import math
+import json
+import threading
+
+try:
+    stringTypes = (basestring, bytearray)
+    numberTypes = (int, long, float)
+except NameError:
+    stringTypes = (str, bytes, bytearray)
+    numberTypes = (int, float)
+
+def estimateSize( value ):
+    '''A rough estimate of the number of bytes that Ice marshals for a
+    value: strings and byte sequences count with their length, numbers
+    with 8 bytes, and structs and classes with the sum of their members.'''
+    if value is None or isinstance( value, bool ):
+        return 1
+    if isinstance( value, numberTypes ):
+        return 8
+    if isinstance( value, stringTypes ) or type(value).__name__ in ('memoryview', 'buffer'):
+        return len( value )+1
+    if isinstance( value, (list, tuple) ):
+        return 1+sum( [estimateSize( item ) for item in value] )
+    if isinstance( value, dict ):
+        size = 1
+        for key in value:
+            size += estimateSize( key )+estimateSize( value[key] )
+        return size
+    if hasattr( value, '__dict__' ):
+        size = 0
+        for name in vars( value ):
+            if not name.startswith( '_' ):
+                size += estimateSize( getattr( value, name ) )
+        # enumerators have nothing but private members
+        return size or 1
+    return 8
+
+def getBucket( seconds ):
+    '''The histogram bucket of a latency: bucket b holds latencies of up
+    to 2**b microseconds'''
+    micros = seconds*1e6
+    if micros<=1:
+        return 0
+    return int( math.ceil( math.log( micros, 2 ) ) )
+
+class OperationStats(object):
+    '''Counts, estimated bytes and latencies of one operation on one
+    endpoint'''
+
+    def __init__( self, endpoint, operation ):
+        self.endpoint = endpoint
+        self.operation = operation
+        self.count = 0
+        self.errors = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+        self.histogram = {}
+
+    def add( self, seconds, sent, received, failed ):
+        self.count += 1
+        if failed:
+            self.errors += 1
+        self.bytesSent += sent
+        self.bytesReceived += received
+        self.totalSeconds += seconds
+        self.maxSeconds = max( self.maxSeconds, seconds )
+        bucket = getBucket( seconds )
+        self.histogram[bucket] = self.histogram.get( bucket, 0 )+1
+
+    def getMeanSeconds( self ):
+        if not self.count:
+            return 0.0
+        return self.totalSeconds/self.count
+
+    def toDict( self ):
+        histogram = {}
+        for bucket in self.histogram:
+            histogram["<={0}us".format( 2**bucket )] = self.histogram[bucket]
+        return {'endpoint':self.endpoint, 'operation':self.operation,
+                'count':self.count, 'errors':self.errors,
+                'bytesSent':self.bytesSent, 'bytesReceived':self.bytesReceived,
+                'totalSeconds':self.totalSeconds, 'meanSeconds':self.getMeanSeconds(),
+                'maxSeconds':self.maxSeconds, 'histogram':histogram}
+
+class Instrumentation(object):
+    '''Collects OperationStats for remote calls, keyed by
+    (endpoint, operation), and the arrival times of callbacks, keyed by
+    callback operation.  If sizes is False, bytes are not estimated,
+    which is cheaper for calls with large arguments.'''
+
+    def __init__( self, sizes=True ):
+        self.sizes = sizes
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stats = {}
+        self.callbacks = {}
+
+    def reset( self ):
+        self.lock.acquire()
+        try:
+            self.started = time.time()
+            self.stats = {}
+            self.callbacks = {}
+        finally:
+            self.lock.release()
+
+    def recordCall( self, endpoint, operation, seconds, sent=0, received=0, failed=False ):
+        self.lock.acquire()
+        try:
+            key = (endpoint, operation)
+            stats = self.stats.get( key )
+            if stats is None:
+                stats = OperationStats( endpoint, operation )
+                self.stats[key] = stats
+            stats.add( seconds, sent, received, failed )
+        finally:
+            self.lock.release()
+
+    def recordCallback( self, operation ):
+        now = time.time()
+        self.lock.acquire()
+        try:
+            self.callbacks.setdefault( operation, [] ).append( now )
+        finally:
+            self.lock.release()
+
+    def timeCall( self, endpoint, operation, func, *args, **kwargs ):
+        '''Call func with args and keyword arguments, such as an Ice
+        context in _ctx, and record it as operation on endpoint'''
+        failed = True
+        received = 0
+        start = time.time()
+        try:
+            result = func( *args, **kwargs )
+            failed = False
+        finally:
+            seconds = time.time()-start
+            sent = 0
+            if self.sizes:
+                sent = estimateSize( list( args )+list( kwargs.values() ) )
+                if not failed:
+                    received = estimateSize( result )
+            self.recordCall( endpoint, operation, seconds, sent, received, failed )
+        return result
+
+    def wrap( self, proxy ):
+        '''Return an InstrumentedProxy for the proxy'''
+        if isinstance( proxy, InstrumentedProxy ):
+            return proxy
+        return InstrumentedProxy( proxy, self )
+
+    def getStats( self ):
+        '''A list of the OperationStats, sorted by endpoint and operation'''
+        self.lock.acquire()
+        try:
+            return [self.stats[key] for key in sorted( self.stats.keys() )]
+        finally:
+            self.lock.release()
+
+    def toDict( self ):
+        self.lock.acquire()
+        try:
+            callbacks = {}
+            for operation in self.callbacks:
+                # timestamps relative to when instrumentation started
+                callbacks[operation] = [stamp-self.started
+                                        for stamp in self.callbacks[operation]]
+        finally:
+            self.lock.release()
+        return {'started':self.started,
+                'calls':[stats.toDict() for stats in self.getStats()],
+                'callbacks':callbacks}
+
+    def dump( self, filename=None ):
+        '''Return the statistics as JSON, and write them to the file
+        if a filename is given'''
+        text = json.dumps( self.toDict(), indent=2, sort_keys=True )
+        if filename:
+            fout = open( filename, 'w' )
+            try:
+                fout.write( text )
+            finally:
+                fout.close()
+        return text
+
+    def printSummary( self ):
+        for stats in self.getStats():
+            print("{0} {1}: {2} calls, {3} errors, mean {4:.2f} ms, max {5:.2f} ms, "
+                  "{6} bytes sent, {7} received".format(
+                      stats.endpoint, stats.operation, stats.count, stats.errors,
+                      1000*stats.getMeanSeconds(), 1000*stats.maxSeconds,
+                      stats.bytesSent, stats.bytesReceived ))
+        for operation in sorted( self.callbacks.keys() ):
+            print("callback {0}: {1} calls".format(
+                operation, len( self.callbacks[operation] ) ))
+
+class InstrumentedProxy(object):
+    '''Forwards to an Ice proxy and records each remote call.  The ice_*
+    methods and other attributes are passed through unchanged.'''
+
+    def __init__( self, proxy, instrumentation ):
+        self.proxy = proxy
+        self.instrumentation = instrumentation
+        self.endpoint = proxy.ice_toString()
+
+    def __getattr__( self, name ):
+        attr = getattr( self.proxy, name )
+        if name.startswith( 'ice_' ) or name.startswith( 'begin_' ) \
+                or name.startswith( 'end_' ) or not callable( attr ):
+            return attr
+        instrumentation = self.instrumentation
+        endpoint = self.endpoint
+        def call( *args, **kwargs ):
+            return instrumentation.timeCall( endpoint, name, attr, *args, **kwargs )
+        return call
+
+    def __eq__( self, other ):
+        if isinstance( other, InstrumentedProxy ):
+            other = other.proxy
+        return self.proxy==other
+
+    def __ne__( self, other ):
+        return not self==other
+
+    def __hash__( self ):
+        return hash( self.proxy )
@@ -0,0 +1,294 @@
+#
+# Easy Computer Vision
+#
+# labelindex.py stores large sets of Labelables column by column in
+# NumPy arrays instead of as lists of cvac.Labelable Ice objects.
+# Labelable objects are only created again when a RunSet is built.
+#
+from __future__ import print_function
+import numpy
+import paths
+import cvac
+
+# what kind of Labelable a row holds
+KIND_LABELABLE = 0
+KIND_FULLSUBSTRATE = 1
+KIND_BBOX = 2
+KIND_PRECISEBBOX = 3
+KIND_OTHER = 4
+
+# indexed by cvac.PurposeType value
+purposeTypes = [cvac.PurposeType.UNLABELED, cvac.PurposeType.POSITIVE,
+                cvac.PurposeType.NEGATIVE, cvac.PurposeType.MULTICLASS,
+                cvac.PurposeType.ANY]
+
+class LabelIndex(object):
+    '''A columnar store of Labelables.  Label names and file paths are
+    interned into the labels and paths lists; each row holds the ids
+    into those, the purpose, confidence, substrate flags and size, and
+    a bounding box (x, y, width, height) for BBox and PreciseBBox
+    locations, NaN otherwise.  Labelables with other locations, such as
+    video segments, are kept as objects in the extras dictionary.'''
+
+    def __init__( self ):
+        self.labels = []
+        self.labelLookup = {}
+        self.paths = []
+        self.labelIds = numpy.zeros( 0, numpy.int32 )
+        self.pathIds = numpy.zeros( 0, numpy.int32 )
+        self.hasLabel = numpy.zeros( 0, bool )
+        self.purposeTypes = numpy.zeros( 0, numpy.int8 )
+        self.classIds = numpy.zeros( 0, numpy.int32 )
+        self.confidences = numpy.zeros( 0, numpy.float32 )
+        self.isImage = numpy.zeros( 0, bool )
+        self.isVideo = numpy.zeros( 0, bool )
+        self.sizes = numpy.zeros( (0, 2), numpy.int32 )
+        self.kinds = numpy.zeros( 0, numpy.int8 )
+        self.boxes = numpy.zeros( (0, 4), numpy.float32 )
+        # sparse per-row data, by row number
+        self.properties = {}
+        self.semantics = {}
+        self.extras = {}
+        self._categoryRows = None
+
+    def __len__( self ):
+        return len( self.labelIds )
+
+    @staticmethod
+    def fromLabelables( labelList, purpose=None ):
+        '''Create an index from a list of Labelables, such as the one
+        returned by easy.getDataSet'''
+        builder = _Builder()
+        for lb in labelList:
+            builder.add( lb, purpose )
+        return builder.build()
+
+    @staticmethod
+    def fromRunSet( runset ):
+        '''Create an index from the PurposedLabelableSeq entries of a RunSet,
+        keeping their purposes'''
+        builder = _Builder()
+        for plist in runset.purposedLists:
+            if not type(plist) is cvac.PurposedLabelableSeq:
+                raise RuntimeError("cannot index", type(plist))
+            for lb in plist.labeledArtifacts:
+                builder.add( lb, plist.pur )
+        return builder.build()
+
+    def getLabelId( self, name ):
+        '''Return the id of a label name, or -1 if it does not occur'''
+        return self.labelLookup.get( name, -1 )
+
+    def getCategoryRows( self, name ):
+        '''Return the rows with the given label name as an array'''
+        if self._categoryRows is None:
+            # group all rows by label id once; afterwards lookups are O(1)
+            order = numpy.argsort( self.labelIds, kind='mergesort' )
+            bounds = numpy.searchsorted( self.labelIds[order],
+                                         numpy.arange( len(self.labels)+1 ) )
+            self._categoryRows = {}
+            for labelId in range( len(self.labels) ):
+                self._categoryRows[self.labels[labelId]] = \
+                    order[bounds[labelId]:bounds[labelId+1]]
+        return self._categoryRows.get( name, numpy.zeros( 0, numpy.intp ) )
+
+    def select( self, labels=None, minConfidence=None, hasBox=None,
+                purposeType=None, isVideo=None ):
+        '''Return the rows that match all of the given criteria'''
+        mask = numpy.ones( len(self), bool )
+        if labels is not None:
+            # unknown names map to the extra last slot, which no row uses
+            wanted = numpy.zeros( len(self.labels)+1, bool )
+            wanted[[self.getLabelId( name ) for name in labels]] = True
+            mask &= wanted[self.labelIds]
+        if minConfidence is not None:
+            mask &= self.confidences>=minConfidence
+        if hasBox is not None:
+            mask &= ~numpy.isnan( self.boxes[:,0] )==hasBox
+        if purposeType is not None:
+            mask &= self.purposeTypes==purposeType.value
+        if isVideo is not None:
+            mask &= self.isVideo==isVideo
+        return numpy.nonzero( mask )[0]
+
+    def stratifiedSample( self, perCategory=None, fraction=None, rows=None, seed=None ):
+        '''Randomly pick rows so that every label is represented with
+        perCategory rows, or with the given fraction of its rows;
+        exactly one of them has to be given.'''
+        if (perCategory is None)==(fraction is None):
+            raise RuntimeError("stratifiedSample needs either perCategory or fraction")
+        if rows is None:
+            rows = numpy.arange( len(self) )
+        rng = numpy.random.RandomState( seed )
+        rows = rows[rng.permutation( len(rows) )]
+        # group the shuffled rows by label, then rank them within the group
+        rows = rows[numpy.argsort( self.labelIds[rows], kind='mergesort' )]
+        ids = self.labelIds[rows]
+        counts = numpy.bincount( ids, minlength=len(self.labels) )
+        starts = numpy.concatenate( ([0], numpy.cumsum( counts )[:-1]) )
+        ranks = numpy.arange( len(rows) )-starts[ids]
+        if fraction is not None:
+            quota = numpy.ceil( counts*fraction ).astype( numpy.int64 )
+        else:
+            quota = numpy.minimum( counts, perCategory )
+        return numpy.sort( rows[ranks<quota[ids]] )
+
+    def subset( self, rows ):
+        '''Return a new LabelIndex with only the given rows'''
+        sub = LabelIndex()
+        sub.labels = self.labels
+        sub.labelLookup = self.labelLookup
+        sub.paths = self.paths
+        for name in ('labelIds', 'pathIds', 'hasLabel', 'purposeTypes', 'classIds',
+                     'confidences', 'isImage', 'isVideo', 'sizes', 'kinds', 'boxes'):
+            setattr( sub, name, getattr( self, name )[rows] )
+        # map the sparse per-row data to the new row numbers
+        newRows = -numpy.ones( len(self), numpy.int64 )
+        newRows[rows] = numpy.arange( len(rows) )
+        for name in ('properties', 'semantics', 'extras'):
+            old = getattr( self, name )
+            new = getattr( sub, name )
+            for oldRow in old:
+                if newRows[oldRow]>=0:
+                    new[int(newRows[oldRow])] = old[oldRow]
+        return sub
+
+    def getPath( self, row ):
+        relativePath, filename = self.paths[self.pathIds[row]]
+        return cvac.FilePath( cvac.DirectoryPath( relativePath ), filename )
+
+    def getPurpose( self, row ):
+        return cvac.Purpose( purposeTypes[self.purposeTypes[row]], int(self.classIds[row]) )
+
+    def getLabelable( self, row ):
+        '''Create the cvac.Labelable for one row'''
+        row = int( row )
+        if row in self.extras:
+            return self.extras[row]
+        width, height = self.sizes[row]
+        sub = cvac.Substrate( bool(self.isImage[row]), bool(self.isVideo[row]),
+                              self.getPath( row ), int(width), int(height) )
+        label = cvac.Label( bool(self.hasLabel[row]), self.labels[self.labelIds[row]],
+                            self.properties.get( row, {} ),
+                            cvac.Semantics( self.semantics.get( row, "" ) ) )
+        confidence = float( self.confidences[row] )
+        kind = self.kinds[row]
+        if kind==KIND_FULLSUBSTRATE:
+            return cvac.LabeledFullSubstrate( confidence, label, sub )
+        if kind==KIND_BBOX:
+            x, y, w, h = [int(round(v)) for v in self.boxes[row]]
+            return cvac.LabeledLocation( confidence, label, sub, cvac.BBox( x, y, w, h ) )
+        if kind==KIND_PRECISEBBOX:
+            x, y, w, h = [float(v) for v in self.boxes[row]]
+            loc = cvac.PreciseBBox( x+w/2, y+h/2, w, h )
+            return cvac.LabeledLocation( confidence, label, sub, loc )
+        return cvac.Labelable( confidence, label, sub )
+
+    def getLabelables( self, rows=None ):
+        if rows is None:
+            rows = range( len(self) )
+        return [self.getLabelable( row ) for row in rows]
+
+    def getCategories( self, rows=None ):
+        '''Return a dictionary from label name to a list of Labelables,
+        like the one easy.getDataSet returns'''
+        if rows is None:
+            rows = numpy.arange( len(self) )
+        categories = {}
+        rows = rows[numpy.argsort( self.labelIds[rows], kind='mergesort' )]
+        ids = self.labelIds[rows]
+        bounds = numpy.nonzero( numpy.diff( ids ) )[0]+1
+        for group in numpy.split( rows, bounds ):
+            if len(group):
+                name = self.labels[self.labelIds[group[0]]]
+                categories[name] = self.getLabelables( group )
+        return categories
+
+    def getRunSet( self, rows=None ):
+        '''Create a cvac.RunSet from the rows, using their stored purposes'''
+        if rows is None:
+            rows = numpy.arange( len(self) )
+        keys = self.purposeTypes[rows].astype( numpy.int64 )*(1<<32) \
+            + self.classIds[rows].astype( numpy.int64 )
+        plists = []
+        for key in numpy.unique( keys ):
+            selected = rows[keys==key]
+            plists.append( cvac.PurposedLabelableSeq(
+                self.getPurpose( selected[0] ), self.getLabelables( selected ) ) )
+        return cvac.RunSet( plists )
+
+class _Builder(object):
+    '''Collects the columns of a LabelIndex in Python lists'''
+
+    def __init__( self ):
+        self.index = LabelIndex()
+        self.pathIdMap = {}
+        self.columns = {}
+        for name in ('labelIds', 'pathIds', 'hasLabel', 'purposeTypes', 'classIds',
+                     'confidences', 'isImage', 'isVideo', 'sizes', 'kinds', 'boxes'):
+            self.columns[name] = []
+
+    def intern( self, idMap, table, value ):
+        valueId = idMap.get( value )
+        if valueId is None:
+            valueId = len( table )
+            idMap[value] = valueId
+            table.append( value )
+        return valueId
+
+    def add( self, lb, purpose ):
+        row = len( self.columns['labelIds'] )
+        cols = self.columns
+        index = self.index
+        cols['labelIds'].append( self.intern( index.labelLookup, index.labels, lb.lab.name ) )
+        path = lb.sub.path
+        cols['pathIds'].append( self.intern( self.pathIdMap, index.paths,
+                                  (path.directory.relativePath, path.filename) ) )
+        cols['hasLabel'].append( lb.lab.hasLabel )
+        if purpose is None:
+            cols['purposeTypes'].append( cvac.PurposeType.UNLABELED.value )
+            cols['classIds'].append( 0 )
+        else:
+            cols['purposeTypes'].append( purpose.ptype.value )
+            cols['classIds'].append( purpose.classID )
+        cols['confidences'].append( lb.confidence )
+        cols['isImage'].append( lb.sub.isImage )
+        cols['isVideo'].append( lb.sub.isVideo )
+        cols['sizes'].append( (lb.sub.width, lb.sub.height) )
+        if lb.lab.properties:
+            index.properties[row] = lb.lab.properties
+        if lb.lab.semantix and lb.lab.semantix.url:
+            index.semantics[row] = lb.lab.semantix.url
+
+        kind = KIND_LABELABLE
+        box = (numpy.nan, numpy.nan, numpy.nan, numpy.nan)
+        if type(lb) is cvac.LabeledFullSubstrate:
+            kind = KIND_FULLSUBSTRATE
+        elif type(lb) is cvac.LabeledLocation and type(lb.loc) is cvac.BBox:
+            kind = KIND_BBOX
+            box = (lb.loc.x, lb.loc.y, lb.loc.width, lb.loc.height)
+        elif type(lb) is cvac.LabeledLocation and type(lb.loc) is cvac.PreciseBBox:
+            kind = KIND_PRECISEBBOX
+            box = (lb.loc.centerX-lb.loc.width/2.0, lb.loc.centerY-lb.loc.height/2.0,
+                   lb.loc.width, lb.loc.height)
+        elif not type(lb) is cvac.Labelable:
+            kind = KIND_OTHER
+            index.extras[row] = lb
+        cols['kinds'].append( kind )
+        cols['boxes'].append( box )
+
+    def build( self ):
+        index = self.index
+        cols = self.columns
+        index.labelIds = numpy.array( cols['labelIds'], numpy.int32 )
+        index.pathIds = numpy.array( cols['pathIds'], numpy.int32 )
+        index.hasLabel = numpy.array( cols['hasLabel'], bool )
+        index.purposeTypes = numpy.array( cols['purposeTypes'], numpy.int8 )
+        index.classIds = numpy.array( cols['classIds'], numpy.int32 )
+        index.confidences = numpy.array( cols['confidences'], numpy.float32 )
+        index.isImage = numpy.array( cols['isImage'], bool )
+        index.isVideo = numpy.array( cols['isVideo'], bool )
+        index.sizes = numpy.array( cols['sizes'], numpy.int32 ).reshape( -1, 2 )
+        index.kinds = numpy.array( cols['kinds'], numpy.int8 )
+        index.boxes = numpy.array( cols['boxes'], numpy.float32 ).reshape( -1, 4 )
+        return index
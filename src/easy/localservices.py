@@ -0,0 +1,501 @@
+#
+# Easy Computer Vision
+#
+# localservices.py contains in-process stand-ins for CVAC services.
+# They implement the Slice interfaces in Python so that easy's client
+# side can be exercised without the Java and C++ services running.
+# Artificial latency and the size of the data they return can be
+# configured, so that they can also serve as benchmark back ends.
+#
+from __future__ import print_function
+import os
+import time
+import math
+import threading
+import paths
+import Ice
+import cvac
+import imageinfo
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+class LocalFileServiceI(cvac.FileService):
+    '''A FileService that stores files below a local root directory.
+    Like the Java FileServer, it only permits clients to overwrite and
+    delete files that they put there.  For testing interrupted transfers,
+    failOnChunk makes the n-th putFileChunk call (counting from 1) store
+    its bytes and then fail as if the connection had been lost.'''
+
+    def __init__( self, rootDir, failOnChunk=None ):
+        self.rootDir = rootDir
+        self.failOnChunk = failOnChunk
+        self.owned = set()
+        self.chunkCalls = 0
+        self.existsCalls = 0
+        self.snapshotCalls = 0
+        self.propertiesCalls = 0
+        self.getChunkCalls = 0
+        self.largestReply = 0
+        self.bytesReceived = 0
+        self.largestRequest = 0
+
+    def getLocalPath( self, file ):
+        fpath = file.directory.relativePath+"/"+file.filename
+        if fpath.startswith("/"):
+            raise cvac.FileServiceException("absolute paths not permitted")
+        if ".." in fpath:
+            raise cvac.FileServiceException("up paths not permitted")
+        return os.path.join( self.rootDir, fpath )
+
+    def checkPutPermission( self, localFile ):
+        if os.path.exists( localFile ) and not localFile in self.owned:
+            raise cvac.FileServiceException("no put permissions to this file")
+
+    def writeBytes( self, localFile, bytes, mode ):
+        parent = os.path.dirname( localFile )
+        if not os.path.exists( parent ):
+            os.makedirs( parent )
+        fout = open( localFile, mode )
+        try:
+            fout.write( bytes )
+        finally:
+            fout.close()
+        self.owned.add( localFile )
+        self.bytesReceived += len( bytes )
+        self.largestRequest = max( self.largestRequest, len( bytes ) )
+
+    def exists( self, file, current=None ):
+        self.existsCalls += 1
+        return os.path.exists( self.getLocalPath( file ) )
+
+    def putFile( self, file, bytes, current=None ):
+        localFile = self.getLocalPath( file )
+        if os.path.exists( localFile ):
+            # like the Java FileServer, never overwrite on a single put
+            raise cvac.FileServiceException("no put permissions to this file")
+        self.writeBytes( localFile, bytes, 'wb' )
+
+    def putFileChunk( self, file, offset, bytes, current=None ):
+        localFile = self.getLocalPath( file )
+        self.checkPutPermission( localFile )
+        if offset==0:
+            mode = 'wb'
+        else:
+            if not os.path.exists( localFile ):
+                raise cvac.FileServiceException("no put permissions to this file")
+            size = os.path.getsize( localFile )
+            if size!=offset:
+                raise cvac.FileServiceException(
+                    "chunk offset {0} does not match received size {1}".format(
+                        offset, size ))
+            mode = 'ab'
+        self.writeBytes( localFile, bytes, mode )
+        self.chunkCalls += 1
+        if self.chunkCalls==self.failOnChunk:
+            raise Ice.ConnectionLostException()
+
+    def getPutOffset( self, file, current=None ):
+        localFile = self.getLocalPath( file )
+        if not os.path.exists( localFile ):
+            return 0
+        self.checkPutPermission( localFile )
+        return os.path.getsize( localFile )
+
+    def getFile( self, file, current=None ):
+        localFile = self.getLocalPath( file )
+        if not os.path.exists( localFile ):
+            raise cvac.FileServiceException("no read permissions to this file")
+        fin = open( localFile, 'rb' )
+        try:
+            return fin.read()
+        finally:
+            fin.close()
+
+    def getFileChunk( self, file, offset, length, current=None ):
+        localFile = self.getLocalPath( file )
+        if not os.path.exists( localFile ):
+            raise cvac.FileServiceException("no read permissions to this file")
+        self.getChunkCalls += 1
+        fin = open( localFile, 'rb' )
+        try:
+            fin.seek( offset )
+            data = fin.read( length )
+        finally:
+            fin.close()
+        self.largestReply = max( self.largestReply, len( data ) )
+        return data
+
+    def deleteFile( self, file, current=None ):
+        localFile = self.getLocalPath( file )
+        if not os.path.exists( localFile ):
+            return
+        if not localFile in self.owned:
+            raise cvac.FileServiceException("no delete permissions to this file")
+        os.remove( localFile )
+        self.owned.discard( localFile )
+
+    def createSnapshot( self, file, current=None ):
+        # a stand-in: the "snapshot" is a copy of the file's first bytes
+        localFile = self.getLocalPath( file )
+        if not os.path.exists( localFile ):
+            raise cvac.FileServiceException("no read permissions to this file")
+        self.snapshotCalls += 1
+        fin = open( localFile, 'rb' )
+        try:
+            data = fin.read( 1024 )
+        finally:
+            fin.close()
+        snapName = os.path.splitext( file.filename )[0]+"_snap.jpg"
+        snapFile = os.path.join( os.path.dirname( localFile ), snapName )
+        fout = open( snapFile, 'wb' )
+        try:
+            fout.write( data )
+        finally:
+            fout.close()
+        # created for this client, which may delete it
+        self.owned.add( snapFile )
+        return cvac.FilePath( file.directory, snapName )
+
+    def getProperties( self, file, current=None ):
+        self.propertiesCalls += 1
+        localFile = self.getLocalPath( file )
+        exists = os.path.exists( localFile )
+        props = cvac.FileProperties()
+        props.bytesize = exists and os.path.getsize( localFile ) or 0
+        props.width = -1
+        props.height = -1
+        ext = os.path.splitext( localFile )[1].lower()
+        props.isImage = ext in ('.jpg', '.jpeg', '.png', '.gif')
+        if exists and props.isImage:
+            size = imageinfo.getImageSize( localFile )
+            if size:
+                props.width, props.height = size
+        props.isVideo = ext in ('.avi', '.wmv', '.mpg')
+        props.readPermitted = exists
+        props.writePermitted = localFile in self.owned
+        props.videoLength = cvac.VideoSeekTime( -1, -1 )
+        return props
+
+def createLabelables( count, numCategories=2, withBoxes=False,
+                      numProperties=0, directory="local" ):
+    '''Create count Labelables for images in the given directory,
+    spread evenly over numCategories labels named "cat0", "cat1", ...
+    The labels carry numProperties properties each, and the Labelables
+    are LabeledLocations with a BBox if withBoxes is set.'''
+    labelables = []
+    dirPath = cvac.DirectoryPath( directory )
+    for idx in range( count ):
+        properties = {}
+        for pidx in range( numProperties ):
+            properties["property{0}".format( pidx )] = "value{0}".format( idx )
+        label = cvac.Label( True, "cat{0}".format( idx % numCategories ),
+                            properties, cvac.Semantics() )
+        sub = cvac.Substrate( True, False,
+                              cvac.FilePath( dirPath, "img{0}.jpg".format( idx ) ),
+                              640, 480 )
+        if withBoxes:
+            box = cvac.BBox( idx % 600, idx % 440, 40, 40 )
+            labelables.append( cvac.LabeledLocation( 1.0, label, sub, box ) )
+        else:
+            labelables.append( cvac.Labelable( 1.0, label, sub ) )
+    return labelables
+
+class LocalCorpusServiceI(cvac.CorpusService):
+    '''A CorpusService that keeps its corpora in memory.  Corpora are
+    created by openCorpus and createCorpus, named after the file or
+    directory, and filled with addLabelable or the dataSets argument,
+    a dictionary from corpus name to LabelableList.  Each call takes at
+    least latency seconds.  A corpus whose name is in needMirror
+    requires a local mirror before getDataSet works.'''
+
+    def __init__( self, dataSets=None, latency=0.0, needMirror=() ):
+        self.dataSets = dict( dataSets or {} )
+        self.versions = {}
+        self.mirrored = set()
+        self.needMirror = set( needMirror )
+        self.latency = latency
+        self.getDataSetCalls = 0
+        self.lock = threading.Lock()
+
+    def wait( self ):
+        if self.latency>0:
+            time.sleep( self.latency )
+
+    def getCorpus( self, name ):
+        self.lock.acquire()
+        try:
+            self.dataSets.setdefault( name, [] )
+            self.versions.setdefault( name, 0 )
+        finally:
+            self.lock.release()
+        return cvac.Corpus( name, "in-process corpus", "",
+                            name in self.needMirror )
+
+    def openCorpus( self, file, current=None ):
+        self.wait()
+        return self.getCorpus( os.path.splitext( file.filename )[0] )
+
+    def saveCorpus( self, corp, file, current=None ):
+        self.wait()
+
+    def getDataSetRequiresLocalMirror( self, corp, current=None ):
+        self.wait()
+        return corp.name in self.needMirror
+
+    def localMirrorExists( self, corp, current=None ):
+        self.wait()
+        return corp.name in self.mirrored
+
+    def createLocalMirror( self, corp, cb, current=None ):
+        self.wait()
+        callback = cvac.CorpusCallbackPrx.uncheckedCast( current.con.createProxy( cb ) )
+        callback.corpusMirrorProgress( corp, 1, 1, "mirroring", "in memory", 1.0 )
+        self.lock.acquire()
+        try:
+            self.mirrored.add( corp.name )
+            self.versions[corp.name] = self.versions.get( corp.name, 0 )+1
+        finally:
+            self.lock.release()
+        callback.corpusMirrorCompleted( corp )
+
+    def getDataSet( self, corp, current=None ):
+        self.wait()
+        self.getDataSetCalls += 1
+        if corp.name in self.needMirror and not corp.name in self.mirrored:
+            raise RuntimeError("local mirror required for "+corp.name)
+        return self.dataSets.get( corp.name, [] )
+
+    def getDataSetVersion( self, corp, current=None ):
+        self.wait()
+        return "local:{0}:{1}".format( id( self ), self.versions.get( corp.name, 0 ) )
+
+    def addLabelable( self, corp, addme, current=None ):
+        self.wait()
+        self.lock.acquire()
+        try:
+            self.dataSets.setdefault( corp.name, [] ).extend( addme )
+            self.versions[corp.name] = self.versions.get( corp.name, 0 )+1
+        finally:
+            self.lock.release()
+
+    def createCorpus( self, dir, current=None ):
+        self.wait()
+        return self.getCorpus( os.path.basename( dir.relativePath.rstrip("/") ) )
+
+def getRunSetLabelables( runset ):
+    '''All Labelables that a RunSet lists explicitly'''
+    labelables = []
+    for plist in runset.purposedLists:
+        if isinstance( plist, cvac.PurposedLabelableSeq ):
+            labelables.extend( plist.labeledArtifacts )
+    return labelables
+
+class LocalAlgorithmServiceI(object):
+    '''The CVAlgorithmService part of the stand-in Detector and
+    DetectorTrainer'''
+
+    def __init__( self, name, latency ):
+        self.name = name
+        self.latency = latency
+        self.initialized = False
+        self.verbosity = 0
+        self.initializeCalls = 0
+        self.processCalls = 0
+
+    def wait( self ):
+        if self.latency>0:
+            time.sleep( self.latency )
+
+    def isInitialized( self, current=None ):
+        return self.initialized
+
+    def destroy( self, current=None ):
+        self.initialized = False
+
+    def getName( self, current=None ):
+        return self.name
+
+    def getDescription( self, current=None ):
+        return "in-process stand-in for a CVAC service"
+
+    def setVerbosity( self, verbosity, current=None ):
+        self.verbosity = verbosity
+
+class LocalDetectorI(LocalAlgorithmServiceI, cvac.Detector):
+    '''A Detector that finds foundPerResult boxes in every Labelable of
+    the RunSet, labeled with class IDs "0" .. numClasses-1.  Results go
+    back in batches of batchSize, each preceded by latency seconds;
+    initialize and process take latency seconds as well.
+    In a LabeledVideoSegment, the boxes are found as LabeledVideoSegments
+    over the whole segment, with the same class IDs in every segment.'''
+
+    def __init__( self, latency=0.0, batchSize=10, foundPerResult=1,
+                  numClasses=2, name="LocalDetector" ):
+        LocalAlgorithmServiceI.__init__( self, name, latency )
+        self.batchSize = batchSize
+        self.foundPerResult = foundPerResult
+        self.numClasses = numClasses
+        self.detectorData = None
+
+    def initialize( self, verbosity, data, current=None ):
+        self.wait()
+        self.verbosity = verbosity
+        self.detectorData = data
+        self.initialized = True
+        self.initializeCalls += 1
+
+    def getResult( self, original, index ):
+        found = []
+        for fidx in range( self.foundPerResult ):
+            isSegment = isinstance( original, cvac.LabeledVideoSegment )
+            classID = (fidx+(not isSegment and index or 0)) % self.numClasses
+            label = cvac.Label( True, str( classID ), {}, cvac.Semantics() )
+            box = cvac.BBox( 10*fidx, 10*fidx, 40, 40 )
+            if isSegment:
+                found.append( cvac.LabeledVideoSegment( 1.0/(fidx+1), label, original.sub,
+                                                        original.start, original.last,
+                                                        None, None, box ) )
+                continue
+            found.append( cvac.LabeledLocation( 1.0/(fidx+1), label, original.sub, box ) )
+        return cvac.Result( original, found )
+
+    def process( self, client, run, current=None ):
+        if not self.initialized:
+            raise RuntimeError("detector not initialized")
+        self.wait()
+        self.processCalls += 1
+        callback = cvac.DetectorCallbackHandlerPrx.uncheckedCast(
+            current.con.createProxy( client ) )
+        labelables = getRunSetLabelables( run )
+        numBatches = (len( labelables )+self.batchSize-1)//self.batchSize
+        callback.estimatedTotalRuntime( int( math.ceil( self.latency*numBatches ) ) )
+        callback.message( 3, "processing {0} artifacts".format( len( labelables ) ) )
+        for start in range( 0, len( labelables ), self.batchSize ):
+            batch = labelables[start:start+self.batchSize]
+            results = [self.getResult( lb, start+idx ) for idx, lb in enumerate( batch )]
+            self.wait()
+            callback.foundNewResults( cvac.ResultSetV2( results ) )
+
+    def getDetectorProperties( self, current=None ):
+        return None
+
+class LocalDetectorTrainerI(LocalAlgorithmServiceI, cvac.DetectorTrainer):
+    '''A DetectorTrainer that "trains" by waiting latency seconds and
+    returns DetectorData that refers to the file detectorFile'''
+
+    def __init__( self, latency=0.0, detectorFile="detectors/local.zip",
+                  name="LocalDetectorTrainer" ):
+        LocalAlgorithmServiceI.__init__( self, name, latency )
+        self.detectorFile = detectorFile
+        self.runsets = []
+
+    def initialize( self, verbosity, current=None ):
+        self.verbosity = verbosity
+        self.initialized = True
+        self.initializeCalls += 1
+
+    def process( self, client, run, current=None ):
+        self.wait()
+        self.processCalls += 1
+        self.runsets.append( run )
+        callback = cvac.TrainerCallbackHandlerPrx.uncheckedCast(
+            current.con.createProxy( client ) )
+        callback.message( 3, "training on {0} artifacts".format(
+            len( getRunSetLabelables( run ) ) ) )
+        dirname, filename = os.path.split( self.detectorFile )
+        filePath = cvac.FilePath( cvac.DirectoryPath( dirname ), filename )
+        callback.createdDetector(
+            cvac.DetectorData( cvac.DetectorDataType.FILE, None, filePath, None ) )
+
+    def getTrainerProperties( self, current=None ):
+        return None
+
+def serve( ic, servant, proxyClass ):
+    '''Make the servant reachable through a local TCP endpoint of
+    communicator ic and return a proxy of type proxyClass to it.
+    The object adapter is returned as well so the caller can destroy it.'''
+    adapter = ic.createObjectAdapterWithEndpoints( Ice.generateUUID(),
+                                                 "tcp -h localhost" )
+    prx = adapter.addWithUUID( servant )
+    adapter.activate()
+    return proxyClass.uncheckedCast( prx ), adapter
+
+def serveToEasy( ic, servant, proxyClass ):
+    '''Serve the servant on communicator ic as serve does, and return a
+    proxy of type proxyClass to it that goes through easy's communicator,
+    so that requests and callbacks are marshaled as with remote services'''
+    import easy
+    prx, adapter = serve( ic, servant, proxyClass )
+    base = easy.getCommunicator().stringToProxy( prx.ice_toString() )
+    return proxyClass.uncheckedCast( base )
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    '''Serves the files below the server's rootDir, honoring
+    single "Range: bytes=start-end" headers unless the server's
+    ranges is False.  Each response waits for the server's latency.'''
+
+    def do_GET( self ):
+        server = self.server
+        server.lock.acquire()
+        server.requests += 1
+        server.lock.release()
+        fsPath = os.path.join( server.rootDir, self.path.lstrip("/") )
+        if ".." in self.path or not os.path.isfile( fsPath ):
+            self.send_error( 404 )
+            return
+        time.sleep( server.latency )
+        size = os.path.getsize( fsPath )
+        start, end = 0, size-1
+        rangeHeader = self.headers.get( "Range" )
+        partial = bool( server.ranges and rangeHeader )
+        if partial:
+            first, last = rangeHeader.split( "=" )[1].split( "-" )
+            start = int( first )
+            if last:
+                end = min( int( last ), size-1 )
+            self.send_response( 206 )
+            self.send_header( "Content-Range", "bytes {0}-{1}/{2}".format( start, end, size ) )
+        else:
+            self.send_response( 200 )
+        self.send_header( "Content-Length", str( end-start+1 ) )
+        self.end_headers()
+        # count before the client can see the bytes
+        server.lock.acquire()
+        server.bytesSent += end-start+1
+        server.lock.release()
+        fin = open( fsPath, 'rb' )
+        try:
+            fin.seek( start )
+            self.wfile.write( fin.read( end-start+1 ) )
+        finally:
+            fin.close()
+
+    def log_message( self, format, *args ):
+        pass
+
+class LocalHTTPServer(ThreadingMixIn, HTTPServer):
+    '''An HTTP stand-in for a corpus mirror, on a free local port;
+    call start() to serve from a background thread and shutdown()
+    to stop'''
+    daemon_threads = True
+
+    def __init__( self, rootDir, latency=0.0, ranges=True ):
+        HTTPServer.__init__( self, ("localhost", 0), RangeRequestHandler )
+        self.rootDir = rootDir
+        self.latency = latency
+        self.ranges = ranges
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytesSent = 0
+
+    def getURL( self, path ):
+        return "http://localhost:{0}/{1}".format( self.server_address[1], path )
+
+    def start( self ):
+        thread = threading.Thread( target=self.serve_forever )
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,245 @@
+#
+# Easy Computer Vision
+#
+# progress.py tracks long-running operations such as training,
+# detection, corpus mirroring and file transfers from the events that
+# the services report through their callbacks.
+#
+from __future__ import print_function
+import time
+import threading
+import traceback
+import weakref
+
+# message levels of CallbackHandler.message
+messageLevels = {1:'fatal', 2:'warning', 3:'info', 4:'debug'}
+
+# the trackers of all operations that have not finished yet, by id;
+# a tracker that nothing refers to any more drops out by itself
+activeTrackers = weakref.WeakValueDictionary()
+activeTrackersLock = threading.Lock()
+
+def getActiveTrackers():
+    '''A list of the trackers of all unfinished operations'''
+    activeTrackersLock.acquire()
+    try:
+        return sorted( activeTrackers.values(), key=lambda tracker: tracker.started )
+    finally:
+        activeTrackersLock.release()
+
+class ProgressListener(object):
+    '''Base class for listeners; progressChanged is called with the
+    tracker and the name of the event: "estimatedTotalRuntime",
+    "estimatedRuntimeLeft", "message", "results", "bytes", "task"
+    or "finished"'''
+    def progressChanged( self, tracker, event ):
+        pass
+
+class ProgressTracker(object):
+    '''The progress of one operation, such as "train" or "detect", with
+    the optional total number of results (or files) that are expected.
+    Listeners are notified of every event.  A tracker counts as active
+    from its creation until finish() is called, so that an operation
+    that never reports anything shows up as stalled.'''
+
+    def __init__( self, operation, name="", total=None, listeners=None ):
+        self.operation = operation
+        self.name = name
+        self.total = total
+        self.listeners = list( listeners or [] )
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.lastEvent = self.started
+        self.results = 0
+        self.bytes = 0
+        self.estimatedTotal = None
+        self.estimatedLeft = None
+        self.estimatedLeftTime = None
+        self.task = None
+        self.taskPercent = None
+        self.messages = []
+        self.finished = None
+        self.error = None
+        activeTrackersLock.acquire()
+        activeTrackers[id(self)] = self
+        activeTrackersLock.release()
+
+    def notify( self, event ):
+        for listener in self.listeners:
+            try:
+                listener.progressChanged( self, event )
+            except Exception:
+                # a broken listener must not fail the callback
+                traceback.print_exc()
+
+    def update( self, event, **changes ):
+        self.lock.acquire()
+        try:
+            self.lastEvent = time.time()
+            for name in changes:
+                setattr( self, name, changes[name] )
+        finally:
+            self.lock.release()
+        self.notify( event )
+
+    def setEstimatedTotal( self, seconds ):
+        if seconds<0:
+            seconds = None
+        self.update( "estimatedTotalRuntime", estimatedTotal=seconds )
+
+    def setEstimatedLeft( self, seconds ):
+        if seconds<0:
+            seconds = None
+        self.update( "estimatedRuntimeLeft", estimatedLeft=seconds,
+                     estimatedLeftTime=time.time() )
+
+    def addMessage( self, level, text ):
+        self.lock.acquire()
+        self.messages.append( (time.time(), level, text) )
+        self.lock.release()
+        self.update( "message" )
+
+    def addResults( self, count, numBytes=0 ):
+        self.lock.acquire()
+        self.results += count
+        self.bytes += numBytes
+        self.lock.release()
+        self.update( "results" )
+
+    def addBytes( self, numBytes ):
+        self.lock.acquire()
+        self.bytes += numBytes
+        self.lock.release()
+        self.update( "bytes" )
+
+    def setTask( self, numtasks, currtask, taskname, details, percentCompleted ):
+        self.update( "task", task=(currtask, numtasks, taskname, details),
+                     taskPercent=percentCompleted )
+
+    def finish( self, error=None ):
+        self.update( "finished", finished=time.time(), error=error )
+        activeTrackersLock.acquire()
+        activeTrackers.pop( id(self), None )
+        activeTrackersLock.release()
+
+    def getETA( self, now=None ):
+        '''Seconds until the operation is expected to finish, or None'''
+        if now is None:
+            now = time.time()
+        if self.finished:
+            return 0.0
+        if self.estimatedLeft is not None:
+            return max( 0.0, self.estimatedLeft-(now-self.estimatedLeftTime) )
+        elapsed = now-self.started
+        if self.estimatedTotal is not None:
+            return max( 0.0, self.estimatedTotal-elapsed )
+        if self.total and self.results:
+            return elapsed*(self.total-self.results)/float( self.results )
+        if self.taskPercent and self.task and self.task[0]==self.task[1]:
+            # the last task's share of the elapsed time
+            return elapsed*(1.0-self.taskPercent)/self.taskPercent
+        return None
+
+    def getSnapshot( self ):
+        '''The state of the operation as a dictionary'''
+        self.lock.acquire()
+        try:
+            now = self.finished or time.time()
+            elapsed = now-self.started
+            rate = elapsed>0 and 1.0/elapsed or 0.0
+            messageCounts = {}
+            for stamp, level, text in self.messages:
+                name = messageLevels.get( level, 'verbose' )
+                messageCounts[name] = messageCounts.get( name, 0 )+1
+            return {'operation':self.operation, 'name':self.name,
+                    'elapsed':elapsed, 'idle':now-self.lastEvent,
+                    'results':self.results, 'total':self.total,
+                    'resultsPerSecond':self.results*rate,
+                    'bytes':self.bytes, 'bytesPerSecond':self.bytes*rate,
+                    'eta':self.getETA( now ), 'task':self.task,
+                    'taskPercent':self.taskPercent, 'messages':messageCounts,
+                    'finished':self.finished is not None,
+                    'error':self.error and str( self.error ) or None}
+        finally:
+            self.lock.release()
+
+    def getMessages( self, maxLevel=None ):
+        '''(time, level, text) of the server messages, optionally
+        only those up to a level, e.g. 2 for fatal errors and warnings'''
+        self.lock.acquire()
+        try:
+            return [msg for msg in self.messages if maxLevel is None or msg[1]<=maxLevel]
+        finally:
+            self.lock.release()
+
+    def isStalled( self, timeout ):
+        '''True if the operation has not finished and reported nothing
+        for timeout seconds'''
+        return self.finished is None and time.time()-self.lastEvent>timeout
+
+class ProgressMonitor(object):
+    '''Calls func with a list of the snapshots of all active operations
+    every interval seconds, from a background thread, until stop() is
+    called.  Operations that have been silent for more than
+    stallTimeout seconds have 'stalled' set in their snapshot.'''
+
+    def __init__( self, func, interval=5.0, stallTimeout=None ):
+        self.func = func
+        self.interval = interval
+        self.stallTimeout = stallTimeout
+        self.stopped = threading.Event()
+        self.thread = threading.Thread( target=self.run )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def getSnapshots( self ):
+        snapshots = []
+        for tracker in getActiveTrackers():
+            snapshot = tracker.getSnapshot()
+            snapshot['stalled'] = bool( self.stallTimeout ) \
+                and tracker.isStalled( self.stallTimeout )
+            snapshots.append( snapshot )
+        return snapshots
+
+    def run( self ):
+        while True:
+            self.stopped.wait( self.interval )
+            if self.stopped.isSet():
+                break
+            try:
+                self.func( self.getSnapshots() )
+            except Exception:
+                traceback.print_exc()
+
+    def stop( self ):
+        self.stopped.set()
+        self.thread.join()
+
+class PrintingListener(ProgressListener):
+    '''Prints server messages up to maxLevel and, at most every
+    interval seconds, a progress line'''
+
+    def __init__( self, maxLevel=2, interval=10.0 ):
+        self.maxLevel = maxLevel
+        self.interval = interval
+        self.lastPrinted = {}
+
+    def progressChanged( self, tracker, event ):
+        if event=="message":
+            stamp, level, text = tracker.messages[-1]
+            if level<=self.maxLevel:
+                print("{0} {1}: {2}".format( tracker.operation,
+                                             messageLevels.get( level, 'verbose' ), text ))
+            return
+        now = time.time()
+        if event!="finished" and now-self.lastPrinted.get( id(tracker), 0 )<self.interval:
+            return
+        self.lastPrinted[id(tracker)] = now
+        snap = tracker.getSnapshot()
+        eta = snap['eta'] is not None and "{0:.0f}s".format( snap['eta'] ) or "unknown"
+        print("{0} {1}: {2} results ({3:.1f}/s), {4} bytes ({5:.0f}/s), ETA {6}{7}".format(
+            snap['operation'], snap['name'], snap['results'], snap['resultsPerSecond'],
+            snap['bytes'], snap['bytesPerSecond'], eta,
+            snap['finished'] and ", finished" or "" ))
+        if event=="finished":
+            del self.lastPrinted[id(tracker)]
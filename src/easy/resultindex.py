@@ -0,0 +1,289 @@
+#
+# Easy Computer Vision
+#
+# resultindex.py answers queries over detection results, such as all
+# detections of one label above a confidence that overlap a region in
+# some files, without scanning all results.
+#
+from __future__ import print_function
+import numpy
+import paths
+import cvac
+import evaluation
+
+# bits per cell coordinate in the keys of the spatial grid
+cellBits = 20
+maxCell = (1<<cellBits)-1
+
+class ResultIndex(object):
+    '''An index over found labels, given as columns: label and path ids
+    into the labels and paths tables, confidences, and boxes as corners
+    (x1, y1, x2, y2), NaN for labels without a box.
+    For every label, the rows are kept sorted by decreasing confidence,
+    so that threshold and top-k queries take a binary search.  Boxes are
+    entered into a grid of cellSize pixels per image; boxes that would
+    cover more than maxCells cells are kept in a list per image that
+    every spatial query checks.  A second grid keyed by cell alone
+    answers spatial queries over all images.
+    Query results are row numbers into the columns, in order of
+    decreasing confidence.'''
+
+    def __init__( self, labels, paths, labelIds, pathIds, confidences, boxes,
+                  cellSize=128, maxCells=64, source=None ):
+        self.labels = list( labels )
+        self.labelLookup = {}
+        for idx, name in enumerate( self.labels ):
+            self.labelLookup[name] = idx
+        self.paths = list( paths )
+        self.pathLookup = {}
+        for idx, path in enumerate( self.paths ):
+            self.pathLookup[path] = idx
+        self.labelIds = numpy.asarray( labelIds, numpy.int32 )
+        self.pathIds = numpy.asarray( pathIds, numpy.int32 )
+        self.confidences = numpy.asarray( confidences, numpy.float32 )
+        self.boxes = numpy.asarray( boxes, numpy.float32 ).reshape( -1, 4 )
+        self.cellSize = float( cellSize )
+        self.maxCells = maxCells
+        # where getLabelables obtains the found labels
+        self.source = source
+        self.buildConfidenceIndex()
+        self.buildGrid()
+
+    @staticmethod
+    def fromResultStore( store, **kwargs ):
+        '''Index the found labels of a resultstore.ResultStore'''
+        boxes = numpy.array( store.boxes, numpy.float32 )
+        boxes[:,2:] += boxes[:,:2]
+        return ResultIndex( store.labels, store.paths, store.labelIds, store.pathIds,
+                            store.confidences, boxes, source=store, **kwargs )
+
+    @staticmethod
+    def fromResults( results, **kwargs ):
+        '''Index the found labels of a list of cvac.Results'''
+        labels = []
+        labelLookup = {}
+        paths = []
+        pathLookup = {}
+        columns = ([], [], [], [])
+        found = []
+        nan = numpy.nan
+        for res in results:
+            path = res.original.sub.path
+            path = (path.directory.relativePath, path.filename)
+            if not path in pathLookup:
+                pathLookup[path] = len( paths )
+                paths.append( path )
+            for lb in res.foundLabels:
+                if not lb.lab.name in labelLookup:
+                    labelLookup[lb.lab.name] = len( labels )
+                    labels.append( lb.lab.name )
+                box = None
+                if isinstance( lb, cvac.LabeledLocation ):
+                    box = evaluation.getBox( lb.loc )
+                columns[0].append( labelLookup[lb.lab.name] )
+                columns[1].append( pathLookup[path] )
+                columns[2].append( lb.confidence )
+                columns[3].append( box or (nan, nan, nan, nan) )
+                found.append( lb )
+        return ResultIndex( labels, paths, columns[0], columns[1], columns[2],
+                            numpy.array( columns[3], numpy.float32 ).reshape( -1, 4 ),
+                            source=found, **kwargs )
+
+    def __len__( self ):
+        return len( self.labelIds )
+
+    def getLabelId( self, name ):
+        '''Return the id of a label name, or -1 if it does not occur'''
+        return self.labelLookup.get( name, -1 )
+
+    def getPathId( self, filepath ):
+        '''Return the id of a cvac.FilePath, or -1 if it does not occur'''
+        return self.pathLookup.get( (filepath.directory.relativePath, filepath.filename), -1 )
+
+    def getPathIds( self, paths ):
+        '''Ids of paths given as cvac.FilePaths or ids already'''
+        pathIds = []
+        for path in paths:
+            if isinstance( path, cvac.FilePath ):
+                path = self.getPathId( path )
+            pathIds.append( path )
+        return pathIds
+
+    def buildConfidenceIndex( self ):
+        # rows without a label (results without found labels) are left out
+        valid = numpy.nonzero( self.labelIds>=0 )[0]
+        order = numpy.lexsort( (-self.confidences[valid], self.labelIds[valid]) )
+        self.byLabel = valid[order]
+        self.byLabelConfidences = -self.confidences[self.byLabel]
+        self.labelBounds = numpy.searchsorted( self.labelIds[self.byLabel],
+                                               numpy.arange( len(self.labels)+1 ) )
+        self.byConfidence = valid[numpy.argsort( -self.confidences[valid], kind='mergesort' )]
+        self.byConfidenceConfidences = -self.confidences[self.byConfidence]
+
+    def getCells( self, boxes ):
+        '''The first and last cell column and row of each box'''
+        cells = numpy.floor( boxes/self.cellSize )
+        return numpy.clip( cells, 0, maxCell ).astype( numpy.int64 )
+
+    def getKeys( self, pathIds, cellX, cellY ):
+        return (numpy.asarray( pathIds, numpy.int64 )<<(2*cellBits)) \
+            | (cellY<<cellBits) | cellX
+
+    def buildGrid( self ):
+        '''Sort (image, cell) keys of all boxes, one entry per cell a box
+        covers; boxes that are too large go to self.largeRows'''
+        rows = numpy.nonzero( ~numpy.isnan( self.boxes[:,0] ) )[0]
+        cells = self.getCells( self.boxes[rows] )
+        widths = cells[:,2]-cells[:,0]+1
+        heights = cells[:,3]-cells[:,1]+1
+        numCells = widths*heights
+        large = numCells>self.maxCells
+        self.largeRows = {}
+        for row in rows[large]:
+            self.largeRows.setdefault( int( self.pathIds[row] ), [] ).append( row )
+        rows = rows[~large]
+        cells = cells[~large]
+        widths = widths[~large]
+        numCells = numCells[~large]
+        # one entry per covered cell: its offset within the box's cells
+        entryRows = numpy.repeat( numpy.arange( len(rows) ), numCells )
+        starts = numpy.concatenate( ([0], numpy.cumsum( numCells )[:-1]) ).astype( numpy.int64 )
+        offsets = numpy.arange( len(entryRows) )-starts[entryRows]
+        cellX = cells[entryRows,0]+offsets%widths[entryRows]
+        cellY = cells[entryRows,1]+offsets//widths[entryRows]
+        keys = self.getKeys( self.pathIds[rows[entryRows]], cellX, cellY )
+        order = numpy.argsort( keys, kind='mergesort' )
+        self.gridKeys = keys[order]
+        self.gridRows = rows[entryRows[order]]
+        # the same entries by cell alone, for queries over all images
+        keys = self.getKeys( 0, cellX, cellY )
+        order = numpy.argsort( keys, kind='mergesort' )
+        self.cellKeys = keys[order]
+        self.cellRows = rows[entryRows[order]]
+
+    def getLabelRows( self, labelId ):
+        '''Rows of one label, in order of decreasing confidence'''
+        if labelId<0:
+            return self.byLabel[:0], self.byLabelConfidences[:0]
+        start, end = self.labelBounds[labelId], self.labelBounds[labelId+1]
+        return self.byLabel[start:end], self.byLabelConfidences[start:end]
+
+    def threshold( self, label=None, minConfidence=None, k=None ):
+        '''The rows of a label, or of all labels, with a confidence of at
+        least minConfidence, at most k of them'''
+        if label is None:
+            rows, negated = self.byConfidence, self.byConfidenceConfidences
+        else:
+            rows, negated = self.getLabelRows( self.getLabelId( label ) )
+        end = len( rows )
+        if minConfidence is not None:
+            end = numpy.searchsorted( negated, -minConfidence, side='right' )
+        if k is not None:
+            end = min( end, k )
+        return rows[:end]
+
+    def confidenceRange( self, label, low, high ):
+        '''The rows of a label with low <= confidence <= high'''
+        rows, negated = self.getLabelRows( self.getLabelId( label ) )
+        start = numpy.searchsorted( negated, -high, side='left' )
+        end = numpy.searchsorted( negated, -low, side='right' )
+        return rows[start:end]
+
+    def topK( self, k, label=None ):
+        '''The k rows of a label, or of all labels, with the highest confidence'''
+        return self.threshold( label, None, k )
+
+    def getRegionCells( self, region ):
+        '''The cell columns and rows that the region covers'''
+        cells = self.getCells( numpy.asarray( [region], numpy.float64 ) )[0]
+        cellX, cellY = numpy.meshgrid( numpy.arange( cells[0], cells[2]+1 ),
+                                       numpy.arange( cells[1], cells[3]+1 ) )
+        return cellX.ravel(), cellY.ravel()
+
+    def getSpatialCandidates( self, pathIds, region ):
+        '''Rows in the given images, or in all images if pathIds is None,
+        whose grid cells intersect the region'''
+        cellX, cellY = self.getRegionCells( region )
+        if pathIds is None:
+            keys, sortedKeys, sortedRows = self.getKeys( 0, cellX, cellY ), \
+                self.cellKeys, self.cellRows
+            large = [rows for rows in self.largeRows.values()]
+        else:
+            pathIds = numpy.asarray( pathIds, numpy.int64 )
+            pathIds = pathIds[pathIds>=0]
+            keys = self.getKeys( pathIds[:,numpy.newaxis], cellX[numpy.newaxis,:],
+                                 cellY[numpy.newaxis,:] ).ravel()
+            sortedKeys, sortedRows = self.gridKeys, self.gridRows
+            large = [self.largeRows[pathId] for pathId in pathIds
+                     if pathId in self.largeRows]
+        starts = numpy.searchsorted( sortedKeys, keys, side='left' )
+        ends = numpy.searchsorted( sortedKeys, keys, side='right' )
+        # the rows of all ranges starts[i]:ends[i] at once
+        lengths = ends-starts
+        offsets = numpy.concatenate( ([0], numpy.cumsum( lengths )[:-1]) )
+        entries = numpy.arange( lengths.sum() ) \
+            + numpy.repeat( starts-offsets, lengths )
+        candidates = [sortedRows[entries]]+[numpy.asarray( rows ) for rows in large]
+        return numpy.unique( numpy.concatenate( candidates ).astype( numpy.intp ) )
+
+    def overlapping( self, region, paths=None, minIoU=None ):
+        '''Rows with a box that overlaps the region (x1, y1, x2, y2), or
+        whose intersection over union with it is at least minIoU, in
+        the given files (cvac.FilePaths or path ids) or in all files.
+        The rows are in order of decreasing confidence.'''
+        pathIds = None
+        if paths is not None:
+            pathIds = self.getPathIds( paths )
+        rows = self.getSpatialCandidates( pathIds, region )
+        boxes = self.boxes[rows]
+        if minIoU is None:
+            keep = (boxes[:,0]<region[2]) & (boxes[:,2]>region[0]) \
+                & (boxes[:,1]<region[3]) & (boxes[:,3]>region[1])
+        else:
+            iou = evaluation.computeIoU( boxes, numpy.asarray( [region], numpy.float64 ) )
+            keep = iou[:,0]>=minIoU
+        rows = rows[keep]
+        return rows[numpy.argsort( -self.confidences[rows], kind='mergesort' )]
+
+    def query( self, labels=None, minConfidence=None, region=None, paths=None,
+               minIoU=None, k=None ):
+        '''Rows that match all of the given criteria, in order of
+        decreasing confidence, at most k of them.  See threshold and
+        overlapping.'''
+        if region is not None:
+            rows = self.overlapping( region, paths, minIoU )
+            mask = numpy.ones( len(rows), bool )
+            if labels is not None:
+                wanted = numpy.zeros( len(self.labels)+1, bool )
+                wanted[[self.getLabelId( name ) for name in labels]] = True
+                mask &= wanted[self.labelIds[rows]]
+            if minConfidence is not None:
+                mask &= self.confidences[rows]>=minConfidence
+            rows = rows[mask]
+        else:
+            if labels is None:
+                rows = self.threshold( None, minConfidence )
+            else:
+                # k applies after the paths filter, not per label
+                rows = numpy.concatenate( [self.threshold( name, minConfidence )
+                                           for name in labels] or [self.byLabel[:0]] )
+                rows = rows[numpy.argsort( -self.confidences[rows], kind='mergesort' )]
+            if paths is not None:
+                wanted = numpy.zeros( len(self.paths)+1, bool )
+                wanted[self.getPathIds( paths )] = True
+                rows = rows[wanted[self.pathIds[rows]]]
+        if k is not None:
+            rows = rows[:k]
+        return rows
+
+    def getLabelables( self, rows ):
+        '''The found labels of the rows, as cvac.Labelables'''
+        if isinstance( self.source, list ):
+            return [self.source[row] for row in rows]
+        labelables = []
+        for row in rows:
+            relativePath, filename = self.paths[self.pathIds[row]]
+            path = cvac.FilePath( cvac.DirectoryPath( relativePath ), filename )
+            sub = cvac.Substrate( True, False, path, 0, 0 )
+            labelables.append( self.source.getFoundLabel( int( row ), sub ) )
+        return labelables
@@ -0,0 +1,376 @@
+#
+# Easy Computer Vision
+#
+# resultstore.py writes detection results to disk column by column as
+# they arrive, and opens them again through numpy.memmap, so that large
+# result sets can be analyzed without unmarshaling them all into
+# cvac.Result objects.
+#
+from __future__ import print_function
+import os
+import json
+import threading
+import numpy
+import paths
+import cvac
+import labelindex
+
+# increment if the file layout changes
+formatVersion = 1
+
+# a row for a result without any found labels
+KIND_NONE = -1
+
+# name, dtype and per-row shape of each column; one file each
+columns = [('resultIds', '<i8', ()),
+           ('pathIds', '<i4', ()),
+           ('isVideo', '|b1', ()),
+           ('origLabelIds', '<i4', ()),
+           ('labelIds', '<i4', ()),
+           ('confidences', '<f4', ()),
+           ('kinds', '|i1', ()),
+           ('boxes', '<f4', (4,))]
+
+def getColumnFile( directory, name ):
+    return os.path.join( directory, name+".bin" )
+
+def readMeta( directory ):
+    fin = open( os.path.join( directory, "meta.json" ) )
+    try:
+        meta = json.load( fin )
+    finally:
+        fin.close()
+    if meta.get('format')!=formatVersion:
+        raise RuntimeError("unsupported result store format:", meta.get('format'))
+    return meta
+
+def readTable( directory, name, count ):
+    '''The first count entries of a string table; later entries
+    were written after the last flush and are not valid'''
+    table = []
+    fname = os.path.join( directory, name+".txt" )
+    if not count:
+        return table
+    fin = open( fname, 'rb' )
+    try:
+        for line in fin:
+            if len( table )==count:
+                break
+            value = json.loads( line.decode('utf-8') )
+            if isinstance( value, list ):
+                value = tuple( value )
+            table.append( value )
+    finally:
+        fin.close()
+    return table
+
+def truncateFile( fname, size ):
+    if not os.path.exists( fname ):
+        open( fname, 'wb' ).close()
+    if os.path.getsize( fname )>size:
+        fout = open( fname, 'r+b' )
+        try:
+            fout.truncate( size )
+        finally:
+            fout.close()
+
+class ResultStoreWriter(object):
+    '''Appends cvac.Results to a result store directory.  There is one
+    row per found label, holding the result number, the ids of the path
+    and of the original's label, the found label's id and confidence,
+    and its box as (x, y, width, height), NaN for labels without a BBox
+    or PreciseBBox.  A result without found labels gets one row with
+    kind KIND_NONE and label id -1.  Label names and paths are interned
+    into string tables.
+    Rows are buffered and written every bufferRows rows; only flushed
+    rows count, so a store that was not closed properly loses no more
+    than the unflushed rows.  An existing store is appended to.
+    addResults may be called from several threads.'''
+
+    def __init__( self, directory, bufferRows=65536 ):
+        self.directory = directory
+        self.bufferRows = bufferRows
+        self.lock = threading.Lock()
+        self.labels = []
+        self.labelLookup = {}
+        self.paths = []
+        self.pathLookup = {}
+        self.rows = 0
+        self.numResults = 0
+        if not os.path.exists( directory ):
+            os.makedirs( directory )
+        if os.path.exists( os.path.join( directory, "meta.json" ) ):
+            meta = readMeta( directory )
+            self.rows = meta['rows']
+            self.numResults = meta['results']
+            self.labels = readTable( directory, "labels", meta['labels'] )
+            self.paths = readTable( directory, "paths", meta['paths'] )
+            for idx, name in enumerate( self.labels ):
+                self.labelLookup[name] = idx
+            for idx, path in enumerate( self.paths ):
+                self.pathLookup[path] = idx
+        # drop whatever was written after the last complete flush
+        for name, dtype, shape in columns:
+            rowBytes = numpy.dtype( dtype ).itemsize*int( numpy.prod( shape ) )
+            truncateFile( getColumnFile( directory, name ), self.rows*rowBytes )
+        for name, table in (("labels", self.labels), ("paths", self.paths)):
+            fname = os.path.join( directory, name+".txt" )
+            truncateFile( fname, self.getTableSize( table ) )
+        self.flushedLabels = len( self.labels )
+        self.flushedPaths = len( self.paths )
+        self.buffer = {}
+        for name, dtype, shape in columns:
+            self.buffer[name] = []
+
+    def getTableSize( self, table ):
+        size = 0
+        for value in table:
+            size += len( self.encodeEntry( value ) )
+        return size
+
+    def encodeEntry( self, value ):
+        return (json.dumps( value )+"\n").encode('utf-8')
+
+    def intern( self, lookup, table, value ):
+        valueId = lookup.get( value )
+        if valueId is None:
+            valueId = len( table )
+            lookup[value] = valueId
+            table.append( value )
+        return valueId
+
+    def addRow( self, resultId, pathId, isVideo, origLabelId, labelId, confidence, kind, box ):
+        buf = self.buffer
+        buf['resultIds'].append( resultId )
+        buf['pathIds'].append( pathId )
+        buf['isVideo'].append( isVideo )
+        buf['origLabelIds'].append( origLabelId )
+        buf['labelIds'].append( labelId )
+        buf['confidences'].append( confidence )
+        buf['kinds'].append( kind )
+        buf['boxes'].append( box )
+
+    def addResults( self, results ):
+        '''Append a list of cvac.Results, or a cvac.ResultSetV2'''
+        if isinstance( results, cvac.ResultSetV2 ):
+            results = results.results
+        self.lock.acquire()
+        try:
+            for res in results:
+                self.addResult( res )
+            if len( self.buffer['resultIds'] )>=self.bufferRows:
+                self.flushLocked()
+        finally:
+            self.lock.release()
+
+    def addResult( self, res ):
+        resultId = self.numResults
+        self.numResults += 1
+        orig = res.original
+        path = (orig.sub.path.directory.relativePath, orig.sub.path.filename)
+        pathId = self.intern( self.pathLookup, self.paths, path )
+        origLabelId = -1
+        if orig.lab and orig.lab.hasLabel:
+            origLabelId = self.intern( self.labelLookup, self.labels, orig.lab.name )
+        isVideo = bool( orig.sub.isVideo )
+        nan = numpy.nan
+        if not res.foundLabels:
+            self.addRow( resultId, pathId, isVideo, origLabelId, -1, nan,
+                         KIND_NONE, (nan, nan, nan, nan) )
+        for found in res.foundLabels or []:
+            labelId = self.intern( self.labelLookup, self.labels, found.lab.name )
+            kind = labelindex.KIND_LABELABLE
+            box = (nan, nan, nan, nan)
+            if type(found) is cvac.LabeledFullSubstrate:
+                kind = labelindex.KIND_FULLSUBSTRATE
+            elif type(found) is cvac.LabeledLocation and type(found.loc) is cvac.BBox:
+                kind = labelindex.KIND_BBOX
+                box = (found.loc.x, found.loc.y, found.loc.width, found.loc.height)
+            elif type(found) is cvac.LabeledLocation and type(found.loc) is cvac.PreciseBBox:
+                kind = labelindex.KIND_PRECISEBBOX
+                box = (found.loc.centerX-found.loc.width/2.0,
+                       found.loc.centerY-found.loc.height/2.0,
+                       found.loc.width, found.loc.height)
+            elif not type(found) is cvac.Labelable:
+                # other locations, such as video segments, are not kept
+                kind = labelindex.KIND_OTHER
+            self.addRow( resultId, pathId, isVideo, origLabelId, labelId,
+                         found.confidence, kind, box )
+
+    def flush( self ):
+        self.lock.acquire()
+        try:
+            self.flushLocked()
+        finally:
+            self.lock.release()
+
+    def flushLocked( self ):
+        '''Append the buffered rows and new table entries to their files,
+        then record the new counts in meta.json'''
+        newRows = len( self.buffer['resultIds'] )
+        for name, dtype, shape in columns:
+            data = numpy.array( self.buffer[name], dtype ).reshape( (newRows,)+shape )
+            fout = open( getColumnFile( self.directory, name ), 'ab' )
+            try:
+                data.tofile( fout )
+            finally:
+                fout.close()
+            self.buffer[name] = []
+        for name, table, flushed in (("labels", self.labels, self.flushedLabels),
+                                     ("paths", self.paths, self.flushedPaths)):
+            fout = open( os.path.join( self.directory, name+".txt" ), 'ab' )
+            try:
+                for value in table[flushed:]:
+                    fout.write( self.encodeEntry( value ) )
+            finally:
+                fout.close()
+        self.flushedLabels = len( self.labels )
+        self.flushedPaths = len( self.paths )
+        self.rows += newRows
+        meta = {'format':formatVersion, 'rows':self.rows, 'results':self.numResults,
+                'labels':self.flushedLabels, 'paths':self.flushedPaths}
+        tmpname = os.path.join( self.directory, "meta.json.tmp" )
+        fout = open( tmpname, 'w' )
+        try:
+            json.dump( meta, fout )
+        finally:
+            fout.close()
+        metaFile = os.path.join( self.directory, "meta.json" )
+        if os.path.exists( metaFile ):
+            os.remove( metaFile )
+        os.rename( tmpname, metaFile )
+
+    def close( self ):
+        self.flush()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, excType, excValue, tb ):
+        self.close()
+
+class ResultStore(object):
+    '''A result store directory opened for reading.  The columns (see
+    ResultStoreWriter) are read-only numpy.memmap arrays, so only the
+    pages that a computation touches are loaded.'''
+
+    def __init__( self, directory ):
+        self.directory = directory
+        meta = readMeta( directory )
+        self.rows = meta['rows']
+        self.numResults = meta['results']
+        self.labels = readTable( directory, "labels", meta['labels'] )
+        self.paths = readTable( directory, "paths", meta['paths'] )
+        self.labelLookup = {}
+        for idx, name in enumerate( self.labels ):
+            self.labelLookup[name] = idx
+        self.pathLookup = {}
+        for idx, path in enumerate( self.paths ):
+            self.pathLookup[path] = idx
+        for name, dtype, shape in columns:
+            if self.rows:
+                column = numpy.memmap( getColumnFile( directory, name ), dtype, 'r',
+                                       shape=(self.rows,)+shape )
+            else:
+                # an empty file cannot be mapped
+                column = numpy.zeros( (0,)+shape, dtype )
+            setattr( self, name, column )
+
+    def __len__( self ):
+        return self.rows
+
+    def getLabelId( self, name ):
+        '''Return the id of a label name, or -1 if it does not occur'''
+        return self.labelLookup.get( name, -1 )
+
+    def getPathId( self, filepath ):
+        '''Return the id of a cvac.FilePath, or -1 if it does not occur'''
+        return self.pathLookup.get( (filepath.directory.relativePath, filepath.filename), -1 )
+
+    def getPath( self, pathId ):
+        relativePath, filename = self.paths[pathId]
+        return cvac.FilePath( cvac.DirectoryPath( relativePath ), filename )
+
+    def select( self, labels=None, minConfidence=None, hasBox=None, pathIds=None,
+                chunkRows=1<<22 ):
+        '''Return the rows of found labels that match all of the given
+        criteria; pathIds are indices into the paths table, and negative
+        ones, which getPathId returns for unknown files, match nothing.
+        The columns are scanned chunkRows rows at a time.'''
+        wanted = None
+        if labels is not None:
+            # unknown names map to the extra last slot, which no row uses
+            wanted = numpy.zeros( len(self.labels)+1, bool )
+            wanted[[self.getLabelId( name ) for name in labels]] = True
+        wantedPaths = None
+        if pathIds is not None:
+            wantedPaths = numpy.zeros( len(self.paths), bool )
+            pathIds = numpy.asarray( pathIds, numpy.intp )
+            wantedPaths[pathIds[pathIds>=0]] = True
+        selected = []
+        for start in range( 0, self.rows, chunkRows ):
+            end = min( start+chunkRows, self.rows )
+            labelIds = numpy.asarray( self.labelIds[start:end] )
+            mask = labelIds>=0
+            if wanted is not None:
+                mask &= wanted[labelIds]
+            if minConfidence is not None:
+                mask &= numpy.asarray( self.confidences[start:end] )>=minConfidence
+            if hasBox is not None:
+                mask &= ~numpy.isnan( self.boxes[start:end,0] )==hasBox
+            if wantedPaths is not None:
+                mask &= wantedPaths[self.pathIds[start:end]]
+            selected.append( numpy.nonzero( mask )[0]+start )
+        if not selected:
+            return numpy.zeros( 0, numpy.intp )
+        return numpy.concatenate( selected )
+
+    def getLabelCounts( self ):
+        '''A dictionary from label name to the number of found labels'''
+        counts = numpy.zeros( len(self.labels), numpy.int64 )
+        chunkRows = 1<<22
+        for start in range( 0, self.rows, chunkRows ):
+            labelIds = numpy.asarray( self.labelIds[start:start+chunkRows] )
+            counts += numpy.bincount( labelIds[labelIds>=0], minlength=len(self.labels) )
+        return dict( zip( self.labels, [int(count) for count in counts] ) )
+
+    def getFoundLabel( self, row, sub ):
+        label = cvac.Label( True, self.labels[self.labelIds[row]], {}, cvac.Semantics() )
+        confidence = float( self.confidences[row] )
+        kind = self.kinds[row]
+        if kind==labelindex.KIND_FULLSUBSTRATE:
+            return cvac.LabeledFullSubstrate( confidence, label, sub )
+        if kind==labelindex.KIND_BBOX:
+            x, y, w, h = [int(round(v)) for v in self.boxes[row]]
+            return cvac.LabeledLocation( confidence, label, sub, cvac.BBox( x, y, w, h ) )
+        if kind==labelindex.KIND_PRECISEBBOX:
+            x, y, w, h = [float(v) for v in self.boxes[row]]
+            loc = cvac.PreciseBBox( x+w/2, y+h/2, w, h )
+            return cvac.LabeledLocation( confidence, label, sub, loc )
+        return cvac.Labelable( confidence, label, sub )
+
+    def getResults( self, rows=None ):
+        '''Create cvac.Results from the given rows, or from all rows;
+        rows of the same result are combined into one'''
+        if rows is None:
+            rows = numpy.arange( self.rows )
+        results = []
+        lastResultId = None
+        for row in rows:
+            row = int( row )
+            resultId = self.resultIds[row]
+            if resultId!=lastResultId:
+                lastResultId = resultId
+                isVideo = bool( self.isVideo[row] )
+                sub = cvac.Substrate( not isVideo, isVideo,
+                                      self.getPath( self.pathIds[row] ), 0, 0 )
+                origLabelId = self.origLabelIds[row]
+                if origLabelId>=0:
+                    label = cvac.Label( True, self.labels[origLabelId], {}, cvac.Semantics() )
+                else:
+                    label = cvac.Label( False, "", {}, cvac.Semantics() )
+                result = cvac.Result( cvac.Labelable( 0.0, label, sub ), [] )
+                results.append( result )
+            if self.kinds[row]!=KIND_NONE:
+                result.foundLabels.append( self.getFoundLabel( row, result.original.sub ) )
+        return results
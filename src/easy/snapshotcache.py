@@ -0,0 +1,166 @@
+#
+# Easy Computer Vision
+#
+# snapshotcache.py keeps the snapshots (thumbnails) that a FileService
+# created, so that easy.getSnapshots can show them again without
+# asking the FileService.
+#
+from __future__ import print_function
+import os
+import hashlib
+import threading
+
+class SnapshotCache(object):
+    '''A directory of snapshot images, keyed by the FilePath of the
+    original and the modification time of its local copy, if there is
+    one, so that a changed original gets a new snapshot.  The least
+    recently used snapshots are removed once they take more than
+    maxBytes.  The cache directory is read once, upon first use; from
+    then on the cache keeps track of its snapshots in memory.  The
+    cache can be shared by concurrent downloads.'''
+
+    def __init__( self, cacheDir=None, maxBytes=256*1024**2 ):
+        if not cacheDir:
+            cacheDir = os.path.join( os.path.expanduser("~"), ".cvac", "snapshots" )
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        # file -> [use count, bytes], and the bytes of all snapshots,
+        # read from the cache directory on first use
+        self.entries = None
+        self.totalBytes = None
+        self.useCount = 0
+
+    def loadEntries( self ):
+        '''Read the cache directory unless that happened already;
+        call with the lock held'''
+        if self.entries is not None:
+            return
+        self.entries = {}
+        self.totalBytes = 0
+        for lastUse, size, fname in self.getEntries():
+            self.useCount += 1
+            self.entries[fname] = [self.useCount, size]
+            self.totalBytes += size
+
+    def noteUse( self, fname, size=None ):
+        '''Make the file the most recently used one, with size bytes if
+        given; call with the lock held'''
+        self.loadEntries()
+        self.useCount += 1
+        entry = self.entries.get( fname )
+        if entry is None:
+            if size is None:
+                # added by another process
+                size = os.path.getsize( fname )
+            entry = self.entries[fname] = [self.useCount, 0]
+        if size is not None:
+            self.totalBytes += size-entry[1]
+            entry[1] = size
+        entry[0] = self.useCount
+
+    def getKey( self, filepath, mtime=None ):
+        sha = hashlib.sha1()
+        for part in (filepath.directory.relativePath, filepath.filename, repr( mtime )):
+            data = part.encode('utf-8')
+            sha.update( "{0}:".format( len( data ) ).encode('utf-8') )
+            sha.update( data )
+        return sha.hexdigest()
+
+    def getFile( self, key ):
+        # spread the files over subdirectories, as there can be many
+        return os.path.join( self.cacheDir, key[:2], key+".jpg" )
+
+    def lookup( self, key ):
+        '''The local snapshot file for the key, or None.  The snapshot
+        becomes the most recently used one.'''
+        fname = self.getFile( key )
+        try:
+            # the file times tell later sessions which snapshots are old
+            os.utime( fname, None )
+        except OSError:
+            return None
+        self.lock.acquire()
+        try:
+            self.noteUse( fname )
+        except OSError:
+            # evicted by another process
+            return None
+        finally:
+            self.lock.release()
+        return fname
+
+    def store( self, key, data ):
+        '''Write the snapshot bytes for the key, evict old snapshots if
+        needed, and return the local file'''
+        fname = self.getFile( key )
+        parent = os.path.dirname( fname )
+        if not os.path.isdir( parent ):
+            try:
+                os.makedirs( parent )
+            except OSError:
+                if not os.path.isdir( parent ):
+                    raise
+        tmpname = "{0}.{1}.tmp".format( fname, threading.current_thread().ident )
+        fout = open( tmpname, 'wb' )
+        try:
+            fout.write( data )
+        finally:
+            fout.close()
+        if os.path.exists( fname ):
+            os.remove( fname )
+        os.rename( tmpname, fname )
+        self.lock.acquire()
+        try:
+            self.noteUse( fname, len( data ) )
+            if self.maxBytes is not None and self.totalBytes>self.maxBytes:
+                self.evictEntries()
+        finally:
+            self.lock.release()
+        return fname
+
+    def getEntries( self ):
+        '''A list of (last use, bytes, file) for all snapshots, oldest first'''
+        entries = []
+        if not os.path.exists( self.cacheDir ):
+            return entries
+        for subdir in os.listdir( self.cacheDir ):
+            dirname = os.path.join( self.cacheDir, subdir )
+            if not os.path.isdir( dirname ):
+                continue
+            for fname in os.listdir( dirname ):
+                if not fname.endswith( ".jpg" ):
+                    continue
+                fname = os.path.join( dirname, fname )
+                try:
+                    entries.append( (os.path.getmtime( fname ),
+                                     os.path.getsize( fname ), fname) )
+                except OSError:
+                    # removed by a concurrent eviction
+                    pass
+        entries.sort()
+        return entries
+
+    def evict( self ):
+        '''Remove least recently used snapshots until they take no more
+        than maxBytes'''
+        self.lock.acquire()
+        try:
+            self.evictEntries()
+        finally:
+            self.lock.release()
+
+    def evictEntries( self ):
+        '''evict() with the lock held'''
+        self.loadEntries()
+        if self.maxBytes is None or self.totalBytes<=self.maxBytes:
+            return
+        entries = sorted( [(entry[0], fname) for fname, entry in self.entries.items()] )
+        for lastUse, fname in entries:
+            if self.totalBytes<=self.maxBytes:
+                break
+            try:
+                os.remove( fname )
+            except OSError:
+                pass
+            self.totalBytes -= self.entries.pop( fname )[1]
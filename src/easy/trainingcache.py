@@ -0,0 +1,207 @@
+#
+# Easy Computer Vision
+#
+# trainingcache.py keeps the DetectorData, and the model files, that
+# trainers produced, so that easy.train can skip training on a RunSet
+# that the same trainer has seen before.
+#
+from __future__ import print_function
+import os
+import re
+import shutil
+import json
+import base64
+import numbers
+import hashlib
+import paths
+import cvac
+
+try:
+    stringTypes = basestring
+except NameError:
+    stringTypes = str
+
+# increment if the entry layout changes
+formatVersion = 2
+
+def updateDirectoryHash( sha, plist, dataDir ):
+    '''Feed the name, size and modification time of every file that a
+    PurposedDirectory covers below the local dataDir into sha, so that
+    adding, replacing or removing images changes the key'''
+    suffixes = tuple( [suffix.lower() for suffix in plist.fileSuffixes or []] )
+    fsRoot = os.path.join( dataDir, plist.directory.relativePath )
+    for dirpath, dirnames, filenames in os.walk( fsRoot ):
+        if plist.recursive:
+            dirnames.sort()
+        else:
+            del dirnames[:]
+        for filename in sorted( filenames ):
+            if suffixes and not filename.lower().endswith( suffixes ):
+                continue
+            fsPath = os.path.join( dirpath, filename )
+            st = os.stat( fsPath )
+            updateHash( sha, os.path.relpath( fsPath, fsRoot ).replace( os.sep, "/" ) )
+            updateHash( sha, (st.st_size, st.st_mtime) )
+
+def updateHash( sha, value, dataDir=None ):
+    '''Feed a canonical serialization of an Ice value into sha: members
+    in name order, dictionaries in key order, strings length-prefixed.
+    If a dataDir is given, PurposedDirectory entries also contribute the
+    files they cover; see updateDirectoryHash.'''
+    if value is None or isinstance( value, (bool, numbers.Number) ):
+        sha.update( repr( value ).encode('utf-8') )
+    elif isinstance( value, stringTypes ):
+        data = value.encode('utf-8')
+        sha.update( "s{0}:".format( len( data ) ).encode('utf-8') )
+        sha.update( data )
+    elif isinstance( value, (list, tuple) ):
+        sha.update( "[{0}:".format( len( value ) ).encode('utf-8') )
+        for item in value:
+            updateHash( sha, item, dataDir )
+        sha.update( b"]" )
+    elif isinstance( value, dict ):
+        sha.update( "{{{0}:".format( len( value ) ).encode('utf-8') )
+        for key in sorted( value.keys() ):
+            updateHash( sha, key )
+            updateHash( sha, value[key], dataDir )
+        sha.update( b"}" )
+    else:
+        sha.update( type( value ).__name__.encode('utf-8') )
+        members = sorted( [name for name in vars( value ) if not name.startswith( '_' )] )
+        if not members:
+            # enumerators print as their name
+            updateHash( sha, str( value ) )
+        for name in members:
+            updateHash( sha, name )
+            updateHash( sha, getattr( value, name ), dataDir )
+        if dataDir is not None and isinstance( value, cvac.PurposedDirectory ):
+            updateDirectoryHash( sha, value, dataDir )
+
+class TrainingCache(object):
+    '''A directory of trained detectors, one subdirectory per entry with
+    the DetectorData and, if there is one, a copy of the model file.
+    Entries are keyed by the RunSet and a description of the trainer.
+    The least recently used entries are removed once there are more
+    than maxEntries or they take more than maxBytes.'''
+
+    def __init__( self, cacheDir=None, maxBytes=1024**3, maxEntries=None ):
+        if not cacheDir:
+            cacheDir = os.path.join( os.path.expanduser("~"), ".cvac", "training" )
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+
+    def getKey( self, runset, trainerKey, dataDir="data" ):
+        '''The key for training the runset with a trainer as described
+        by trainerKey, a string or other Ice-like value.  The files in the
+        runset's PurposedDirectory entries are looked up below dataDir.'''
+        sha = hashlib.sha1()
+        updateHash( sha, trainerKey )
+        updateHash( sha, runset, dataDir )
+        return sha.hexdigest()
+
+    def getEntryDir( self, key ):
+        return os.path.join( self.cacheDir, key )
+
+    def lookup( self, key ):
+        '''Return (DetectorData, local model file or None) for the key,
+        or None if there is no such entry.  The entry becomes the most
+        recently used one.'''
+        entryFile = os.path.join( self.getEntryDir( key ), "entry" )
+        if not os.path.exists( entryFile ):
+            return None
+        fin = open( entryFile, 'r' )
+        try:
+            entry = json.load( fin )
+        except ValueError:
+            return None
+        finally:
+            fin.close()
+        if not isinstance( entry, dict ) or entry.get('format')!=formatVersion:
+            return None
+        try:
+            detData = cvac.DetectorData()
+            # enumerator names only, not arbitrary attributes of the class
+            if not re.match( "^[A-Z][A-Z_]*$", entry['type'] ):
+                return None
+            detData.type = getattr( cvac.DetectorDataType, str( entry['type'] ) )
+            if entry['data'] is not None:
+                detData.data = base64.b64decode( entry['data'].encode('ascii') )
+            if entry['file']:
+                detData.file = cvac.FilePath( cvac.DirectoryPath( str( entry['file'][0] ) ),
+                                              str( entry['file'][1] ) )
+            modelFile = None
+            if entry['model']:
+                # only model files that store() placed in the entry directory
+                model = str( entry['model'] )
+                if os.path.basename( model )!=model or model in ("entry", ".", ".."):
+                    return None
+                modelFile = os.path.join( self.getEntryDir( key ), model )
+                if not os.path.exists( modelFile ):
+                    return None
+        except (KeyError, TypeError, ValueError, AttributeError, IndexError):
+            return None
+        os.utime( entryFile, None )
+        return (detData, modelFile)
+
+    def store( self, key, detData, modelFile=None ):
+        '''Add an entry for the DetectorData, along with a copy of the
+        local modelFile if given, and evict old entries if needed'''
+        entryDir = self.getEntryDir( key )
+        if os.path.exists( entryDir ):
+            shutil.rmtree( entryDir )
+        os.makedirs( entryDir )
+        fileKey = None
+        if detData.file:
+            fileKey = (detData.file.directory.relativePath, detData.file.filename)
+        model = None
+        if modelFile:
+            model = re.sub( "[^A-Za-z0-9_.-]+", "_", os.path.basename( modelFile ) )
+            if model=="entry":
+                model = "entry_"
+            shutil.copyfile( modelFile, os.path.join( entryDir, model ) )
+        data = None
+        if detData.data is not None:
+            # a ByteSeq may be a string or a list of integers
+            data = base64.b64encode( bytes( bytearray( detData.data ) ) ).decode('ascii')
+        entry = {'format':formatVersion, 'type':str( detData.type ),
+                 'data':data, 'file':fileKey, 'model':model}
+        tmpname = os.path.join( entryDir, "entry.tmp" )
+        fout = open( tmpname, 'w' )
+        try:
+            json.dump( entry, fout )
+        finally:
+            fout.close()
+        os.rename( tmpname, os.path.join( entryDir, "entry" ) )
+        self.evict()
+
+    def remove( self, key ):
+        shutil.rmtree( self.getEntryDir( key ), ignore_errors=True )
+
+    def getEntries( self ):
+        '''A list of (last use, bytes, key) for all entries, oldest first'''
+        entries = []
+        if not os.path.exists( self.cacheDir ):
+            return entries
+        for key in os.listdir( self.cacheDir ):
+            entryDir = self.getEntryDir( key )
+            entryFile = os.path.join( entryDir, "entry" )
+            if not os.path.exists( entryFile ):
+                continue
+            size = 0
+            for fname in os.listdir( entryDir ):
+                size += os.path.getsize( os.path.join( entryDir, fname ) )
+            entries.append( (os.path.getmtime( entryFile ), size, key) )
+        entries.sort()
+        return entries
+
+    def evict( self ):
+        '''Remove least recently used entries until the limits are met'''
+        entries = self.getEntries()
+        total = sum( [size for lastUse, size, key in entries] )
+        while entries and ((self.maxBytes is not None and total>self.maxBytes)
+                           or (self.maxEntries is not None
+                               and len( entries )>self.maxEntries)):
+            lastUse, size, key = entries.pop( 0 )
+            self.remove( key )
+            total -= size
@@ -0,0 +1,60 @@
+from __future__ import print_function
+# test that easy receives the callbacks of all services on one object
+# adapter and unregisters every receiver when its call is done;
+# this does not need any CVAC services to be running
+import sys, traceback
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+
+class CallbackAdapterTest(unittest.TestCase):
+
+    serverIC = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.runset = easy.createRunSet( localservices.createLabelables( 5 ) )['runset']
+        self.detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+        # note the identity of every receiver that easy registers
+        self.cbIDs = []
+        self.addCallback = easy.addCallback
+        def recordingAddCallback( service, callbackRecv ):
+            cbID = self.addCallback( service, callbackRecv )
+            self.cbIDs.append( cbID )
+            return cbID
+        easy.addCallback = recordingAddCallback
+
+    def serve(self, servant, proxyClass):
+        return localservices.serveToEasy( self.serverIC, servant, proxyClass )
+
+    def test_sharedAdapter(self):
+        detectors = [self.serve( localservices.LocalDetectorI(), cvac.DetectorPrx )
+                     for idx in range( 2 )]
+        trainer = self.serve( localservices.LocalDetectorTrainerI(), cvac.DetectorTrainerPrx )
+        adapter = easy.getCallbackAdapter()
+        for idx in range( 3 ):
+            for detector in detectors:
+                self.assertEqual( len( easy.detect( detector, self.detectorData,
+                                                    self.runset ) ), 5 )
+                self.assertTrue( easy.getCallbackAdapter() is adapter )
+                self.assertEqual( adapter.find( self.cbIDs[-1] ), None )
+            easy.train( trainer, self.runset )
+            self.assertTrue( easy.getCallbackAdapter() is adapter )
+            self.assertEqual( adapter.find( self.cbIDs[-1] ), None )
+        # every call registered its own receiver
+        self.assertEqual( len( set( [cbID.name for cbID in self.cbIDs] ) ), 9 )
+
+    def tearDown(self):
+        # Clean up
+        easy.addCallback = self.addCallback
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
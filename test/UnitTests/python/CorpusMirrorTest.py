@@ -0,0 +1,144 @@
+from __future__ import print_function
+# test client-side corpus mirroring against file:// URLs and local
+# HTTP stand-ins for the mirrors; this does not need any CVAC services
+# to be running
+import sys, traceback
+import os
+import io
+import tarfile
+import tempfile
+import shutil
+import unittest
+import paths
+import easy
+import corpusmirror
+import localservices
+
+chunkSize = 64*1024
+
+class CorpusMirrorTest(unittest.TestCase):
+
+    workDir = None
+    cwd = None
+
+    #
+    # a gzipped tar archive of 30 files in two directories, and one
+    # member that tries to escape the target directory
+    #
+    def setUp(self):
+        self.workDir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir( self.workDir )
+        os.makedirs( "mirrors" )
+        self.contents = {}
+        tar = tarfile.open( "mirrors/TestCorpus.tar.gz", "w:gz" )
+        for idx in range( 30 ):
+            name = "cat{0}/img{1}.jpg".format( idx%2, idx )
+            data = os.urandom( 20000+idx*500 )
+            self.contents[name] = data
+            self.addMember( tar, name, data )
+        self.addMember( tar, "../escaped.txt", b"outside" )
+        tar.close()
+        self.archiveSize = os.path.getsize( "mirrors/TestCorpus.tar.gz" )
+        self.servers = []
+
+    def addMember(self, tar, name, data):
+        info = tarfile.TarInfo( name )
+        info.size = len( data )
+        tar.addfile( info, io.BytesIO( data ) )
+
+    def startServer(self, latency=0.0, ranges=True):
+        server = localservices.LocalHTTPServer( "mirrors", latency, ranges )
+        server.start()
+        self.servers.append( server )
+        return server
+
+    def writeProperties(self, locations):
+        names = ["main"]+["mir{0}".format( idx ) for idx in range( 1, len(locations) )]
+        fout = open( "TestCorpus.properties", 'w' )
+        fout.write( "# a test corpus\nname = TestCorpus\nmirrors = {0}\n".format(
+            ", ".join( names ) ) )
+        for name, location in zip( names, locations ):
+            fout.write( "{0}_location = {1}\n{0}_locationType = url\n"
+                        "{0}_compressType = gzip\n{0}_archiveType = tar\n".format(
+                            name, location ) )
+        fout.close()
+        return "TestCorpus.properties"
+
+    def checkMirror(self, target):
+        self.assertEqual( target, os.path.join( "data", "TestCorpus" ) )
+        for name in self.contents:
+            fin = open( os.path.join( target, name ), 'rb' )
+            self.assertEqual( fin.read(), self.contents[name] )
+            fin.close()
+        self.assertFalse( os.path.exists( os.path.join( "data", "escaped.txt" ) ) )
+        self.assertTrue( os.path.exists( corpusmirror.getStatusFile( target ) ) )
+
+    def test_properties(self):
+        props = corpusmirror.readProperties( self.writeProperties( ["a", "b"] ) )
+        mirrors = corpusmirror.getMirrors( props )
+        self.assertEqual( [(m['name'], m['location'], m['compressType']) for m in mirrors],
+                          [("main", "a", "gzip"), ("mir1", "b", "gzip")] )
+
+    def test_fileURL(self):
+        url = "file://"+os.path.abspath( "mirrors/TestCorpus.tar.gz" )
+        props = self.writeProperties( [url] )
+        target = easy.mirrorCorpus( props, chunkSize=chunkSize )
+        self.checkMirror( target )
+        # an existing mirror is not downloaded again
+        os.remove( "mirrors/TestCorpus.tar.gz" )
+        self.assertEqual( easy.mirrorCorpus( props, chunkSize=chunkSize ), target )
+
+    #
+    # the faster mirror serves all chunks
+    #
+    def test_selectFastest(self):
+        slow = self.startServer( latency=0.3 )
+        fast = self.startServer()
+        props = self.writeProperties( [slow.getURL( "TestCorpus.tar.gz" ),
+                                       fast.getURL( "TestCorpus.tar.gz" )] )
+        target = easy.mirrorCorpus( props, chunkSize=chunkSize )
+        self.checkMirror( target )
+        self.assertEqual( slow.requests, 1 )
+        numChunks = (self.archiveSize+chunkSize-1)//chunkSize
+        self.assertEqual( fast.requests, 1+numChunks )
+
+    #
+    # after a crash, only the missing chunks are downloaded
+    #
+    def test_resume(self):
+        server = self.startServer()
+        url = server.getURL( "TestCorpus.tar.gz" )
+        os.makedirs( "data/TestCorpus/.meta" )
+        download = corpusmirror.ArchiveDownload(
+            url, self.archiveSize, "data/TestCorpus/.meta/TestCorpus.tar.gz", chunkSize )
+        fout = open( download.partFile, 'wb' )
+        fout.truncate( self.archiveSize )
+        fout.close()
+        for idx in range( 5 ):
+            download.fetchChunk( idx )
+        server.bytesSent = 0
+        target = easy.mirrorCorpus( self.writeProperties( [url] ), chunkSize=chunkSize,
+                                    probeBytes=1024 )
+        self.checkMirror( target )
+        self.assertEqual( server.bytesSent, self.archiveSize-5*chunkSize+1024 )
+
+    #
+    # a server without byte ranges is read in one request
+    #
+    def test_noRanges(self):
+        server = self.startServer( ranges=False )
+        props = self.writeProperties( [server.getURL( "TestCorpus.tar.gz" )] )
+        self.checkMirror( easy.mirrorCorpus( props, chunkSize=chunkSize ) )
+        self.assertEqual( server.requests, 2 )
+
+    def tearDown(self):
+        # Clean up
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        os.chdir( self.cwd )
+        shutil.rmtree( self.workDir, ignore_errors=True )
+
+if __name__ == '__main__':
+    unittest.main()
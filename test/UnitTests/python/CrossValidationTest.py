@@ -0,0 +1,79 @@
+from __future__ import print_function
+# test easy's k-fold cross-validation against in-process stand-in
+# trainers and detectors; this does not need any CVAC services to be running
+import sys, traceback
+import time
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+
+class CrossValidationTest(unittest.TestCase):
+
+    serverIC = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.categories = {}
+        for lb in localservices.createLabelables( 23, numCategories=3 ):
+            self.categories.setdefault( lb.lab.name, [] ).append( lb )
+
+    def serve(self, servant, proxyClass):
+        return localservices.serveToEasy( self.serverIC, servant, proxyClass )
+
+    #
+    # every Labelable is in exactly one fold, and every fold
+    # gets its share of every category
+    #
+    def test_createFolds(self):
+        folds = easy.createFolds( self.categories, 5, seed=3 )
+        self.assertEqual( [sum( [len( fold[key] ) for key in fold] ) for fold in folds],
+                          [5, 5, 5, 4, 4] )
+        for key in self.categories:
+            sizes = [len( fold[key] ) for fold in folds]
+            self.assertTrue( max( sizes )-min( sizes )<=1 )
+        merged = easy.mergeFolds( folds )
+        for key in self.categories:
+            self.assertEqual( len( merged[key] ), len( self.categories[key] ) )
+
+    #
+    # with a trainer and a detector per fold, the folds run concurrently
+    #
+    def test_crossValidate(self):
+        latency = 0.3
+        trainers = [self.serve( localservices.LocalDetectorTrainerI( latency=latency ),
+                                cvac.DetectorTrainerPrx ) for idx in range( 5 )]
+        detectors = [self.serve( localservices.LocalDetectorI( numClasses=3 ),
+                                 cvac.DetectorPrx ) for idx in range( 5 )]
+        start = time.time()
+        res = easy.crossValidate( trainers, detectors, self.categories, numFolds=5, seed=3 )
+        elapsed = time.time()-start
+        self.assertEqual( res['failed'], [] )
+        self.assertEqual( res['confmat'].matrix.sum(), 23 )
+        self.assertEqual( len( res['folds'] ), 5 )
+        self.assertTrue( elapsed<3*latency )
+
+    #
+    # without trainers or detectors no fold could run; fail at once
+    # rather than wait for a service forever
+    #
+    def test_noServices(self):
+        self.assertRaises( RuntimeError, easy.crossValidate, [], [],
+                           self.categories, numFolds=2 )
+        detectors = [self.serve( localservices.LocalDetectorI( numClasses=3 ),
+                                 cvac.DetectorPrx )]
+        self.assertRaises( RuntimeError, easy.crossValidate, [], detectors,
+                           self.categories, numFolds=2 )
+
+    def tearDown(self):
+        # Clean up
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+from __future__ import print_function
+# test the local data set cache that easy.getDataSet can use;
+# this does not need any CVAC services to be running
+import sys, traceback
+import paths
+import cvac
+import unittest
+import os
+import time
+import json
+import tempfile
+import shutil
+import datasetcache
+import localservices
+
+# seconds per Labelable that loading a cached data set may take,
+# best of loadRuns
+loadBudget = 200e-6
+loadRuns = 3
+
+class DataSetCacheTest(unittest.TestCase):
+
+    cacheDir = None
+
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp()
+        self.cache = datasetcache.DataSetCache( self.cacheDir )
+        path = cvac.FilePath( cvac.DirectoryPath( "trainImg/kr" ), "flag.jpg" )
+        sub = cvac.Substrate( True, False, path, 640, 480 )
+        label = cvac.Label( True, "kr", {'orientation':'frontal'}, cvac.Semantics() )
+        full = cvac.Labelable( 1.0, label, sub )
+        boxed = cvac.LabeledLocation( 0.5, label, sub, cvac.BBox( 1, 2, 30, 40 ) )
+        self.labelList = [full, boxed]
+
+    #
+    # Labelables and their subclasses survive a round trip
+    #
+    def test_storeAndLoad(self):
+        fname = self.cache.getFilename( "CorpusServer", "flags", "corpus/flags.properties" )
+        self.cache.store( fname, "v1", "flags", self.labelList )
+        loaded = self.cache.load( fname, "v1" )
+        self.assertEqual( len( loaded ), 2 )
+        self.assertEqual( type( loaded[0] ), cvac.Labelable )
+        self.assertEqual( loaded[0].sub, self.labelList[0].sub )
+        self.assertEqual( loaded[0].lab, self.labelList[0].lab )
+        self.assertEqual( type( loaded[1] ), cvac.LabeledLocation )
+        self.assertEqual( type( loaded[1].loc ), cvac.BBox )
+        self.assertEqual( loaded[1].loc.width, 30 )
+        self.assertEqual( loaded[1].confidence, 0.5 )
+
+    #
+    # an entry for a different data set version is not used,
+    # and invalidation removes the entries of only one corpus
+    #
+    def test_versionAndInvalidate(self):
+        fname = self.cache.getFilename( "CorpusServer", "flags", None )
+        other = self.cache.getFilename( "CorpusServer", "flags_more", None )
+        self.cache.store( fname, "v1", "flags", self.labelList )
+        self.cache.store( other, "v1", "flags_more", self.labelList )
+        self.assertEqual( self.cache.load( fname, "v2" ), None )
+        self.cache.invalidate( "flags" )
+        self.assertFalse( os.path.exists( fname ) )
+        self.assertTrue( os.path.exists( other ) )
+
+    #
+    # entries are data, not code: a file that names anything but a cvac
+    # class, or that is not JSON at all, is not used
+    #
+    def test_untrustedEntry(self):
+        fname = self.cache.getFilename( "CorpusServer", "flags", None )
+        self.cache.store( fname, "v1", "flags", self.labelList )
+        fin = open( fname )
+        header = fin.readline()
+        fin.close()
+        fout = open( fname, 'w' )
+        fout.write( header )
+        fout.write( '[["__builtins__", []]]\n{"s":[[0]]}' )
+        fout.close()
+        self.assertEqual( self.cache.load( fname, "v1" ), None )
+        # members that do not match the type table
+        fout = open( fname, 'w' )
+        fout.write( header )
+        fout.write( '[["BBox", ["height", "width", "x", "y"]]]\n{"s":[[0, 1, 2]]}' )
+        fout.close()
+        self.assertEqual( self.cache.load( fname, "v1" ), None )
+        fout = open( fname, 'wb' )
+        fout.write( b"cos\nsystem\n(S'echo unsafe'\ntR." )
+        fout.close()
+        self.assertEqual( self.cache.load( fname, "v1" ), None )
+
+    #
+    # types are named once per file, and loading stays within budget
+    #
+    def test_loadTime(self):
+        labelList = localservices.createLabelables( 5000, numCategories=10,
+                                                    withBoxes=True, numProperties=2 )
+        fname = self.cache.getFilename( "CorpusServer", "large", None )
+        self.cache.store( fname, "v1", "large", labelList )
+        fin = open( fname )
+        fin.readline()
+        typeNames = [name for name, members in json.loads( fin.readline() )]
+        fin.close()
+        self.assertEqual( len( typeNames ), len( set( typeNames ) ) )
+        self.assertTrue( "LabeledLocation" in typeNames )
+        best = None
+        for run in range( loadRuns ):
+            start = time.time()
+            loaded = self.cache.load( fname, "v1" )
+            elapsed = time.time()-start
+            if best is None or elapsed<best:
+                best = elapsed
+        print( "loading a cached data set: {0:.1f} us per Labelable".format(
+                1e6*best/len( labelList ) ) )
+        self.assertEqual( len( loaded ), len( labelList ) )
+        self.assertEqual( loaded[-1].loc.x, labelList[-1].loc.x )
+        self.assertEqual( loaded[-1].lab.properties, labelList[-1].lab.properties )
+        self.assertTrue( best<loadBudget*len( labelList ) )
+
+    def tearDown(self):
+        shutil.rmtree( self.cacheDir, ignore_errors=True )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+from __future__ import print_function
+# test easy.DetectorSession against in-process stand-in detectors;
+# this does not need any CVAC services to be running
+import sys, traceback
+import time
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+
+class DetectorSessionTest(unittest.TestCase):
+
+    serverIC = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.runset = easy.createRunSet( localservices.createLabelables( 3 ) )['runset']
+        self.detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+
+    def serve(self, servant):
+        return localservices.serveToEasy( self.serverIC, servant, cvac.DetectorPrx )
+
+    #
+    # the model is loaded once for all detect calls, and again
+    # only when the detector lost it
+    #
+    def test_session(self):
+        servant = localservices.LocalDetectorI()
+        session = easy.DetectorSession( self.serve( servant ), self.detectorData )
+        for idx in range( 3 ):
+            self.assertEqual( len( session.detect( self.runset ) ), 3 )
+        self.assertEqual( servant.initializeCalls, 1 )
+        self.assertEqual( servant.processCalls, 3 )
+        servant.destroy()
+        session.detect( self.runset )
+        self.assertEqual( servant.initializeCalls, 2 )
+        session.destroy()
+        self.assertFalse( servant.isInitialized() )
+
+    #
+    # sessions on several detectors are started in parallel
+    #
+    def test_startSessions(self):
+        latency = 0.3
+        servants = [localservices.LocalDetectorI( latency=latency ) for idx in range( 4 )]
+        start = time.time()
+        res = easy.startSessions( [self.serve( servant ) for servant in servants],
+                                  self.detectorData )
+        self.assertTrue( time.time()-start<2*latency )
+        self.assertEqual( len( res['sessions'] ), 4 )
+        self.assertEqual( res['failed'], [] )
+        for session in res['sessions']:
+            session.destroy()
+
+    def tearDown(self):
+        # Clean up
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+from __future__ import print_function
+# test easy.detectSharded against in-process stand-in detectors that
+# fail on chosen shards; this does not need any CVAC services to be running
+import sys, traceback
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+
+class ShardFailingDetectorI(localservices.LocalDetectorI):
+    '''A LocalDetectorI that fails on shards by the name of their first
+    image: failOn maps a name to the number of times to fail on it, or
+    None to fail on it every time.  With failAll, every call fails.'''
+
+    def __init__( self, failOn=None, failAll=False, **kwargs ):
+        localservices.LocalDetectorI.__init__( self, **kwargs )
+        self.failOn = dict( failOn or {} )
+        self.failAll = failAll
+        self.failedCalls = 0
+
+    def process( self, client, run, current=None ):
+        first = localservices.getRunSetLabelables( run )[0].sub.path.filename
+        fail = self.failAll
+        if first in self.failOn:
+            remaining = self.failOn[first]
+            if remaining is None:
+                fail = True
+            elif remaining>0:
+                self.failOn[first] = remaining-1
+                fail = True
+        if fail:
+            self.failedCalls += 1
+            raise RuntimeError("failing on the shard of "+first)
+        localservices.LocalDetectorI.process( self, client, run, current )
+
+class DetectorShardingTest(unittest.TestCase):
+
+    serverIC = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.runset = easy.createRunSet( localservices.createLabelables( 20 ) )['runset']
+        self.detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+
+    def serve(self, servant):
+        return localservices.serveToEasy( self.serverIC, servant, cvac.DetectorPrx )
+
+    def getImageNames(self, labelables):
+        return [lb.sub.path.filename for lb in labelables]
+
+    def getResultNames(self, res):
+        return self.getImageNames( [result.original for result in res['results']] )
+
+    def getNames(self, indices):
+        return ["img{0}.jpg".format( idx ) for idx in indices]
+
+    #
+    # a shard that fails is retried, and the results stay in runset order
+    #
+    def test_requeue(self):
+        servant = ShardFailingDetectorI( failOn={'img5.jpg':1} )
+        res = easy.detectSharded( [self.serve( servant )], self.detectorData,
+                                  self.runset, shardSize=5 )
+        self.assertEqual( res['failed'], [] )
+        self.assertEqual( self.getResultNames( res ), self.getNames( range( 20 ) ) )
+        self.assertEqual( servant.failedCalls, 1 )
+        self.assertEqual( servant.processCalls, 4 )
+
+    #
+    # a shard that keeps failing is reported once its retries are used up
+    #
+    def test_failedShard(self):
+        servant = ShardFailingDetectorI( failOn={'img5.jpg':None} )
+        res = easy.detectSharded( [self.serve( servant )], self.detectorData,
+                                  self.runset, shardSize=5, retries=1 )
+        self.assertEqual( self.getResultNames( res ),
+                          self.getNames( list( range( 5 ) )+list( range( 10, 20 ) ) ) )
+        self.assertEqual( len( res['failed'] ), 1 )
+        shard, ex = res['failed'][0]
+        self.assertEqual( self.getImageNames( localservices.getRunSetLabelables( shard ) ),
+                          self.getNames( range( 5, 10 ) ) )
+        self.assertTrue( ex is not None )
+        self.assertEqual( servant.failedCalls, 2 )
+
+    #
+    # a detector that fails twice in a row gets no more shards; the
+    # others take over, finishing in some order but reporting in order
+    #
+    def test_dropDetector(self):
+        broken = ShardFailingDetectorI( failAll=True )
+        slow = localservices.LocalDetectorI( latency=0.05, batchSize=2 )
+        fast = localservices.LocalDetectorI( batchSize=2 )
+        res = easy.detectSharded( [self.serve( servant ) for servant in [broken, slow, fast]],
+                                  self.detectorData, self.runset, shardSize=2, retries=3 )
+        self.assertEqual( res['failed'], [] )
+        self.assertEqual( self.getResultNames( res ), self.getNames( range( 20 ) ) )
+        self.assertEqual( broken.failedCalls, 2 )
+        self.assertEqual( slow.processCalls+fast.processCalls, 10 )
+
+    #
+    # shards left over when every detector has given up are failed
+    #
+    def test_leftoverShards(self):
+        servants = [ShardFailingDetectorI( failAll=True ) for idx in range( 2 )]
+        res = easy.detectSharded( [self.serve( servant ) for servant in servants],
+                                  self.detectorData, self.runset, shardSize=5, retries=5 )
+        self.assertEqual( res['results'], [] )
+        self.assertEqual( [servant.failedCalls for servant in servants], [2, 2] )
+        failedNames = []
+        for shard, ex in res['failed']:
+            self.assertTrue( ex is not None )
+            failedNames.extend( self.getImageNames(
+                localservices.getRunSetLabelables( shard ) ) )
+        self.assertEqual( failedNames, self.getNames( range( 20 ) ) )
+
+    def tearDown(self):
+        # Clean up
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+from __future__ import print_function
+# test easy's streaming detection (detect_async, detect_iter) against
+# in-process stand-in detectors; this does not need any CVAC services
+# to be running
+import sys, traceback
+import time
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+
+class FailingDetectorI(localservices.LocalDetectorI):
+    '''Reports all batches, then fails'''
+
+    def process( self, client, run, current=None ):
+        localservices.LocalDetectorI.process( self, client, run, current )
+        # reaches the client as an Ice.UnknownException
+        raise RuntimeError("detector failed after its results")
+
+class DetectorStreamTest(unittest.TestCase):
+
+    serverIC = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.runset = easy.createRunSet( localservices.createLabelables( 20 ) )['runset']
+        self.detData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+
+    def serve(self, servant, proxyClass):
+        return localservices.serveToEasy( self.serverIC, servant, proxyClass )
+
+    def getImageNames(self, results):
+        return [res.original.sub.path.filename for res in results]
+
+    def test_detectAsync(self):
+        servant = localservices.LocalDetectorI( batchSize=3 )
+        detector = self.serve( servant, cvac.DetectorPrx )
+        stream = easy.detect_async( detector, self.detData, self.runset )
+        results = stream.wait()
+        self.assertEqual( self.getImageNames( results ),
+                          ["img{0}.jpg".format( idx ) for idx in range( 20 )] )
+        self.assertTrue( stream.finished.is_set() )
+        self.assertEqual( servant.processCalls, 1 )
+
+    #
+    # batches arrive in the order the detector sends them
+    #
+    def test_detectIter(self):
+        detector = self.serve( localservices.LocalDetectorI( batchSize=3 ), cvac.DetectorPrx )
+        batches = list( easy.detect_iter( detector, self.detData, self.runset ) )
+        self.assertEqual( [len( batch.results ) for batch in batches], [3]*6+[2] )
+        names = []
+        for batch in batches:
+            names.extend( self.getImageNames( batch.results ) )
+        self.assertEqual( names, ["img{0}.jpg".format( idx ) for idx in range( 20 )] )
+
+    #
+    # a full stream holds up the detector, but not other calls
+    #
+    def test_backpressure(self):
+        servant = localservices.LocalDetectorI( batchSize=1 )
+        detector = self.serve( servant, cvac.DetectorPrx )
+        other = self.serve( localservices.LocalDetectorI( name="Other" ), cvac.DetectorPrx )
+        stream = easy.detect_async( detector, self.detData, self.runset, maxBuffered=2 )
+        time.sleep( 0.3 )
+        self.assertFalse( stream.finished.is_set() )
+        self.assertEqual( stream.queue.qsize(), 2 )
+        # while the detector's callback waits, replies still arrive
+        self.assertEqual( other.getName(), "Other" )
+        self.assertEqual( len( stream.wait() ), 20 )
+        self.assertTrue( stream.finished.is_set() )
+
+    #
+    # closing the stream lets the detector finish without a consumer
+    #
+    def test_close(self):
+        servant = localservices.LocalDetectorI( batchSize=1 )
+        detector = self.serve( servant, cvac.DetectorPrx )
+        stream = easy.detect_async( detector, self.detData, self.runset, maxBuffered=2 )
+        first = next( iter( stream ) )
+        self.assertEqual( self.getImageNames( first.results ), ["img0.jpg"] )
+        stream.close()
+        stream.finished.wait( 5 )
+        self.assertTrue( stream.finished.is_set() )
+        self.assertEqual( list( stream ), [] )
+        # leaving a detect_iter loop early closes its stream
+        batches = easy.detect_iter( detector, self.detData, self.runset, maxBuffered=2 )
+        next( batches )
+        batches.close()
+        self.assertEqual( servant.processCalls, 2 )
+
+    #
+    # a failed detection raises once the batches before it are consumed
+    #
+    def test_error(self):
+        detector = self.serve( FailingDetectorI( batchSize=5 ), cvac.DetectorPrx )
+        received = []
+        def consume():
+            for batch in easy.detect_iter( detector, self.detData, self.runset ):
+                received.extend( batch.results )
+        self.assertRaises( Exception, consume )
+        self.assertEqual( len( received ), 20 )
+        stream = easy.detect_async( detector, self.detData, self.runset )
+        self.assertRaises( Exception, stream.wait )
+        self.assertTrue( stream.progress.error is not None )
+
+    def tearDown(self):
+        # Clean up
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
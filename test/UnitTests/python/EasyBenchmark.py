@@ -0,0 +1,196 @@
+from __future__ import print_function
+# benchmarks of easy's client-side costs, run against in-process
+# stand-in services; this does not need any CVAC services to be running.
+# CVAC_BENCHMARK_SIZE selects "small" (default, a quick smoke run) or
+# "large" problem sizes.  If CVAC_BENCHMARK_OUTPUT names a file, every
+# measurement is appended to it as one line of JSON.
+import sys, traceback
+import os
+import time
+import json
+import tempfile
+import shutil
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+import datasetcache
+
+sizes = {
+    'small': {'files':20, 'fileSize':64*1024, 'labelables':2000,
+              'roundTrips':20, 'results':2000, 'shards':16},
+    'large': {'files':500, 'fileSize':1024*1024, 'labelables':100000,
+              'roundTrips':200, 'results':100000, 'shards':64},
+}
+size = sizes[os.environ.get( "CVAC_BENCHMARK_SIZE", "small" )]
+
+def report( name, value, unit ):
+    print( "{0}: {1:.3f} {2}".format( name, value, unit ) )
+    outfile = os.environ.get( "CVAC_BENCHMARK_OUTPUT" )
+    if outfile:
+        fout = open( outfile, 'a' )
+        try:
+            fout.write( json.dumps( {'benchmark':name, 'value':value, 'unit':unit,
+                                     'size':size} )+"\n" )
+        finally:
+            fout.close()
+
+class EasyBenchmark(unittest.TestCase):
+
+    serverIC = None
+    workDir = None
+    cwd = None
+
+    #
+    # the services run on their own communicator, so that requests
+    # are marshaled just like with remote services
+    #
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.workDir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir( self.workDir )
+        os.makedirs( "data/bench" )
+        os.makedirs( "remote" )
+
+    def serve(self, servant, proxyClass):
+        return localservices.serveToEasy( self.serverIC, servant, proxyClass )
+
+    def test_putAllFiles(self):
+        fs = self.serve( localservices.LocalFileServiceI( "remote" ), cvac.FileServicePrx )
+        labelables = []
+        for idx in range( size['files'] ):
+            fpath = cvac.FilePath( cvac.DirectoryPath( "bench" ), "img{0}.jpg".format( idx ) )
+            fout = open( easy.getFSPath( fpath ), 'wb' )
+            fout.write( os.urandom( size['fileSize'] ) )
+            fout.close()
+            labelables.append( easy.getLabelable( fpath, "image" ) )
+        runset = easy.createRunSet( labelables )['runset']
+        start = time.time()
+        res = easy.putAllFiles( fs, runset )
+        elapsed = time.time()-start
+        self.assertEqual( len( res['uploaded'] ), size['files'] )
+        report( "putAllFiles throughput",
+                size['files']*size['fileSize']/elapsed/(1024*1024), "MB/s" )
+        report( "putAllFiles per file", 1000.0*elapsed/size['files'], "ms" )
+
+    def test_getDataSet(self):
+        labelables = localservices.createLabelables( size['labelables'], numCategories=10,
+                                                     withBoxes=True, numProperties=2 )
+        cs = self.serve( localservices.LocalCorpusServiceI( {'bench':labelables} ),
+                         cvac.CorpusServicePrx )
+        corpus = cs.openCorpus( cvac.FilePath( cvac.DirectoryPath( "corpus" ), "bench.properties" ) )
+        start = time.time()
+        categories, labelList = easy.getDataSet( corpus, corpusServer=cs )
+        elapsed = time.time()-start
+        self.assertEqual( len( labelList ), size['labelables'] )
+        report( "getDataSet", 1e6*elapsed/size['labelables'], "us per Labelable" )
+
+        cache = datasetcache.DataSetCache( "cache" )
+        easy.getDataSet( corpus, corpusServer=cs, cache=cache )
+        start = time.time()
+        categories, labelList = easy.getDataSet( corpus, corpusServer=cs, cache=cache )
+        elapsed = time.time()-start
+        self.assertEqual( len( labelList ), size['labelables'] )
+        report( "getDataSet from cache", 1e6*elapsed/size['labelables'], "us per Labelable" )
+
+    def test_detectRoundTrip(self):
+        detector = self.serve( localservices.LocalDetectorI(), cvac.DetectorPrx )
+        runset = easy.createRunSet( localservices.createLabelables( 1 ) )['runset']
+        detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+        times = []
+        for idx in range( size['roundTrips'] ):
+            start = time.time()
+            results = easy.detect( detector, detectorData, runset )
+            times.append( time.time()-start )
+            self.assertEqual( len( results ), 1 )
+        times.sort()
+        report( "detect round trip (median)", 1000.0*times[len( times )//2], "ms" )
+
+        session = easy.DetectorSession( detector, detectorData )
+        times = []
+        for idx in range( size['roundTrips'] ):
+            start = time.time()
+            results = session.detect( runset )
+            times.append( time.time()-start )
+            self.assertEqual( len( results ), 1 )
+        session.destroy()
+        times.sort()
+        report( "DetectorSession round trip (median)", 1000.0*times[len( times )//2], "ms" )
+
+    def test_detectResults(self):
+        detector = self.serve( localservices.LocalDetectorI( batchSize=100, foundPerResult=3 ),
+                               cvac.DetectorPrx )
+        labelables = localservices.createLabelables( size['results'] )
+        runset = easy.createRunSet( labelables )['runset']
+        detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+        start = time.time()
+        results = easy.detect( detector, detectorData, runset )
+        elapsed = time.time()-start
+        self.assertEqual( len( results ), size['results'] )
+        report( "detect result delivery", 1e6*elapsed/size['results'], "us per Result" )
+
+        try:
+            import numpy
+        except ImportError:
+            return
+        foundMap = {'0':'cat0', '1':'cat1'}
+        origMap = {'cat0':0, 'cat1':1}
+        start = time.time()
+        confmat = easy.getConfusionMatrix( results, origMap, foundMap )
+        elapsed = time.time()-start
+        self.assertEqual( confmat.matrix.sum(), size['results'] )
+        report( "getConfusionMatrix", 1e6*elapsed/size['results'], "us per Result" )
+
+        import resultstore
+        writer = resultstore.ResultStoreWriter( "results" )
+        writer.addResults( results )
+        writer.close()
+        store = resultstore.ResultStore( "results" )
+        start = time.time()
+        confmat = easy.getConfusionMatrix( store, origMap, foundMap )
+        elapsed = time.time()-start
+        self.assertEqual( confmat.matrix.sum(), size['results'] )
+        report( "getConfusionMatrix from a ResultStore", 1e6*elapsed/size['results'],
+                "us per Result" )
+
+    #
+    # the same sharded detection on one and on several detectors that
+    # each take shardLatency per shard
+    #
+    def test_detectShardedScaling(self):
+        shardSize = 10
+        shardLatency = 0.02
+        numDetectors = 4
+        labelables = localservices.createLabelables( size['shards']*shardSize )
+        runset = easy.createRunSet( labelables )['runset']
+        detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+        elapsed = {}
+        for count in [1, numDetectors]:
+            detectors = [self.serve( localservices.LocalDetectorI( latency=shardLatency/2,
+                                                                   batchSize=shardSize ),
+                                     cvac.DetectorPrx ) for idx in range( count )]
+            start = time.time()
+            res = easy.detectSharded( detectors, detectorData, runset, shardSize=shardSize )
+            elapsed[count] = time.time()-start
+            self.assertEqual( res['failed'], [] )
+            self.assertEqual( len( res['results'] ), len( labelables ) )
+            report( "detectSharded, {0} detector(s)".format( count ),
+                    1000.0*elapsed[count]/size['shards'], "ms per shard" )
+        report( "detectSharded speedup, {0} detectors".format( numDetectors ),
+                elapsed[1]/elapsed[numDetectors], "x" )
+
+    def tearDown(self):
+        # Clean up
+        os.chdir( self.cwd )
+        shutil.rmtree( self.workDir, ignore_errors=True )
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+from __future__ import print_function
+# test that importing easy is quick and has no side effects;
+# this does not need any CVAC services to be running
+import sys
+import os
+import subprocess
+import time
+import unittest
+import paths
+
+# seconds that "python -c 'import easy'" may take on top of starting a
+# bare interpreter, best of importRuns
+importBudget = 0.3
+importRuns = 5
+
+# modules that import easy should leave for the functions that need them
+deferredModules = ["Ice", "IcePy", "cvac", "progress", "mmap", "json",
+                   "hashlib", "random", "shutil", "corpusmirror", "evaluation"]
+
+class EasyImportTest(unittest.TestCase):
+
+    def getLoadedModules(self, statements):
+        '''Run the statements in a fresh interpreter and return which of
+        the deferredModules are loaded afterwards'''
+        script = "import sys; {0}; " \
+                 "print(' '.join([m for m in {1!r} if m in sys.modules]))".format(
+                     statements, deferredModules )
+        env = dict( os.environ )
+        env['PYTHONPATH'] = os.pathsep.join( [p for p in sys.path if p] )
+        out = subprocess.Popen( [sys.executable, "-c", script], env=env,
+                                stdout=subprocess.PIPE ).communicate()[0]
+        return out.decode().split()
+
+    def timeInterpreter(self, script):
+        '''Best wall-clock time of running the script in a fresh interpreter'''
+        env = dict( os.environ )
+        env['PYTHONPATH'] = os.pathsep.join( [p for p in sys.path if p] )
+        best = None
+        for run in range( importRuns ):
+            start = time.time()
+            subprocess.Popen( [sys.executable, "-c", script], env=env,
+                              stderr=subprocess.PIPE ).communicate()
+            elapsed = time.time()-start
+            if best is None or elapsed<best:
+                best = elapsed
+        return best
+
+    def test_importBudget(self):
+        bare = self.timeInterpreter( "pass" )
+        withEasy = self.timeInterpreter( "import easy" )
+        print( "import easy: {0:.3f}s on top of {1:.3f}s for the interpreter".format(
+                withEasy-bare, bare ) )
+        self.assertTrue( withEasy-bare<importBudget )
+
+    #
+    # the communicator is created upon first use, not upon import
+    #
+    def test_noCommunicator(self):
+        import easy
+        self.assertTrue( easy.ic is None )
+        self.assertFalse( hasattr( easy, 'unittest' ) )
+
+    def test_deferredImports(self):
+        self.assertEqual( self.getLoadedModules( "import easy" ), [] )
+        # using cvac through easy loads it
+        loaded = self.getLoadedModules( "import easy; easy.getCvacPath( 'a/b.jpg' )" )
+        self.assertTrue( "cvac" in loaded )
+
+    #
+    # callback receivers are servants of their cvac interface
+    #
+    def test_callbackServant(self):
+        import easy
+        import cvac
+        recv = easy.DetectorCallbackReceiverI()
+        self.assertTrue( isinstance( recv, cvac.DetectorCallbackHandler ) )
+        self.assertTrue( isinstance( recv, easy.DetectorCallbackReceiverI ) )
+        self.assertFalse( recv.detectionFinished )
+        self.assertTrue( isinstance( easy.CorpusCallbackI( "corpus" ), cvac.CorpusCallback ) )
+        # receivers are instances of their declared class, which now
+        # derives from the cvac interface, as do its subclasses
+        self.assertTrue( type( recv ) is easy.DetectorCallbackReceiverI )
+        self.assertTrue( issubclass( easy.DetectorCallbackReceiverI,
+                                     cvac.DetectorCallbackHandler ) )
+        self.assertTrue( issubclass( easy.ResultStoreCallbackI, cvac.DetectorCallbackHandler ) )
+        # later receivers take constructor arguments as the first did
+        for count in range( 2 ):
+            stream = easy.DetectorResultStream( 4 )
+            self.assertTrue( isinstance( stream, cvac.DetectorCallbackHandler ) )
+            self.assertEqual( stream.queue.maxsize, 4 )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+from __future__ import print_function
+# test easy.putFile against an in-process stand-in FileService;
+# this does not need any CVAC services to be running
+import sys, traceback
+import paths
+import Ice
+import cvac
+import unittest
+import os
+import tempfile
+import shutil
+import filecmp
+import easy
+import localservices
+
+class EasyPutFileTest(unittest.TestCase):
+
+    ic = None
+    workDir = None
+    cwd = None
+
+    #
+    # easy resolves CVAC paths relative to a "data" directory in the
+    # working directory, so create one with a test file in it
+    #
+    def setUp(self):
+        self.ic = Ice.initialize(sys.argv)
+        self.workDir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir( self.workDir )
+        os.makedirs( "data/upload" )
+        os.makedirs( "remote" )
+        self.filePath = cvac.FilePath( cvac.DirectoryPath( "upload" ), "media.avi" )
+        self.localFS = easy.getFSPath( self.filePath )
+        fout = open( self.localFS, 'wb' )
+        fout.write( os.urandom( 300*1024+17 ) )
+        fout.close()
+
+    def serve(self, servant):
+        fs, adapter = localservices.serve( self.ic, servant, cvac.FileServicePrx )
+        return fs
+
+    def remoteFS(self):
+        return os.path.join( self.workDir, "remote", "upload", "media.avi" )
+
+    #
+    # a file smaller than the chunk size goes out in one putFile call
+    #
+    def test_putSmallFile(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        easy.putFile( fs, self.filePath, chunkSize=1024*1024 )
+        self.assertEqual( servant.chunkCalls, 0 )
+        self.assertTrue( filecmp.cmp( self.localFS, self.remoteFS(), shallow=False ) )
+
+    #
+    # a larger file is streamed and no request exceeds the chunk size
+    #
+    def test_putChunked(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        chunkSize = 64*1024
+        easy.putFile( fs, self.filePath, chunkSize=chunkSize )
+        self.assertEqual( servant.chunkCalls, 5 )
+        self.assertTrue( servant.largestRequest<=chunkSize )
+        self.assertTrue( filecmp.cmp( self.localFS, self.remoteFS(), shallow=False ) )
+
+    #
+    # a chunk that arrived but whose reply got lost is not sent again;
+    # the transfer continues from the offset the FileService confirms
+    #
+    def test_resumeInterrupted(self):
+        servant = localservices.LocalFileServiceI( "remote", failOnChunk=3 )
+        fs = self.serve( servant )
+        easy.putFile( fs, self.filePath, chunkSize=64*1024 )
+        self.assertEqual( servant.bytesReceived, os.path.getsize( self.localFS ) )
+        self.assertTrue( filecmp.cmp( self.localFS, self.remoteFS(), shallow=False ) )
+
+    #
+    # an upload that was left incomplete earlier can be continued
+    #
+    def test_resumePartialFile(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        fin = open( self.localFS, 'rb' )
+        fs.putFileChunk( self.filePath, 0, fin.read( 100*1024 ) )
+        fin.close()
+        easy.putFile( fs, self.filePath, chunkSize=64*1024, resume=True )
+        self.assertEqual( servant.bytesReceived, os.path.getsize( self.localFS ) )
+        self.assertTrue( filecmp.cmp( self.localFS, self.remoteFS(), shallow=False ) )
+
+    #
+    # putAllFiles uploads concurrently and reports failures per file
+    # instead of aborting the whole batch
+    #
+    def test_putAllFiles(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        labelables = [ easy.getLabelable( self.filePath, "video" ) ]
+        for idx in range( 20 ):
+            fpath = cvac.FilePath( cvac.DirectoryPath( "upload" ),
+                                   "img{0}.jpg".format( idx ) )
+            fout = open( easy.getFSPath( fpath ), 'wb' )
+            fout.write( os.urandom( 1000 ) )
+            fout.close()
+            labelables.append( easy.getLabelable( fpath, "image" ) )
+        missing = cvac.FilePath( cvac.DirectoryPath( "upload" ), "missing.jpg" )
+        labelables.append( easy.getLabelable( missing, "image" ) )
+        runset = easy.createRunSet( labelables )['runset']
+
+        res = easy.putAllFiles( fs, runset, window=4 )
+        self.assertEqual( len( res['uploaded'] ), 21 )
+        self.assertEqual( len( res['existing'] ), 0 )
+        self.assertEqual( len( res['failed'] ), 1 )
+        self.assertEqual( res['failed'][0][0].filename, "missing.jpg" )
+
+        res = easy.putAllFiles( fs, runset, window=4 )
+        self.assertEqual( len( res['uploaded'] ), 0 )
+        self.assertEqual( len( res['existing'] ), 21 )
+
+    #
+    # with a manifest, unchanged files cause no RPCs on the next run,
+    # changed files are put again, and deleted files are forgotten
+    #
+    def test_uploadManifest(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        runset = easy.createRunSet( [ easy.getLabelable( self.filePath ) ] )['runset']
+        manifest = easy.UploadManifest( fs, manifestDir="manifests" )
+        res = easy.putAllFiles( fs, runset, manifest=manifest )
+        self.assertEqual( len( res['uploaded'] ), 1 )
+
+        manifest = easy.UploadManifest( fs, manifestDir="manifests" )
+        existsCalls = servant.existsCalls
+        res = easy.putAllFiles( fs, runset, manifest=manifest )
+        self.assertEqual( len( res['existing'] ), 1 )
+        self.assertEqual( servant.existsCalls, existsCalls )
+
+        fout = open( self.localFS, 'ab' )
+        fout.write( b"appended" )
+        fout.close()
+        res = easy.putAllFiles( fs, runset, manifest=manifest )
+        self.assertEqual( len( res['uploaded'] ), 1 )
+        self.assertTrue( filecmp.cmp( self.localFS, self.remoteFS(), shallow=False ) )
+
+        easy.deleteAllFiles( fs, res['uploaded'], manifest=manifest )
+        manifest = easy.UploadManifest( fs, manifestDir="manifests" )
+        self.assertFalse( manifest.hasEntry( self.filePath ) )
+
+    #
+    # files the FileService has already go into the manifest, too
+    #
+    def test_manifestExisting(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        easy.putFile( fs, self.filePath )
+        runset = easy.createRunSet( [ easy.getLabelable( self.filePath ) ] )['runset']
+        manifest = easy.UploadManifest( fs, manifestDir="manifests" )
+        res = easy.putAllFiles( fs, runset, manifest=manifest )
+        self.assertEqual( len( res['existing'] ), 1 )
+        manifest = easy.UploadManifest( fs, manifestDir="manifests" )
+        self.assertTrue( manifest.isCurrent( self.filePath ) )
+        existsCalls = servant.existsCalls
+        res = easy.putAllFiles( fs, runset, manifest=manifest )
+        self.assertEqual( len( res['existing'] ), 1 )
+        self.assertEqual( servant.existsCalls, existsCalls )
+
+    #
+    # a changed file whose remote copy is gone is simply put again,
+    # even if the FileService refuses to delete missing files
+    #
+    def test_manifestRemoteGone(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        runset = easy.createRunSet( [ easy.getLabelable( self.filePath ) ] )['runset']
+        manifest = easy.UploadManifest( fs, manifestDir="manifests" )
+        easy.putAllFiles( fs, runset, manifest=manifest )
+        os.remove( self.remoteFS() )
+        fout = open( self.localFS, 'ab' )
+        fout.write( b"appended" )
+        fout.close()
+        def deleteFile( file, current=None ):
+            raise cvac.FileServiceException("no such file")
+        servant.deleteFile = deleteFile
+        res = easy.putAllFiles( fs, runset, manifest=manifest )
+        self.assertEqual( len( res['failed'] ), 0 )
+        self.assertEqual( len( res['uploaded'] ), 1 )
+        self.assertTrue( filecmp.cmp( self.localFS, self.remoteFS(), shallow=False ) )
+
+    #
+    # substrates are deduplicated by path, and PurposedDirectory entries
+    # are expanded with their suffixes and recursive flag
+    #
+    def test_collectSubstrates(self):
+        os.makedirs( "data/upload/sub" )
+        for fname in ["a.jpg", "b.JPG", "c.txt", "sub/d.jpg"]:
+            open( os.path.join( "data/upload", fname ), 'w' ).close()
+        purpose = cvac.Purpose( cvac.PurposeType.UNLABELED, 0 )
+        dirPath = cvac.DirectoryPath( "upload" )
+        labelables = [ easy.getLabelable( self.filePath ),
+                       easy.getLabelable( cvac.FilePath( dirPath, "a.jpg" ), "a" ) ]
+        runset = cvac.RunSet( [
+            cvac.PurposedLabelableSeq( purpose, labelables ),
+            cvac.PurposedDirectory( purpose, dirPath, ["jpg"], False ) ] )
+        names = [sub.path.filename for sub in easy.collectSubstrates( runset )]
+        self.assertEqual( names, ["media.avi", "a.jpg", "b.JPG"] )
+
+        runset.purposedLists[1].recursive = True
+        subs = list( easy.iterSubstrates( runset ) )
+        self.assertEqual( [sub.path.filename for sub in subs],
+                          ["media.avi", "a.jpg", "b.JPG", "d.jpg"] )
+        self.assertEqual( subs[-1].path.directory.relativePath, "upload/sub" )
+
+        res = easy.putAllFiles( self.serve( localservices.LocalFileServiceI( "remote" ) ),
+                                runset )
+        self.assertEqual( len( res['uploaded'] ), 4 )
+
+    #
+    # getAllFiles downloads what is missing or differs in size,
+    # and reports failures per file
+    #
+    def test_getAllFiles(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        paths = [self.filePath]
+        easy.putFile( fs, self.filePath )
+        for idx in range( 10 ):
+            fpath = cvac.FilePath( cvac.DirectoryPath( "upload/sub" ),
+                                   "img{0}.jpg".format( idx ) )
+            fs.putFile( fpath, os.urandom( 1000+idx ) )
+            paths.append( fpath )
+        missing = cvac.FilePath( cvac.DirectoryPath( "upload" ), "missing.jpg" )
+        paths.append( missing )
+
+        res = easy.getAllFiles( fs, paths, "download", window=4 )
+        self.assertEqual( len( res['downloaded'] ), 11 )
+        self.assertEqual( len( res['existing'] ), 0 )
+        self.assertEqual( len( res['failed'] ), 1 )
+        self.assertEqual( res['failed'][0][0].filename, "missing.jpg" )
+        localCopy = os.path.join( "download", "upload", "media.avi" )
+        self.assertTrue( filecmp.cmp( self.localFS, localCopy, shallow=False ) )
+
+        fout = open( localCopy, 'ab' )
+        fout.write( b"appended" )
+        fout.close()
+        res = easy.getAllFiles( fs, paths[:-1], "download" )
+        self.assertEqual( len( res['downloaded'] ), 1 )
+        self.assertEqual( len( res['existing'] ), 10 )
+        self.assertTrue( filecmp.cmp( self.localFS, localCopy, shallow=False ) )
+
+    #
+    # downloads are streamed in chunks no larger than the chunk size
+    #
+    def test_getAllFilesChunked(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        easy.putFile( fs, self.filePath )
+        empty = cvac.FilePath( cvac.DirectoryPath( "upload" ), "empty.jpg" )
+        fs.putFile( empty, b"" )
+        res = easy.getAllFiles( fs, [self.filePath, empty], "download", chunkSize=64*1024 )
+        self.assertEqual( len( res['downloaded'] ), 2 )
+        self.assertTrue( servant.largestReply<=64*1024 )
+        self.assertEqual( servant.getChunkCalls, 5+1 )
+        localCopy = os.path.join( "download", "upload", "media.avi" )
+        self.assertTrue( filecmp.cmp( self.localFS, localCopy, shallow=False ) )
+        self.assertEqual( os.path.getsize( os.path.join( "download", "upload", "empty.jpg" ) ), 0 )
+
+        # a FileService without getFileChunk sends whole files
+        def getFileChunk( file, offset, length, current=None ):
+            raise Ice.OperationNotExistException()
+        servant.getFileChunk = getFileChunk
+        res = easy.getAllFiles( fs, [self.filePath], "download", overwrite=True )
+        self.assertEqual( len( res['downloaded'] ), 1 )
+        self.assertTrue( filecmp.cmp( self.localFS, localCopy, shallow=False ) )
+
+    #
+    # with a DownloadManifest, unchanged copies cause no RPCs, and a copy
+    # that changed locally is fetched again even if its size is the same
+    #
+    def test_downloadManifest(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        easy.putFile( fs, self.filePath )
+        manifest = easy.DownloadManifest( fs, "download", manifestDir="manifests" )
+        res = easy.getAllFiles( fs, [self.filePath], "download", manifest=manifest )
+        self.assertEqual( len( res['downloaded'] ), 1 )
+
+        manifest = easy.DownloadManifest( fs, "download", manifestDir="manifests" )
+        propertiesCalls = servant.propertiesCalls
+        res = easy.getAllFiles( fs, [self.filePath], "download", manifest=manifest )
+        self.assertEqual( len( res['existing'] ), 1 )
+        self.assertEqual( servant.propertiesCalls, propertiesCalls )
+
+        localCopy = os.path.join( "download", "upload", "media.avi" )
+        size = os.path.getsize( localCopy )
+        fout = open( localCopy, 'r+b' )
+        fout.write( b"changed" )
+        fout.close()
+        os.utime( localCopy, (0, 0) )
+        self.assertEqual( os.path.getsize( localCopy ), size )
+        res = easy.getAllFiles( fs, [self.filePath], "download", manifest=manifest )
+        self.assertEqual( len( res['downloaded'] ), 1 )
+        self.assertTrue( filecmp.cmp( self.localFS, localCopy, shallow=False ) )
+
+    def tearDown(self):
+        # Clean up
+        os.chdir( self.cwd )
+        shutil.rmtree( self.workDir, ignore_errors=True )
+        if self.ic:
+            try:
+                self.ic.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+from __future__ import print_function
+# test the NumPy-based evaluation of detection results;
+# this does not need any CVAC services to be running
+import sys, traceback
+import time
+import paths
+import cvac
+import unittest
+import numpy
+import evaluation
+
+# seconds that addColumns may take for a million found labels
+columnsBudget = 0.25
+
+class EvaluationTest(unittest.TestCase):
+
+    def makeResult(self, origName, foundNames):
+        path = cvac.FilePath( cvac.DirectoryPath( "testImg" ), "img.jpg" )
+        sub = cvac.Substrate( True, False, path, 0, 0 )
+        orig = cvac.Labelable( 0.0, cvac.Label( True, origName, {}, cvac.Semantics() ), sub )
+        found = []
+        for name in foundNames:
+            label = cvac.Label( True, name, {}, cvac.Semantics() )
+            found.append( cvac.Labelable( 1.0, label, sub ) )
+        return cvac.Result( orig, found )
+
+    #
+    # counts accumulate over batches; class IDs map to label names
+    #
+    def test_confusionMatrix(self):
+        confmat = evaluation.ConfusionMatrix( ["car", "face"] )
+        foundLabelMap = {'0':'car', '1':'face'}
+        confmat.addResults( [ self.makeResult( "car", ["0"] ),
+                              self.makeResult( "car", ["1"] ),
+                              self.makeResult( "face", ["1"] ) ], foundLabelMap )
+        confmat.addResults( [ self.makeResult( "face", [] ),
+                              self.makeResult( "face", ["1"] ) ], foundLabelMap )
+        expected = numpy.array( [[1, 1, 0], [0, 2, 1], [0, 0, 0]] )
+        self.assertTrue( (confmat.matrix==expected).all() )
+        self.assertTrue( numpy.allclose( confmat.getPrecision(), [1.0, 2.0/3] ) )
+        self.assertTrue( numpy.allclose( confmat.getRecall(), [0.5, 2.0/3] ) )
+        self.assertTrue( numpy.allclose( confmat.getF1(), [2.0/3, 2.0/3] ) )
+        self.assertAlmostEqual( confmat.getAccuracy(), 0.6 )
+
+    def test_addIndices(self):
+        confmat = evaluation.ConfusionMatrix( ["a", "b", "c"] )
+        rng = numpy.random.RandomState( 0 )
+        orig = rng.randint( 0, 4, 100000 )
+        found = rng.randint( 0, 4, 100000 )
+        confmat.addIndices( orig, found )
+        self.assertEqual( confmat.matrix.sum(), 100000 )
+        self.assertEqual( confmat.matrix[2,1], ((orig==2)&(found==1)).sum() )
+
+    #
+    # counting from columns agrees with counting cvac.Results, including
+    # the choice of the most confident, and first, of equal labels
+    #
+    def test_addColumns(self):
+        labelNames = ["0", "1", "2", "car", "face", "other"]
+        rng = numpy.random.RandomState( 1 )
+        results = []
+        resultIds, origLabelIds, labelIds, confidences = [], [], [], []
+        for idx in range( 500 ):
+            origId = rng.randint( -1, len( labelNames ) )
+            res = self.makeResult( labelNames[origId], [] )
+            res.original.lab.hasLabel = origId>=0
+            for fidx in range( rng.randint( 0, 4 ) ):
+                foundId = rng.randint( 0, len( labelNames ) )
+                found = self.makeResult( "", [labelNames[foundId]] ).foundLabels[0]
+                found.confidence = float( rng.randint( 0, 3 ) )/2
+                res.foundLabels.append( found )
+                resultIds.append( idx )
+                origLabelIds.append( origId )
+                labelIds.append( foundId )
+                confidences.append( found.confidence )
+            if not res.foundLabels:
+                resultIds.append( idx )
+                origLabelIds.append( origId )
+                labelIds.append( -1 )
+                confidences.append( numpy.nan )
+            results.append( res )
+        foundLabelMap = {'0':'car', '1':'face'}
+        expected = evaluation.ConfusionMatrix( ["car", "face"] )
+        expected.addResults( results, foundLabelMap )
+        confmat = evaluation.ConfusionMatrix( ["car", "face"] )
+        confmat.addColumns( resultIds, origLabelIds, labelIds, confidences,
+                            labelNames, foundLabelMap )
+        self.assertTrue( (confmat.matrix==expected.matrix).all() )
+
+    def test_addColumnsTime(self):
+        rows = 1000000
+        rng = numpy.random.RandomState( 2 )
+        # three found labels per result
+        resultIds = numpy.arange( rows )//3
+        origLabelIds = (resultIds % 4).astype( numpy.int32 )
+        labelIds = rng.randint( -1, 4, rows ).astype( numpy.int32 )
+        confidences = rng.random_sample( rows ).astype( numpy.float32 )
+        confmat = evaluation.ConfusionMatrix( ["a", "b", "c"] )
+        start = time.time()
+        confmat.addColumns( resultIds, origLabelIds, labelIds, confidences,
+                            ["a", "b", "c", "d"] )
+        elapsed = time.time()-start
+        print( "addColumns: {0:.3f}s for {1} found labels".format( elapsed, rows ) )
+        self.assertEqual( confmat.matrix.sum(), (rows+2)//3 )
+        self.assertTrue( elapsed<columnsBudget )
+
+    def makeBoxResult(self, filename, origName, origBox, found):
+        path = cvac.FilePath( cvac.DirectoryPath( "testImg" ), filename )
+        sub = cvac.Substrate( True, False, path, 0, 0 )
+        orig = cvac.LabeledLocation( 0.0, cvac.Label( True, origName, {}, cvac.Semantics() ),
+                                     sub, cvac.BBox( *origBox ) )
+        foundLabels = []
+        for name, confidence, box in found:
+            label = cvac.Label( True, name, {}, cvac.Semantics() )
+            foundLabels.append( cvac.LabeledLocation( confidence, label, sub,
+                                                      cvac.BBox( *box ) ) )
+        return cvac.Result( orig, foundLabels )
+
+    def test_computeIoU(self):
+        ious = evaluation.computeIoU( [[0, 0, 10, 10]],
+                                      [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]] )
+        self.assertTrue( numpy.allclose( ious, [[1.0, 1.0/3, 0.0]] ) )
+        box = cvac.PreciseBBox( 5.0, 5.0, 10.0, 10.0 )
+        self.assertEqual( evaluation.getBox( box ), (0.0, 0.0, 10.0, 10.0) )
+
+    #
+    # each ground truth box is claimed by at most one detection,
+    # the one with the highest score
+    #
+    def test_matchDetections(self):
+        gtBoxes = [[0, 0, 10, 10], [100, 100, 110, 110], [0, 0, 10, 10]]
+        detBoxes = [[1, 1, 10, 10], [0, 0, 10, 10], [100, 100, 110, 111], [0, 0, 10, 10]]
+        isTP = evaluation.matchDetections( [0, 0, 1], gtBoxes,
+                                           [0, 0, 0, 2], [0.5, 0.9, 0.7, 0.9], detBoxes )
+        self.assertEqual( list( isTP ), [False, True, True, False] )
+
+    def matchGreedily(self, gtGroups, gtBoxes, detGroups, detScores, detBoxes):
+        '''The matching of matchDetections, one detection at a time'''
+        isTP = [False]*len(detGroups)
+        claimed = set()
+        order = sorted( range( len(detGroups) ), key=lambda idx: -detScores[idx] )
+        for det in order:
+            best, bestIoU = None, -1
+            for gt in range( len(gtGroups) ):
+                if gtGroups[gt]!=detGroups[det] or gt in claimed:
+                    continue
+                iou = evaluation.computeIoU( [detBoxes[det]], [gtBoxes[gt]] )[0,0]
+                if iou>bestIoU:
+                    best, bestIoU = gt, iou
+            if best is not None and bestIoU>=0.5:
+                claimed.add( best )
+                isTP[det] = True
+        return isTP
+
+    #
+    # group ids are sparse and large, as image*numClasses+class is;
+    # detections in groups without ground truth are false positives
+    #
+    def test_matchDetectionsSparse(self):
+        rng = numpy.random.RandomState( 1 )
+        groupIds = numpy.arange( 20 )*10**10+rng.randint( 0, 1000, 20 )
+        gtGroups = groupIds[rng.randint( 0, 15, 60 )]
+        gtBoxes = rng.randint( 0, 50, (60, 4) ).astype( float )
+        gtBoxes[:,2:] += gtBoxes[:,:2]+10
+        detGroups = groupIds[rng.randint( 0, 20, 200 )]
+        detScores = rng.permutation( 200 )/200.0
+        detBoxes = gtBoxes[rng.randint( 0, 60, 200 )]+rng.randint( -3, 4, (200, 4) )
+        isTP = evaluation.matchDetections( gtGroups, gtBoxes, detGroups,
+                                           detScores, detBoxes )
+        expected = self.matchGreedily( list( gtGroups ), gtBoxes, list( detGroups ),
+                                       list( detScores ), detBoxes )
+        self.assertEqual( list( isTP ), expected )
+        self.assertTrue( isTP.any() )
+
+    #
+    # boxes keep their double precision far from the origin
+    #
+    def test_matchDetectionsPrecision(self):
+        offset = 1e8
+        gtBoxes = [[offset, 0, offset+10, 10]]
+        detBoxes = [[offset+3, 0, offset+13, 10]]
+        isTP = evaluation.matchDetections( [0], gtBoxes, [0], [1.0], detBoxes,
+                                           iouThreshold=0.5 )
+        self.assertEqual( list( isTP ), [True] )
+
+    def test_evaluateEmpty(self):
+        res = evaluation.BoxEvaluation().evaluate()
+        self.assertEqual( res, {'mAP':0.0} )
+        boxEval = evaluation.BoxEvaluation()
+        boxEval.addGroundTruth( [0], [boxEval.getClassId( "car" )], [[0, 0, 10, 10]] )
+        res = boxEval.evaluate()
+        self.assertEqual( res['car']['numGroundTruth'], 1 )
+        self.assertEqual( res['mAP'], 0.0 )
+
+    def test_boxEvaluation(self):
+        results = [
+            self.makeBoxResult( "a.jpg", "car", (0, 0, 10, 10),
+                                [("0", 0.9, (0, 0, 10, 10)), ("0", 0.8, (50, 50, 10, 10))] ),
+            self.makeBoxResult( "a.jpg", "face", (100, 100, 20, 20),
+                                [("0", 0.9, (0, 0, 10, 10)), ("0", 0.8, (50, 50, 10, 10))] ),
+            self.makeBoxResult( "b.jpg", "car", (0, 0, 10, 10),
+                                [("0", 0.7, (1, 0, 10, 10)), ("1", 0.6, (0, 0, 10, 10))] ),
+        ]
+        boxEval = evaluation.BoxEvaluation()
+        boxEval.addResults( results, {'0':'car', '1':'face'} )
+        res = boxEval.evaluate()
+        # car: TP at 0.9, FP at 0.8, TP at 0.7 with 2 ground truth boxes
+        self.assertTrue( numpy.allclose( res['car']['precision'], [1.0, 0.5, 2.0/3] ) )
+        self.assertTrue( numpy.allclose( res['car']['recall'], [0.5, 0.5, 1.0] ) )
+        self.assertAlmostEqual( res['car']['ap'], 0.5+0.5*2.0/3 )
+        # face: one detection in the wrong image
+        self.assertEqual( res['face']['numGroundTruth'], 1 )
+        self.assertAlmostEqual( res['face']['ap'], 0.0 )
+        self.assertAlmostEqual( res['mAP'], (0.5+0.5*2.0/3)/2 )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from __future__ import print_function
+# test the recording of remote calls and callbacks;
+# this does not need any CVAC services to be running
+import sys, traceback
+import json
+import time
+import unittest
+import paths
+import cvac
+import easy
+import instrumentation
+
+class StandInProxy(object):
+    '''Looks like an Ice proxy to InstrumentedProxy'''
+    def ice_toString(self):
+        return "FileService -t:tcp -h localhost -p 10110"
+    def exists(self, path, _ctx=None):
+        time.sleep( 0.002 )
+        self.context = _ctx
+        return True
+    def putFile(self, path, data):
+        pass
+    def getFile(self, path):
+        raise cvac.FileServiceException()
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = cvac.FilePath( cvac.DirectoryPath( "upload" ), "img.jpg" )
+
+    def test_recordCalls(self):
+        instr = instrumentation.Instrumentation()
+        prx = instr.wrap( StandInProxy() )
+        self.assertTrue( instr.wrap( prx ) is prx )
+        self.assertEqual( prx.ice_toString(), StandInProxy().ice_toString() )
+        for idx in range( 3 ):
+            self.assertTrue( prx.exists( self.path ) )
+        prx.putFile( self.path, b"x"*1000 )
+        self.assertRaises( cvac.FileServiceException, prx.getFile, self.path )
+
+        stats = dict( [(st.operation, st) for st in instr.getStats()] )
+        self.assertEqual( stats['exists'].count, 3 )
+        self.assertTrue( stats['exists'].getMeanSeconds()>=0.002 )
+        self.assertEqual( sum( stats['exists'].histogram.values() ), 3 )
+        self.assertTrue( stats['putFile'].bytesSent>1000 )
+        self.assertEqual( stats['getFile'].errors, 1 )
+
+        dump = json.loads( instr.dump() )
+        self.assertEqual( len( dump['calls'] ), 3 )
+        self.assertEqual( dump['calls'][0]['endpoint'], prx.ice_toString() )
+
+    #
+    # keyword arguments, such as an Ice context, reach the proxy
+    #
+    def test_keywordArguments(self):
+        instr = instrumentation.Instrumentation()
+        standIn = StandInProxy()
+        prx = instr.wrap( standIn )
+        self.assertTrue( prx.exists( self.path, _ctx={'user':'test'} ) )
+        self.assertEqual( standIn.context, {'user':'test'} )
+        self.assertTrue( prx.exists( path=self.path ) )
+        self.assertEqual( standIn.context, None )
+        stats = dict( [(st.operation, st) for st in instr.getStats()] )
+        self.assertEqual( stats['exists'].count, 2 )
+
+    def test_easyCallbacks(self):
+        self.assertTrue( easy.instrumented( StandInProxy() ).__class__ is StandInProxy )
+        instr = easy.enableInstrumentation()
+        try:
+            recv = easy.DetectorCallbackReceiverI()
+            recv.foundNewResults( cvac.ResultSetV2( [] ) )
+            recv.foundNewResults( cvac.ResultSetV2( [] ) )
+            self.assertTrue( isinstance( easy.instrumented( StandInProxy() ),
+                                         instrumentation.InstrumentedProxy ) )
+        finally:
+            self.assertTrue( easy.disableInstrumentation() is instr )
+        callbacks = instr.toDict()['callbacks']
+        self.assertEqual( len( callbacks['foundNewResults'] ), 2 )
+        self.assertTrue( callbacks['foundNewResults'][0]>=0 )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+from __future__ import print_function
+# test the NumPy-based LabelIndex;
+# this does not need any CVAC services to be running
+import sys, traceback
+import paths
+import cvac
+import unittest
+import numpy
+import labelindex
+
+class LabelIndexTest(unittest.TestCase):
+
+    index = None
+
+    def makeLabelable(self, name, idx, box=None):
+        path = cvac.FilePath( cvac.DirectoryPath( "img/"+name ), "{0}.jpg".format( idx ) )
+        sub = cvac.Substrate( True, False, path, 0, 0 )
+        label = cvac.Label( True, name, {}, cvac.Semantics() )
+        if box:
+            return cvac.LabeledLocation( 0.1*(idx%10), label, sub, box )
+        return cvac.Labelable( 0.1*(idx%10), label, sub )
+
+    def setUp(self):
+        labelList = []
+        for idx in range( 30 ):
+            labelList.append( self.makeLabelable( "car", idx ) )
+        for idx in range( 10 ):
+            labelList.append( self.makeLabelable( "face", idx, cvac.BBox( idx, 2, 10, 20 ) ) )
+        labelList.append( self.makeLabelable( "face", 99,
+                                              cvac.PreciseBBox( 5.0, 5.0, 2.0, 4.0 ) ) )
+        self.index = labelindex.LabelIndex.fromLabelables( labelList )
+
+    def test_categories(self):
+        self.assertEqual( len( self.index ), 41 )
+        self.assertEqual( len( self.index.getCategoryRows( "car" ) ), 30 )
+        self.assertEqual( len( self.index.getCategoryRows( "face" ) ), 11 )
+        self.assertEqual( len( self.index.getCategoryRows( "bike" ) ), 0 )
+
+    def test_select(self):
+        rows = self.index.select( labels=["face"], minConfidence=0.5 )
+        self.assertEqual( len( rows ), 6 )
+        rows = self.index.select( hasBox=True )
+        self.assertEqual( len( rows ), 11 )
+
+    def test_stratifiedSample(self):
+        rows = self.index.stratifiedSample( perCategory=5, seed=1 )
+        sub = self.index.subset( rows )
+        self.assertEqual( len( sub.getCategoryRows( "car" ) ), 5 )
+        self.assertEqual( len( sub.getCategoryRows( "face" ) ), 5 )
+        rows = self.index.stratifiedSample( fraction=0.5, seed=1 )
+        self.assertEqual( len( rows ), 15+6 )
+        self.assertRaises( RuntimeError, self.index.stratifiedSample )
+        self.assertRaises( RuntimeError, self.index.stratifiedSample,
+                           perCategory=5, fraction=0.5 )
+
+    #
+    # Labelables are created with their locations only when needed
+    #
+    def test_materialize(self):
+        categories = self.index.getCategories()
+        faces = categories["face"]
+        self.assertEqual( type( faces[0].loc ), cvac.BBox )
+        self.assertEqual( faces[3].loc.x, 3 )
+        precise = faces[10].loc
+        self.assertEqual( type( precise ), cvac.PreciseBBox )
+        self.assertAlmostEqual( precise.centerX, 5.0, 5 )
+        self.assertAlmostEqual( precise.height, 4.0, 5 )
+        runset = self.index.getRunSet()
+        self.assertEqual( len( runset.purposedLists[0].labeledArtifacts ), 41 )
+
+if __name__ == '__main__':
+    unittest.main()
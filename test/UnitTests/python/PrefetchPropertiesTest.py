@@ -0,0 +1,128 @@
+from __future__ import print_function
+# test reading image dimensions from file headers and
+# easy.prefetchProperties against an in-process stand-in FileService;
+# this does not need any CVAC services to be running
+import sys, traceback
+import os
+import struct
+import tempfile
+import shutil
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+import imageinfo
+
+def writeFile( fname, data ):
+    parent = os.path.dirname( fname )
+    if parent and not os.path.exists( parent ):
+        os.makedirs( parent )
+    fout = open( fname, 'wb' )
+    fout.write( data )
+    fout.close()
+
+def pngHeader( width, height ):
+    return b"\x89PNG\r\n\x1a\n"+struct.pack( ">I", 13 )+b"IHDR"+ \
+        struct.pack( ">IIBBBBB", width, height, 8, 2, 0, 0, 0 )
+
+def jpegHeader( width, height ):
+    # an APP0 segment before the baseline frame
+    return b"\xff\xd8"+b"\xff\xe0"+struct.pack( ">H", 16 )+b"JFIF\x00"+b"\x00"*9+ \
+        b"\xff\xc0"+struct.pack( ">HBHHB", 11, 8, height, width, 1 )+b"\x01\x11\x00"
+
+class PrefetchPropertiesTest(unittest.TestCase):
+
+    ic = None
+    workDir = None
+    cwd = None
+
+    def setUp(self):
+        self.ic = Ice.initialize(sys.argv)
+        self.workDir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir( self.workDir )
+
+    def serve(self, servant):
+        fs, adapter = localservices.serve( self.ic, servant, cvac.FileServicePrx )
+        return fs
+
+    def test_imageSize(self):
+        writeFile( "a.png", pngHeader( 640, 480 ) )
+        writeFile( "a.jpg", jpegHeader( 1024, 768 ) )
+        writeFile( "a.gif", b"GIF89a"+struct.pack( "<HH", 32, 16 )+b"\x00"*8 )
+        writeFile( "a.bmp", b"BM"+b"\x00"*12+struct.pack( "<Iii", 40, 100, -50 )+b"\x00"*8 )
+        writeFile( "a.txt", b"not an image at all, really not" )
+        writeFile( "b.jpg", b"\xff\xd8\xff\xe0\x00" )
+        self.assertEqual( imageinfo.getImageSize( "a.png" ), (640, 480) )
+        self.assertEqual( imageinfo.getImageSize( "a.jpg" ), (1024, 768) )
+        self.assertEqual( imageinfo.getImageSize( "a.gif" ), (32, 16) )
+        self.assertEqual( imageinfo.getImageSize( "a.bmp" ), (100, 50) )
+        self.assertEqual( imageinfo.getImageSize( "a.txt" ), None )
+        self.assertEqual( imageinfo.getImageSize( "b.jpg" ), None )
+
+    def test_localProperties(self):
+        writeFile( "data/a.png", pngHeader( 640, 480 ) )
+        writeFile( "data/a.tif", b"II*\x00" )
+        writeFile( "data/a.txt", b"not an image at all, really not" )
+        writeFile( "data/a.AVI", b"RIFF" )
+        props = easy.getLocalProperties( "data/a.png" )
+        self.assertEqual( (props.isImage, props.isVideo, props.width, props.height),
+                          (True, False, 640, 480) )
+        props = easy.getLocalProperties( "data/a.tif" )
+        self.assertEqual( (props.isImage, props.isVideo, props.width), (True, False, -1) )
+        props = easy.getLocalProperties( "data/a.txt" )
+        self.assertEqual( (props.isImage, props.isVideo), (False, False) )
+        props = easy.getLocalProperties( "data/a.AVI" )
+        self.assertEqual( (props.isImage, props.isVideo), (False, True) )
+        self.assertEqual( easy.getLocalProperties( "data/none.png" ), None )
+
+    #
+    # local images are measured without the FileService, the others
+    # are asked for once, and the results are cached
+    #
+    def test_prefetch(self):
+        for idx in range( 10 ):
+            writeFile( "data/local/img{0}.png".format( idx ), pngHeader( 100+idx, 50 ) )
+            writeFile( "remote/remote/img{0}.jpg".format( idx ), jpegHeader( 200, 100+idx ) )
+        labelables = []
+        for directory in ("local", "remote"):
+            for idx in range( 10 ):
+                ext = directory=="local" and "png" or "jpg"
+                path = cvac.FilePath( cvac.DirectoryPath( directory ),
+                                      "img{0}.{1}".format( idx, ext ) )
+                labelables.append( easy.getLabelable( path ) )
+        # a substrate that occurs twice is filled in both times
+        labelables.append( easy.getLabelable( labelables[0].sub.path ) )
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        cache = {}
+        res = easy.prefetchProperties( labelables, fs, cache=cache )
+        self.assertEqual( res['failed'], [] )
+        self.assertEqual( servant.propertiesCalls, 10 )
+        self.assertEqual( (labelables[3].sub.width, labelables[3].sub.height), (103, 50) )
+        self.assertEqual( (labelables[13].sub.width, labelables[13].sub.height), (200, 103) )
+        self.assertEqual( labelables[20].sub.width, 100 )
+        easy.prefetchProperties( easy.createRunSet( labelables )['runset'], fs, cache=cache )
+        self.assertEqual( servant.propertiesCalls, 10 )
+        # without a cache, nothing is remembered from earlier calls
+        easy.prefetchProperties( labelables, fs )
+        self.assertEqual( servant.propertiesCalls, 20 )
+        # without a FileService, remote files fail unless they are cached
+        res = easy.prefetchProperties( labelables, cache={} )
+        self.assertEqual( len( res['failed'] ), 10 )
+        self.assertEqual( len( res['properties'] ), 10 )
+
+    def tearDown(self):
+        # Clean up
+        os.chdir( self.cwd )
+        shutil.rmtree( self.workDir, ignore_errors=True )
+        if self.ic:
+            try:
+                self.ic.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
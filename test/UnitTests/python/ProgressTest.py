@@ -0,0 +1,126 @@
+from __future__ import print_function
+# test progress tracking of easy's operations, partly against
+# in-process stand-in services; this does not need any CVAC services to be running
+import sys, traceback
+import time
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+import progress
+
+class RecordingListener(progress.ProgressListener):
+    def __init__(self):
+        self.events = []
+    def progressChanged(self, tracker, event):
+        self.events.append( (tracker.operation, event) )
+
+class BrokenListener(progress.ProgressListener):
+    def progressChanged(self, tracker, event):
+        raise RuntimeError("listener failure")
+
+class ProgressTest(unittest.TestCase):
+
+    serverIC = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+
+    #
+    # rates and ETA follow from the events; a failing listener
+    # does not stop the others
+    #
+    def test_tracker(self):
+        listener = RecordingListener()
+        tracker = progress.ProgressTracker( "detect", total=100,
+                                            listeners=[BrokenListener(), listener] )
+        self.assertTrue( tracker in progress.getActiveTrackers() )
+        tracker.started -= 10
+        tracker.addResults( 25, 1000 )
+        snap = tracker.getSnapshot()
+        self.assertAlmostEqual( snap['resultsPerSecond'], 2.5, 1 )
+        self.assertAlmostEqual( snap['bytesPerSecond'], 100, 0 )
+        self.assertAlmostEqual( snap['eta'], 30, 0 )
+        tracker.setEstimatedLeft( 5 )
+        self.assertAlmostEqual( tracker.getETA(), 5, 0 )
+        tracker.addMessage( 2, "low on memory" )
+        tracker.addMessage( 4, "batch 3" )
+        self.assertEqual( tracker.getSnapshot()['messages'], {'warning':1, 'debug':1} )
+        self.assertEqual( len( tracker.getMessages( 2 ) ), 1 )
+        self.assertFalse( tracker.isStalled( 60 ) )
+        tracker.lastEvent -= 120
+        self.assertTrue( tracker.isStalled( 60 ) )
+        tracker.finish()
+        self.assertFalse( tracker in progress.getActiveTrackers() )
+        self.assertEqual( listener.events[-1], ("detect", "finished") )
+        self.assertEqual( len( listener.events ), 5 )
+
+    def test_monitor(self):
+        snapshots = []
+        tracker = progress.ProgressTracker( "train" )
+        tracker.addMessage( 3, "started" )
+        monitor = progress.ProgressMonitor( snapshots.append, interval=0.05, stallTimeout=0.01 )
+        time.sleep( 0.2 )
+        monitor.stop()
+        tracker.finish()
+        self.assertTrue( len( snapshots )>=2 )
+        mine = [snap for snap in snapshots[-1] if snap['operation']=="train"]
+        self.assertEqual( len( mine ), 1 )
+        self.assertTrue( mine[0]['stalled'] )
+
+    #
+    # an operation that hangs before its first callback is stalled, too
+    #
+    def test_monitorNoEvents(self):
+        snapshots = []
+        tracker = progress.ProgressTracker( "detect", "silent" )
+        monitor = progress.ProgressMonitor( snapshots.append, interval=0.05, stallTimeout=0.01 )
+        time.sleep( 0.2 )
+        monitor.stop()
+        tracker.finish()
+        mine = [snap for snap in snapshots[-1] if snap['name']=="silent"]
+        self.assertEqual( len( mine ), 1 )
+        self.assertTrue( mine[0]['stalled'] )
+        self.assertEqual( mine[0]['results'], 0 )
+        self.assertFalse( tracker in progress.getActiveTrackers() )
+
+    def test_corpusMirrorProgress(self):
+        callbackRecv = easy.CorpusCallbackI( "flags" )
+        corpus = cvac.Corpus( "flags", "", "", True )
+        callbackRecv.corpusMirrorProgress( corpus, 2, 1, "downloading", "1MB of 4MB", 0.25 )
+        self.assertEqual( callbackRecv.progress.task[2], "downloading" )
+        self.assertEqual( callbackRecv.progress.taskPercent, 0.25 )
+        callbackRecv.progress.finish()
+
+    #
+    # detect reports results, runtime estimates and messages
+    # to the progress listeners
+    #
+    def test_detect(self):
+        detector = localservices.serveToEasy( self.serverIC,
+                                              localservices.LocalDetectorI( batchSize=4 ),
+                                              cvac.DetectorPrx )
+        listener = RecordingListener()
+        easy.addProgressListener( listener )
+        try:
+            runset = easy.createRunSet( localservices.createLabelables( 10 ) )['runset']
+            detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+            easy.detect( detector, detectorData, runset )
+        finally:
+            easy.removeProgressListener( listener )
+        events = [event for operation, event in listener.events if operation=="detect"]
+        self.assertEqual( events, ["estimatedTotalRuntime", "message",
+                                   "results", "results", "results", "finished"] )
+
+    def tearDown(self):
+        # Clean up
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
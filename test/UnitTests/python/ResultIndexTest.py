@@ -0,0 +1,147 @@
+from __future__ import print_function
+# test the query index over detection results against brute-force
+# scans; this does not need any CVAC services to be running
+import sys, traceback
+import os
+import tempfile
+import shutil
+import unittest
+import numpy
+import paths
+import cvac
+import resultstore
+import resultindex
+
+def createResults( numImages, perImage, numLabels=3, seed=0 ):
+    '''Results with random BBox detections in 1000x1000 images, a few of
+    them covering most of the image'''
+    rng = numpy.random.RandomState( seed )
+    results = []
+    for idx in range( numImages ):
+        path = cvac.FilePath( cvac.DirectoryPath( "images" ), "img{0}.jpg".format( idx ) )
+        sub = cvac.Substrate( True, False, path, 1000, 1000 )
+        orig = cvac.Labelable( 0.0, cvac.Label( False, "", {}, cvac.Semantics() ), sub )
+        found = []
+        for fidx in range( perImage ):
+            label = cvac.Label( True, "label{0}".format( rng.randint( numLabels ) ), {},
+                                cvac.Semantics() )
+            if rng.rand()<0.05:
+                box = cvac.BBox( 10, 10, 900, 900 )
+            else:
+                x, y = rng.randint( 0, 900, 2 )
+                w, h = rng.randint( 5, 100, 2 )
+                box = cvac.BBox( int(x), int(y), int(w), int(h) )
+            found.append( cvac.LabeledLocation( float( rng.rand() ), label, sub, box ) )
+        results.append( cvac.Result( orig, found ) )
+    return results
+
+class ResultIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.results = createResults( 20, 50 )
+        self.index = resultindex.ResultIndex.fromResults( self.results, cellSize=64 )
+        self.found = []
+        for res in self.results:
+            for lb in res.foundLabels:
+                self.found.append( (res.original.sub.path.filename, lb) )
+
+    def overlaps(self, loc, region):
+        return loc.x<region[2] and loc.x+loc.width>region[0] \
+            and loc.y<region[3] and loc.y+loc.height>region[1]
+
+    def test_threshold(self):
+        rows = self.index.threshold( "label1", 0.8 )
+        expected = [lb for fname, lb in self.found
+                    if lb.lab.name=="label1" and numpy.float32( lb.confidence )>=numpy.float32( 0.8 )]
+        self.assertEqual( len( rows ), len( expected ) )
+        confidences = self.index.confidences[rows]
+        self.assertTrue( (numpy.diff( confidences )<=0).all() )
+        top = self.index.topK( 5 )
+        best = sorted( [lb.confidence for fname, lb in self.found], reverse=True )[:5]
+        self.assertTrue( numpy.allclose( self.index.confidences[top], best ) )
+        rows = self.index.confidenceRange( "label0", 0.2, 0.4 )
+        self.assertEqual( len( rows ), len( [lb for fname, lb in self.found
+                                             if lb.lab.name=="label0"
+                                             and 0.2<=lb.confidence<=0.4] ) )
+        self.assertEqual( len( self.index.threshold( "nothing" ) ), 0 )
+
+    def bruteForce(self, labels=None, minConfidence=None, region=None, names=None,
+                   k=None):
+        '''The rows that query should return, by scanning all found labels'''
+        rows = []
+        for row, (fname, lb) in enumerate( self.found ):
+            confidence = numpy.float32( lb.confidence )
+            if labels is not None and not lb.lab.name in labels:
+                continue
+            if minConfidence is not None and confidence<numpy.float32( minConfidence ):
+                continue
+            if region is not None and not self.overlaps( lb.loc, region ):
+                continue
+            if names is not None and not fname in names:
+                continue
+            rows.append( (-confidence, row) )
+        rows.sort()
+        return [row for confidence, row in rows][:k]
+
+    #
+    # "all label2 detections above 0.5 overlapping this region in these files"
+    #
+    def test_query(self):
+        region = (200, 300, 450, 500)
+        files = [res.original.sub.path for res in self.results[3:8]]
+        names = set( [path.filename for path in files] )
+        rows = self.index.query( labels=["label2"], minConfidence=0.5, region=region,
+                                 paths=files )
+        expected = self.bruteForce( ["label2"], 0.5, region, names )
+        self.assertTrue( len( expected )>0 )
+        self.assertEqual( list( rows ), expected )
+        self.assertEqual( [id(lb) for lb in self.index.getLabelables( rows )],
+                          [id(self.found[row][1]) for row in expected] )
+        queries = [
+            dict( region=region, k=3 ),
+            dict( region=region ),
+            dict( region=(0, 0, 1000, 1000), minConfidence=0.9 ),
+            dict( labels=["label0", "label1"], paths=files[:1], k=4 ),
+            dict( labels=["label1"], paths=files[2:], k=7 ),
+            dict( labels=["label0"], minConfidence=0.2, paths=files, k=5 ),
+            dict( minConfidence=0.5, paths=files[1:3], k=6 ),
+            dict( labels=["label2", "nothing"], region=(20, 20, 30, 30), paths=files, k=2 ),
+            ]
+        for query in queries:
+            names = None
+            if 'paths' in query:
+                names = set( [path.filename for path in query['paths']] )
+            expected = self.bruteForce( query.get( 'labels' ), query.get( 'minConfidence' ),
+                                        query.get( 'region' ), names, query.get( 'k' ) )
+            self.assertEqual( list( self.index.query( **query ) ), expected, query )
+
+    #
+    # k cuts the rows after the paths filter, not per label
+    #
+    def test_queryTopKInPaths(self):
+        index = resultindex.ResultIndex( ["a"], ["p0", "p1"], [0]*5, [0, 0, 0, 1, 1],
+                                         [0.9, 0.8, 0.7, 0.6, 0.5],
+                                         numpy.zeros( (5, 4) ) )
+        self.assertEqual( list( index.query( labels=["a"], paths=[1], k=2 ) ), [3, 4] )
+
+    #
+    # an index over a result store gives the same answers
+    #
+    def test_fromResultStore(self):
+        storeDir = tempfile.mkdtemp()
+        try:
+            writer = resultstore.ResultStoreWriter( storeDir )
+            writer.addResults( self.results )
+            writer.close()
+            store = resultstore.ResultStore( storeDir )
+            index = resultindex.ResultIndex.fromResultStore( store, cellSize=64 )
+            region = (100, 100, 300, 300)
+            rows = index.query( labels=["label0"], minConfidence=0.3, region=region )
+            expected = self.index.query( labels=["label0"], minConfidence=0.3, region=region )
+            self.assertEqual( [(lb.loc.x, lb.loc.y) for lb in index.getLabelables( rows )],
+                              [(lb.loc.x, lb.loc.y) for lb in self.index.getLabelables( expected )] )
+        finally:
+            shutil.rmtree( storeDir, ignore_errors=True )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+from __future__ import print_function
+# test writing detection results to a result store and reading
+# them back; this does not need any CVAC services to be running
+import sys, traceback
+import os
+import json
+import tempfile
+import shutil
+import unittest
+import numpy
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+import resultstore
+
+class ResultStoreTest(unittest.TestCase):
+
+    ic = None
+    workDir = None
+
+    def setUp(self):
+        self.ic = Ice.initialize(sys.argv)
+        self.workDir = tempfile.mkdtemp()
+        self.storeDir = os.path.join( self.workDir, "results" )
+        self.labelables = localservices.createLabelables( 10 )
+        self.detector = localservices.LocalDetectorI( foundPerResult=3 )
+        self.detector.initialize( 3, None )
+
+    def serve(self, servant):
+        return localservices.serveToEasy( self.ic, servant, cvac.DetectorPrx )
+
+    def getResults(self, start=0, count=10):
+        return [self.detector.getResult( lb, start+idx )
+                for idx, lb in enumerate( self.labelables[start:start+count] )]
+
+    def describe(self, results):
+        desc = []
+        for res in results:
+            found = []
+            for lb in res.foundLabels:
+                loc = getattr( lb, 'loc', None )
+                found.append( (lb.lab.name, round( lb.confidence, 5 ),
+                               loc and (loc.x, loc.y, loc.width, loc.height)) )
+            desc.append( (res.original.sub.path.filename, res.original.lab.name, found) )
+        return desc
+
+    #
+    # results come back from the memory-mapped columns as they went in
+    #
+    def test_roundTrip(self):
+        results = self.getResults()
+        results.append( cvac.Result( self.labelables[0], [] ) )
+        writer = resultstore.ResultStoreWriter( self.storeDir, bufferRows=7 )
+        writer.addResults( results[:4] )
+        writer.addResults( cvac.ResultSetV2( results[4:] ) )
+        writer.close()
+        store = resultstore.ResultStore( self.storeDir )
+        self.assertTrue( isinstance( store.confidences, numpy.memmap ) )
+        self.assertEqual( len( store ), 31 )
+        self.assertEqual( self.describe( store.getResults() ), self.describe( results ) )
+        self.assertEqual( store.getLabelCounts(), {'0':15, '1':15, 'cat0':0, 'cat1':0} )
+        rows = store.select( labels=['1'], minConfidence=0.4 )
+        self.assertEqual( len( rows ), 10 )
+        self.assertTrue( (store.labelIds[rows]==store.getLabelId( '1' )).all() )
+        rows = store.select( pathIds=[store.getPathId( self.labelables[2].sub.path )],
+                             chunkRows=4 )
+        self.assertEqual( len( store.getResults( rows ) ), 1 )
+        self.assertEqual( len( store.getResults( rows )[0].foundLabels ), 3 )
+        # files that are not in the store select nothing
+        unknown = cvac.FilePath( cvac.DirectoryPath( "elsewhere" ), "img2.jpg" )
+        self.assertEqual( store.getPathId( unknown ), -1 )
+        self.assertEqual( len( store.select( pathIds=[store.getPathId( unknown )] ) ), 0 )
+        self.assertEqual( list( store.select( pathIds=[-1, store.getPathId(
+                              self.labelables[2].sub.path )] ) ), list( rows ) )
+
+    #
+    # a confusion matrix from the columns counts as one from the results,
+    # also when results span the chunks that are read at a time
+    #
+    def test_confusionMatrix(self):
+        results = self.getResults()
+        results.append( cvac.Result( self.labelables[0], [] ) )
+        writer = resultstore.ResultStoreWriter( self.storeDir )
+        writer.addResults( results )
+        writer.close()
+        store = resultstore.ResultStore( self.storeDir )
+        origMap = {'cat0':0, 'cat1':1}
+        foundMap = {'0':'cat0', '1':'cat1'}
+        expected = easy.getConfusionMatrix( results, origMap, foundMap )
+        self.assertTrue( (easy.getConfusionMatrix( store, origMap, foundMap ).matrix==
+                          expected.matrix).all() )
+        for chunkRows in [1, 2, 4, 7]:
+            confmat = easy.getConfusionMatrix( [], origMap, foundMap )
+            confmat.addResultStore( store, easy.getFoundLabelMap( foundMap ),
+                                    chunkRows=chunkRows )
+            self.assertTrue( (confmat.matrix==expected.matrix).all() )
+
+    #
+    # rows that were not flushed before a crash are dropped, and
+    # a reopened store continues after the last flushed rows
+    #
+    def test_append(self):
+        writer = resultstore.ResultStoreWriter( self.storeDir )
+        writer.addResults( self.getResults( 0, 5 ) )
+        writer.flush()
+        writer.addResults( self.getResults( 5, 5 ) )
+        # no close: the second batch is lost, as in a crash
+        writer = resultstore.ResultStoreWriter( self.storeDir )
+        self.assertEqual( writer.rows, 15 )
+        writer.addResults( self.getResults( 5, 5 ) )
+        writer.close()
+        store = resultstore.ResultStore( self.storeDir )
+        self.assertEqual( self.describe( store.getResults() ),
+                          self.describe( self.getResults() ) )
+
+    #
+    # detection writes into the store as results arrive
+    #
+    def test_detectToStore(self):
+        servant = localservices.LocalDetectorI( batchSize=3 )
+        runset = easy.createRunSet( self.labelables )['runset']
+        detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+        store = easy.detectToStore( self.serve( servant ), detectorData, runset,
+                                    self.storeDir )
+        self.assertEqual( store.numResults, 10 )
+        self.assertEqual( len( store.select( hasBox=True ) ), 10 )
+
+    def tearDown(self):
+        # Clean up
+        shutil.rmtree( self.workDir, ignore_errors=True )
+        if self.ic:
+            try:
+                self.ic.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+from __future__ import print_function
+# test easy.getSnapshots and its snapshot cache against an in-process
+# stand-in FileService; this does not need any CVAC services to be running
+import sys, traceback
+import os
+import time
+import tempfile
+import shutil
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+import snapshotcache
+
+class SnapshotCacheTest(unittest.TestCase):
+
+    ic = None
+    workDir = None
+    cwd = None
+
+    def setUp(self):
+        self.ic = Ice.initialize(sys.argv)
+        self.workDir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir( self.workDir )
+        os.makedirs( "remote/images" )
+        self.paths = []
+        for idx in range( 20 ):
+            fname = "img{0}.jpg".format( idx )
+            fout = open( os.path.join( "remote", "images", fname ), 'wb' )
+            fout.write( os.urandom( 2000 ) )
+            fout.close()
+            self.paths.append( cvac.FilePath( cvac.DirectoryPath( "images" ), fname ) )
+        self.cache = snapshotcache.SnapshotCache( "cache" )
+
+    def serve(self, servant):
+        fs, adapter = localservices.serve( self.ic, servant, cvac.FileServicePrx )
+        return fs
+
+    #
+    # snapshots are downloaded once; a second session is served from
+    # the cache without any calls to the FileService
+    #
+    def test_getSnapshots(self):
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        res = easy.getSnapshots( fs, self.paths, cache=self.cache )
+        self.assertEqual( len( res['downloaded'] ), 20 )
+        self.assertEqual( res['failed'], [] )
+        self.assertEqual( servant.snapshotCalls, 20 )
+        self.assertEqual( os.path.getsize( res['snapshots'][3] ), 1024 )
+        # the FileService's copies of the snapshots are gone
+        self.assertEqual( sorted( os.listdir( os.path.join( "remote", "images" ) ) ),
+                          sorted( [path.filename for path in self.paths] ) )
+        res = easy.getSnapshots( None, self.paths, cache=self.cache )
+        self.assertEqual( len( res['cached'] ), 20 )
+        self.assertEqual( servant.snapshotCalls, 20 )
+        missing = cvac.FilePath( cvac.DirectoryPath( "images" ), "missing.jpg" )
+        res = easy.getSnapshots( fs, [missing], cache=self.cache )
+        self.assertEqual( res['snapshots'], [None] )
+        self.assertEqual( len( res['failed'] ), 1 )
+
+    #
+    # a changed local original gets a new snapshot
+    #
+    def test_changedOriginal(self):
+        os.makedirs( "data/images" )
+        local = os.path.join( "data", "images", "img0.jpg" )
+        shutil.copy( os.path.join( "remote", "images", "img0.jpg" ), local )
+        os.utime( local, (1000, 1000) )
+        servant = localservices.LocalFileServiceI( "remote" )
+        fs = self.serve( servant )
+        easy.getSnapshots( fs, self.paths[:1], cache=self.cache )
+        os.utime( local, (2000, 2000) )
+        res = easy.getSnapshots( fs, self.paths[:1], cache=self.cache )
+        self.assertEqual( len( res['downloaded'] ), 1 )
+        self.assertEqual( servant.snapshotCalls, 2 )
+
+    #
+    # the least recently used snapshots go first
+    #
+    def test_evict(self):
+        self.cache.maxBytes = 3000
+        keys = [self.cache.getKey( path ) for path in self.paths[:3]]
+        self.cache.store( keys[0], b"x"*1000 )
+        self.cache.store( keys[1], b"x"*1000 )
+        os.utime( self.cache.getFile( keys[0] ), (1000, 1000) )
+        os.utime( self.cache.getFile( keys[1] ), (2000, 2000) )
+        self.cache.lookup( keys[0] )
+        self.cache.store( keys[2], b"x"*1500 )
+        self.assertTrue( self.cache.lookup( keys[0] ) )
+        self.assertEqual( self.cache.lookup( keys[1] ), None )
+        self.assertEqual( self.cache.totalBytes, 2500 )
+
+    #
+    # the cache directory is read once; later evictions work from memory
+    #
+    def test_evictFromMemory(self):
+        keys = [self.cache.getKey( path ) for path in self.paths]
+        for key in keys[:4]:
+            self.cache.store( key, b"x"*1000 )
+        cache = snapshotcache.SnapshotCache( "cache", maxBytes=4500 )
+        scans = []
+        getEntries = cache.getEntries
+        def countingGetEntries():
+            scans.append( 1 )
+            return getEntries()
+        cache.getEntries = countingGetEntries
+        for key in keys[4:10]:
+            self.assertTrue( cache.lookup( keys[0] ) )
+            cache.store( key, b"x"*1000 )
+        self.assertEqual( len( scans ), 1 )
+        self.assertEqual( cache.totalBytes, 4000 )
+        self.assertTrue( cache.lookup( keys[0] ) )
+        for key in keys[1:7]:
+            self.assertEqual( cache.lookup( key ), None )
+        self.assertEqual( len( scans ), 1 )
+
+    def tearDown(self):
+        # Clean up
+        os.chdir( self.cwd )
+        shutil.rmtree( self.workDir, ignore_errors=True )
+        if self.ic:
+            try:
+                self.ic.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
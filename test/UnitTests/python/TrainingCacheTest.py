@@ -0,0 +1,151 @@
+from __future__ import print_function
+# test the cache of trained detectors that easy.train can use;
+# this does not need any CVAC services to be running
+import sys, traceback
+import os
+import tempfile
+import shutil
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+import trainingcache
+
+class TrainingCacheTest(unittest.TestCase):
+
+    serverIC = None
+    workDir = None
+    cwd = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.workDir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir( self.workDir )
+        self.cache = trainingcache.TrainingCache( "cache" )
+        self.runset = easy.createRunSet( localservices.createLabelables( 10 ) )['runset']
+        self.detData = cvac.DetectorData( cvac.DetectorDataType.FILE, [],
+                                          cvac.FilePath( cvac.DirectoryPath( "detectors" ),
+                                                         "model.zip" ), None )
+
+    def writeModel(self, size=1000):
+        fout = open( "model.zip", 'wb' )
+        fout.write( os.urandom( size ) )
+        fout.close()
+        return "model.zip"
+
+    def readFile(self, fname):
+        fin = open( fname, 'rb' )
+        try:
+            return fin.read()
+        finally:
+            fin.close()
+
+    #
+    # keys do not depend on the order of dictionary entries,
+    # but do depend on the trainer and on the RunSet
+    #
+    def test_keys(self):
+        key = self.cache.getKey( self.runset, {'name':"bow", 'description':"BOW"} )
+        self.assertEqual( key, self.cache.getKey(
+            self.runset, dict( [('description', "BOW"), ('name', "bow")] ) ) )
+        self.assertNotEqual( key, self.cache.getKey( self.runset, {'name':"haar"} ) )
+        other = easy.createRunSet( localservices.createLabelables( 11 ) )['runset']
+        self.assertNotEqual( key, self.cache.getKey( other, {'name':"bow", 'description':"BOW"} ) )
+
+    #
+    # the files in a PurposedDirectory are part of the key
+    #
+    def test_directoryKeys(self):
+        os.makedirs( os.path.join( "data", "pos" ) )
+        for name in ["a.jpg", "b.jpg"]:
+            open( os.path.join( "data", "pos", name ), 'w' ).write( name )
+        plist = cvac.PurposedDirectory( cvac.Purpose( cvac.PurposeType.POSITIVE, 0 ),
+                                        cvac.DirectoryPath( "pos" ), [".jpg"], False )
+        runset = cvac.RunSet( [plist] )
+        key = self.cache.getKey( runset, "bow" )
+        self.assertEqual( key, self.cache.getKey( runset, "bow" ) )
+        # files the entry does not cover do not matter
+        open( os.path.join( "data", "pos", "notes.txt" ), 'w' ).write( "notes" )
+        self.assertEqual( key, self.cache.getKey( runset, "bow" ) )
+        open( os.path.join( "data", "pos", "c.jpg" ), 'w' ).write( "c.jpg" )
+        added = self.cache.getKey( runset, "bow" )
+        self.assertNotEqual( key, added )
+        open( os.path.join( "data", "pos", "a.jpg" ), 'w' ).write( "replaced" )
+        self.assertNotEqual( added, self.cache.getKey( runset, "bow" ) )
+
+    def test_storeAndLookup(self):
+        self.assertEqual( self.cache.lookup( "nothing" ), None )
+        self.cache.store( "k1", self.detData, self.writeModel() )
+        detData, modelFile = self.cache.lookup( "k1" )
+        self.assertEqual( detData.type, cvac.DetectorDataType.FILE )
+        self.assertEqual( detData.file, self.detData.file )
+        self.assertEqual( self.readFile( modelFile ), self.readFile( "model.zip" ) )
+
+    def test_bytesEntry(self):
+        data = cvac.DetectorData( cvac.DetectorDataType.BYTES, b"\x00\xffmodel", None, None )
+        self.cache.store( "k1", data )
+        detData, modelFile = self.cache.lookup( "k1" )
+        self.assertEqual( detData.type, cvac.DetectorDataType.BYTES )
+        self.assertEqual( detData.data, b"\x00\xffmodel" )
+        self.assertEqual( modelFile, None )
+
+    #
+    # entries are plain JSON; anything else is a cache miss
+    #
+    def test_invalidEntries(self):
+        self.cache.store( "k1", self.detData, self.writeModel() )
+        entryFile = os.path.join( "cache", "k1", "entry" )
+        for content in ["cos\nsystem\n(S'true'\ntR.", "[1, 2]",
+                        '{"format": 2, "type": "__class__", "data": null,'
+                        ' "file": null, "model": null}',
+                        '{"format": 2, "type": "FILE", "data": null,'
+                        ' "file": null, "model": "../../model.zip"}']:
+            fout = open( entryFile, 'w' )
+            fout.write( content )
+            fout.close()
+            self.assertEqual( self.cache.lookup( "k1" ), None )
+
+    #
+    # the least recently used entries go first
+    #
+    def test_evict(self):
+        self.cache.maxBytes = 3500
+        for key in ["k1", "k2", "k3"]:
+            self.cache.store( key, self.detData, self.writeModel() )
+        # make k1 the oldest, then use it so that k2 is
+        os.utime( os.path.join( "cache", "k1", "entry" ), (1000, 1000) )
+        os.utime( os.path.join( "cache", "k2", "entry" ), (2000, 2000) )
+        self.cache.lookup( "k1" )
+        self.cache.store( "k4", self.detData, self.writeModel() )
+        self.assertEqual( sorted( [key for use, size, key in self.cache.getEntries()] ),
+                          ["k1", "k3", "k4"] )
+        self.cache.maxEntries = 1
+        self.cache.evict()
+        self.assertEqual( len( self.cache.getEntries() ), 1 )
+
+    #
+    # a repeated train call does not run the trainer again
+    #
+    def test_train(self):
+        servant = localservices.LocalDetectorTrainerI()
+        trainer = localservices.serveToEasy( self.serverIC, servant, cvac.DetectorTrainerPrx )
+        first = easy.train( trainer, self.runset, cache=self.cache )
+        second = easy.train( trainer, self.runset, cache=self.cache )
+        self.assertEqual( servant.processCalls, 1 )
+        self.assertEqual( first.file, second.file )
+
+    def tearDown(self):
+        # Clean up
+        os.chdir( self.cwd )
+        shutil.rmtree( self.workDir, ignore_errors=True )
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()
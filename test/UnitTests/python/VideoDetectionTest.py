@@ -0,0 +1,106 @@
+from __future__ import print_function
+# test easy.splitVideo and easy.detectVideo against in-process stand-in
+# detectors; this does not need any CVAC services to be running
+import sys, traceback
+import time
+import unittest
+import paths
+import Ice
+import cvac
+import easy
+import localservices
+
+class VideoDetectionTest(unittest.TestCase):
+
+    serverIC = None
+
+    def setUp(self):
+        self.serverIC = Ice.initialize(sys.argv)
+        self.detectorData = cvac.DetectorData( cvac.DetectorDataType.BYTES, [], None, None )
+        self.videos = [easy.getLabelable( cvac.FilePath( cvac.DirectoryPath( "local" ),
+                                                         "video{0}.avi".format( idx ) ) )
+                       for idx in range( 2 )]
+
+    def serve(self, servant):
+        return localservices.serveToEasy( self.serverIC, servant, cvac.DetectorPrx )
+
+    #
+    # segments cover the video without gaps, and overlap if asked to
+    #
+    def test_splitVideo(self):
+        length = cvac.VideoSeekTime( 10000, 250 )
+        segments = easy.splitVideo( self.videos[0], length, numSegments=4 )
+        self.assertEqual( [(seg.start.framecnt, seg.last.framecnt) for seg in segments],
+                          [(0, 62), (63, 125), (126, 188), (189, 249)] )
+        self.assertEqual( segments[1].start.time, 2520 )
+        segments = easy.splitVideo( self.videos[0], length, segmentLength=100, overlap=10 )
+        self.assertEqual( [(seg.start.framecnt, seg.last.framecnt) for seg in segments],
+                          [(0, 99), (90, 189), (180, 249)] )
+        # without a frame count, the split is by time
+        segments = easy.splitVideo( self.videos[0], cvac.VideoSeekTime( 1000, -1 ),
+                                    numSegments=2 )
+        self.assertEqual( [(seg.start.time, seg.last.time) for seg in segments],
+                          [(0, 499), (500, 999)] )
+        self.assertRaises( RuntimeError, easy.splitVideo, self.videos[0],
+                           cvac.VideoSeekTime( -1, -1 ), 2 )
+
+    #
+    # the pieces of a detection that crossed segment boundaries are
+    # stitched back together, other detections stay separate
+    #
+    def test_stitchVideoSegments(self):
+        sub = self.videos[0].sub
+        def found( name, start, last ):
+            label = cvac.Label( True, name, {}, cvac.Semantics() )
+            return cvac.LabeledVideoSegment( 0.5, label, sub, cvac.VideoSeekTime( -1, start ),
+                                             cvac.VideoSeekTime( -1, last ), None, None, None )
+        stitched = easy.stitchVideoSegments( [found( "a", 50, 99 ), found( "a", 0, 49 ),
+                                              found( "b", 40, 60 ), found( "a", 120, 130 )] )
+        self.assertEqual( [(seg.lab.name, seg.start.framecnt, seg.last.framecnt)
+                           for seg in stitched],
+                          [("a", 0, 99), ("b", 40, 60), ("a", 120, 130)] )
+
+    #
+    # the segments of all videos are spread over the detectors, which
+    # work on them concurrently, and each video gets one result with
+    # one detection per class
+    #
+    def test_detectVideo(self):
+        latency = 0.05
+        servants = [localservices.LocalDetectorI( latency=latency, foundPerResult=2 )
+                    for idx in range( 3 )]
+        lengths = {}
+        for video in self.videos:
+            lengths[easy.getSubstrateKey( video.sub )] = cvac.VideoSeekTime( 12000, 300 )
+        detectors = [self.serve( servant ) for servant in servants]
+        start = time.time()
+        res = easy.detectVideo( detectors, self.detectorData, self.videos,
+                                videoLengths=lengths, segmentLength=50 )
+        elapsed = time.time()-start
+        self.assertEqual( res['failed'], [] )
+        self.assertEqual( sum( [servant.processCalls for servant in servants] ), 12 )
+        # every detector got segments, and one at a time the 12 segments
+        # would take two latencies each, plus one to initialize
+        self.assertTrue( min( [servant.processCalls for servant in servants] )>0 )
+        serial = (12*2+1)*latency
+        self.assertTrue( elapsed<serial*2/3,
+                         "{0:.3f}s is not concurrent, {1:.3f}s one at a time".format(
+                             elapsed, serial ) )
+        self.assertEqual( [result.original for result in res['results']], self.videos )
+        for result in res['results']:
+            self.assertEqual( sorted( [(seg.lab.name, seg.start.framecnt, seg.last.framecnt)
+                                       for seg in result.foundLabels] ),
+                              [("0", 0, 299), ("1", 0, 299)] )
+        self.assertRaises( RuntimeError, easy.detectVideo, [], self.detectorData,
+                           self.videos )
+
+    def tearDown(self):
+        # Clean up
+        if self.serverIC:
+            try:
+                self.serverIC.destroy()
+            except:
+                traceback.print_exc()
+
+if __name__ == '__main__':
+    unittest.main()